@@ -0,0 +1,58 @@
+""" Бенчмарк параллельного извлечения текста: масштабирование по числу процессов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_extraction --files 120 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import generate_corpus
+from src.text_extration import TextExtraction
+
+
+def run(folder, workers_list, batch_size) -> list:
+    rows = []
+    baseline = None
+    for workers in workers_list:
+        extractor = TextExtraction(folder)
+        extractor.get_paths(folder)
+        start = time.perf_counter()
+        total_chars = sum(len(text) for _, text in extractor.iter_texts(workers=workers, batch_size=batch_size))
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        rows.append({
+            'workers': workers,
+            'files': len(extractor.full_paths),
+            'seconds': round(elapsed, 3),
+            'files_per_second': round(len(extractor.full_paths) / elapsed, 1),
+            'chars': total_chars,
+            'speedup': round(baseline / elapsed, 2),
+            'errors': len(extractor.errors),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', help='папка с документами (по умолчанию генерируется синтетический корпус)')
+    parser.add_argument('--files', type=int, default=120)
+    parser.add_argument('--sentences', type=int, default=300)
+    parser.add_argument('--kinds', nargs='+', default=['pdf', 'docx'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--batch-size', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if folder is None:
+            folder = tmp
+            generate_corpus(folder, args.files, args.sentences, tuple(args.kinds))
+        print(f'cpu_count={os.cpu_count()}')
+        for row in run(folder, sorted(set(args.workers)), args.batch_size):
+            print('  '.join(f'{key}={value}' for key, value in row.items()))
+
+
+if __name__ == '__main__':
+    main()
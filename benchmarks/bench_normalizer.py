@@ -0,0 +1,68 @@
+""" Микробенчмарк нормализации текста: старая функция lemmatization_and_punct_clean
+(новые стеммер и лемматизатор на каждый вызов) против долгоживущего TextNormalizer.
+Требует данные nltk: punkt_tab и wordnet.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_normalizer --chunks 2000
+"""
+import argparse
+import random
+import re
+import time
+
+from nltk import word_tokenize, SnowballStemmer
+from nltk.stem import WordNetLemmatizer
+
+from benchmarks.corpus import make_sentences, EN_WORDS, RU_WORDS
+from src.text_normalizer import TextNormalizer
+
+
+def legacy_lemmatization_and_punct_clean(text):
+    """ Копия исходной реализации TextExtraction.lemmatization_and_punct_clean """
+    en_lemmatizer = WordNetLemmatizer()
+    ru_stemmer = SnowballStemmer("russian")
+    lemmatized_words = []
+    tokens = word_tokenize(text)
+    for token in tokens:
+        if re.search(r'[а-яёА-ЯЁ]', token):
+            lemmatized_words.append(ru_stemmer.stem(token))
+        else:
+            lemmatized_words.append(en_lemmatizer.lemmatize(token))
+    lemmed = ' '.join(lemmatized_words)
+    text = re.sub(r'[^\w\s]', '', lemmed)
+    return text
+
+
+def make_chunks(count, seed=0) -> list:
+    rng = random.Random(seed)
+    return [' '.join(make_sentences(rng, 4, RU_WORDS + EN_WORDS)) for _ in range(count)]
+
+
+def timed(function, chunks):
+    start = time.perf_counter()
+    result = function(chunks)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=2000)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    normalizer = TextNormalizer()
+    legacy, legacy_seconds = timed(lambda texts: [legacy_lemmatization_and_punct_clean(t) for t in texts], chunks)
+    fast, fast_seconds = timed(normalizer.normalize_many, chunks)
+    warm, warm_seconds = timed(normalizer.normalize_many, chunks)
+
+    assert legacy == fast == warm, 'результаты нормализации различаются'
+    print(f'chunks={len(chunks)} identical_output=True')
+    print(f'legacy      {legacy_seconds:.3f}s  {len(chunks) / legacy_seconds:.0f} chunks/s')
+    print(f'normalizer  {fast_seconds:.3f}s  {len(chunks) / fast_seconds:.0f} chunks/s  '
+          f'speedup={legacy_seconds / fast_seconds:.1f}x')
+    print(f'warm cache  {warm_seconds:.3f}s  {len(chunks) / warm_seconds:.0f} chunks/s  '
+          f'speedup={legacy_seconds / warm_seconds:.1f}x  {normalizer.cache_info()}')
+
+
+if __name__ == '__main__':
+    main()
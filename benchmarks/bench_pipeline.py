@@ -0,0 +1,127 @@
+""" Сквозной бенчмарк конвейера поиска по этапам: обход папки, извлечение текста, разбиение на чанки,
+нормализация, эмбеддинг (детерминированная заглушка, без загрузки модели), upsert в ChromaDB и запросы.
+Для каждого этапа считаются p50/p95 задержки одной операции и пропускная способность;
+результаты пишутся в JSON, который можно сравнить с прогоном на другом коммите (benchmarks.compare).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_pipeline --files 60 --output results.json
+"""
+import argparse
+import random
+import tempfile
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus, make_sentences, EN_WORDS, RU_WORDS
+from benchmarks.measure import StageTimer, environment, write_results
+from benchmarks.stub_embedding import HashEmbeddingFunction
+from src.chunk_processing import iter_chunks
+from src.text_extration import TextExtraction, read_segments
+
+STAGES = (('walk', 'files'), ('extraction', 'files'), ('chunking', 'chunks'), ('normalization', 'chunks'),
+          ('embedding', 'chunks'), ('upsert', 'chunks'), ('query', 'queries'))
+
+
+def make_normalizer():
+    """ TextNormalizer, если доступны данные nltk, иначе приведение к нижнему регистру """
+    from src.text_normalizer import normalizer
+    try:
+        normalizer.normalize('Проверка check.')
+        return normalizer.normalize, 'nltk'
+    except LookupError:
+        return str.lower, 'lower (nltk data not found)'
+
+
+def run(folder, storage, chunk_length=400, batch=256, queries=100, walk_repeat=5, dim=768, seed=0) -> dict:
+    timers = {name: StageTimer(name, unit) for name, unit in STAGES}
+
+    extractor = TextExtraction(folder)
+    for _ in range(walk_repeat):
+        extractor.full_paths = []
+        with timers['walk'].measure(0):
+            extractor.get_paths(folder)
+        timers['walk'].items += len(extractor.full_paths)
+    paths = sorted(extractor.full_paths)
+
+    documents = []
+    for path in paths:
+        with timers['extraction'].measure():
+            segments = list(read_segments(path))
+        documents.append((path, segments))
+
+    chunks = []
+    for path, segments in documents:
+        with timers['chunking'].measure(0):
+            document_chunks = [(chunk, span) for chunk, span in iter_chunks(segments, chunk_length)]
+        timers['chunking'].items += len(document_chunks)
+        relative = path.relative_to(folder).as_posix()
+        chunks += [(f'{relative}#{i}', relative, chunk) for i, (chunk, _) in enumerate(document_chunks)]
+
+    normalize, normalizer_name = make_normalizer()
+    normalized = []
+    for i in range(0, len(chunks), batch):
+        texts = [chunk for _, _, chunk in chunks[i:i + batch]]
+        with timers['normalization'].measure(len(texts)):
+            normalized += [normalize(text) for text in texts]
+
+    embedding_function = HashEmbeddingFunction(dim)
+    embeddings = []
+    for i in range(0, len(normalized), batch):
+        with timers['embedding'].measure(len(normalized[i:i + batch])):
+            embeddings += embedding_function(normalized[i:i + batch])
+
+    import chromadb
+    client = chromadb.PersistentClient(path=str(storage))
+    collection = client.get_or_create_collection('benchmark', embedding_function=embedding_function,
+                                                 metadata={'hnsw:space': 'cosine'})
+    for i in range(0, len(chunks), batch):
+        part = chunks[i:i + batch]
+        with timers['upsert'].measure(len(part)):
+            collection.upsert(ids=[chunk_id for chunk_id, _, _ in part],
+                              documents=normalized[i:i + batch],
+                              metadatas=[{'path': path} for _, path, _ in part],
+                              embeddings=embeddings[i:i + batch])
+
+    rng = random.Random(seed)
+    query_texts = [normalize(sentence) for sentence in make_sentences(rng, queries, RU_WORDS + EN_WORDS)]
+    for query in query_texts:
+        with timers['query'].measure():
+            collection.query(query_embeddings=embedding_function([query]), n_results=min(50, len(chunks)) or 1)
+
+    return {
+        'environment': environment(),
+        'parameters': {'files': len(paths), 'chunks': len(chunks), 'chunk_length': chunk_length, 'batch': batch,
+                       'queries': queries, 'embedding_dim': dim, 'normalizer': normalizer_name},
+        'stages': {name: timer.summary() for name, timer in timers.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', help='папка с документами (по умолчанию генерируется синтетический корпус)')
+    parser.add_argument('--files', type=int, default=60)
+    parser.add_argument('--sentences', type=int, default=200)
+    parser.add_argument('--kinds', nargs='+', default=['txt', 'docx', 'pdf'])
+    parser.add_argument('--languages', nargs='+', default=['ru', 'en'])
+    parser.add_argument('--chunk-length', type=int, default=400)
+    parser.add_argument('--batch', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--output', help='путь до JSON с результатами')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(args.folder) if args.folder else Path(tmp) / 'corpus'
+        if args.folder is None:
+            generate_corpus(folder, args.files, args.sentences, tuple(args.kinds), languages=tuple(args.languages))
+        results = run(folder, Path(tmp) / 'storage', args.chunk_length, args.batch, args.queries, dim=args.dim)
+
+    print('  '.join(f'{key}={value}' for key, value in results['parameters'].items()))
+    for name, summary in results['stages'].items():
+        print(f'{name:<14} p50={summary["p50_ms"]:>9.3f}ms  p95={summary["p95_ms"]:>9.3f}ms  '
+              f'{summary["throughput_per_second"]:>10.1f} {summary["unit"]}/s')
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
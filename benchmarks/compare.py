@@ -0,0 +1,43 @@
+""" Сравнение двух JSON-результатов benchmarks.bench_pipeline (например, до и после изменения).
+
+Запуск из корня репозитория:
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+
+
+def compare(baseline: dict, candidate: dict) -> list:
+    """ Строки сравнения по общим этапам: отношение p50/p95 и пропускной способности (кандидат / база) """
+    rows = []
+    for name, base in baseline['stages'].items():
+        new = candidate['stages'].get(name)
+        if new is None:
+            continue
+        rows.append({
+            'stage': name,
+            'p50_ratio': round(new['p50_ms'] / base['p50_ms'], 3) if base['p50_ms'] else None,
+            'p95_ratio': round(new['p95_ms'] / base['p95_ms'], 3) if base['p95_ms'] else None,
+            'throughput_ratio': (round(new['throughput_per_second'] / base['throughput_per_second'], 3)
+                                 if base['throughput_per_second'] else None),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(args.candidate, encoding='utf-8') as file:
+        candidate = json.load(file)
+    print(f'{baseline["environment"]["revision"]} -> {candidate["environment"]["revision"]}')
+    for row in compare(baseline, candidate):
+        print('  '.join(f'{key}={value}' for key, value in row.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+""" Генератор синтетического корпуса документов для бенчмарков """
+import random
+from pathlib import Path
+
+import docx
+
+EN_WORDS = ('cat', 'dog', 'house', 'garden', 'river', 'book', 'window', 'city', 'friend', 'morning',
+            'quiet', 'green', 'quickly', 'reads', 'runs', 'sleeps', 'finds', 'old', 'small', 'bright')
+RU_WORDS = ('кошка', 'кошки', 'кошками', 'собака', 'собаки', 'дом', 'дома', 'домами', 'бежит', 'бегущая',
+            'книга', 'книгами', 'читает', 'город', 'городах', 'друг', 'друзья', 'утром', 'тихо', 'зелёный')
+LANGUAGE_WORDS = {'en': EN_WORDS, 'ru': RU_WORDS}
+
+
+def make_sentences(rng: random.Random, count: int, words=EN_WORDS) -> list:
+    sentences = []
+    for _ in range(count):
+        sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(5, 14)))
+        sentences.append(sentence.capitalize() + rng.choice('..?!'))
+    return sentences
+
+
+def write_txt(path: Path, sentences: list) -> None:
+    path.write_text(' '.join(sentences), encoding='utf-8')
+
+
+def write_docx(path: Path, sentences: list, paragraph_size=5) -> None:
+    document = docx.Document()
+    for i in range(0, len(sentences), paragraph_size):
+        document.add_paragraph(' '.join(sentences[i:i + paragraph_size]))
+    document.save(path)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: Path, sentences: list, lines_per_page=40) -> None:
+    """ Минимальный PDF со стандартным шрифтом Helvetica (только латиница) """
+    pages = [sentences[i:i + lines_per_page] for i in range(0, len(sentences), lines_per_page)] or [[]]
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for page in pages:
+        lines = ['BT /F1 9 Tf 11 TL 40 800 Td']
+        lines += [f'({_pdf_escape(line)}) Tj T*' for line in page]
+        lines.append('ET')
+        stream = '\n'.join(lines).encode('latin-1')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n'.encode('latin-1') + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>')
+        page_ids.append(len(objects))
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(f"{i} 0 R" for i in page_ids)}] /Count {len(page_ids)} >>'
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        body = body if isinstance(body, bytes) else body.encode('latin-1')
+        output += f'{number} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n'
+    xref = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    output += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode('latin-1')
+    output += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    path.write_bytes(bytes(output))
+
+
+WRITERS = {'txt': write_txt, 'docx': write_docx, 'pdf': write_pdf}
+
+
+def generate_corpus(folder, files=100, sentences_per_file=200, kinds=('txt', 'docx', 'pdf'), seed=0,
+                    files_per_folder=50, languages=('en',)) -> list:
+    """ Создать в folder files документов указанных типов, разложив их по подпапкам
+    args:
+        languages: языки документов по очереди; PDF всегда английские (шрифт Helvetica без кириллицы)
+    returns:
+        paths(list): пути созданных файлов
+    """
+    rng = random.Random(seed)
+    folder = Path(folder)
+    paths = []
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        subfolder = folder / f'part{i // files_per_folder:03d}'
+        subfolder.mkdir(parents=True, exist_ok=True)
+        path = subfolder / f'doc{i:05d}.{kind}'
+        language = 'en' if kind == 'pdf' else languages[i % len(languages)]
+        WRITERS[kind](path, make_sentences(rng, sentences_per_file, LANGUAGE_WORDS[language]))
+        paths.append(path)
+    return paths
@@ -0,0 +1,64 @@
+""" Сбор задержек и сводная статистика для бенчмарков """
+import json
+import platform
+import subprocess
+import time
+from contextlib import contextmanager
+
+
+def percentile(values, q) -> float:
+    """ Процентиль q (0..100) с линейной интерполяцией, как numpy.percentile по умолчанию """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class StageTimer:
+    """ Задержки отдельных операций одного этапа и число обработанных единиц (файлов, чанков, запросов) """
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.samples = []
+        self.items = 0
+
+    @contextmanager
+    def measure(self, items=1):
+        start = time.perf_counter()
+        yield
+        self.samples.append(time.perf_counter() - start)
+        self.items += items
+
+    def summary(self) -> dict:
+        total = sum(self.samples)
+        return {
+            'unit': self.unit,
+            'operations': len(self.samples),
+            'items': self.items,
+            'total_seconds': round(total, 6),
+            'p50_ms': round(percentile(self.samples, 50) * 1000, 3),
+            'p95_ms': round(percentile(self.samples, 95) * 1000, 3),
+            'throughput_per_second': round(self.items / total, 2) if total else 0.0,
+        }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def environment() -> dict:
+    return {'revision': git_revision(), 'python': platform.python_version(), 'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def write_results(path, results) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
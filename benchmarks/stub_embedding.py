@@ -0,0 +1,35 @@
+""" Детерминированная офлайн-замена модели эмбеддингов для бенчмарков """
+import hashlib
+
+import numpy as np
+from chromadb import EmbeddingFunction
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """ Мешок хэшированных токенов фиксированной размерности: одинаковый текст - одинаковый вектор,
+    похожие тексты - близкие векторы. Стоимость линейна по длине текста, модель не загружается.
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for token in str(text).lower().split():
+                digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+                vectors[row, int.from_bytes(digest, 'little') % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        return list(vectors)
+
+    @staticmethod
+    def name():
+        return 'benchmark_hash_embedding'
+
+    def get_config(self):
+        return {'dim': self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbeddingFunction(config.get('dim', 768))
@@ -0,0 +1,120 @@
+""" Пакетный поиск без интерфейса: папка индексируется один раз, затем по ней выполняются все запросы
+из JSONL-файла. Эмбеддинги запросов считаются пачками, результаты пишутся в JSONL.
+
+Каждая строка входного файла - JSON-объект с текстом запроса в поле --field (по умолчанию "query")
+и необязательным идентификатором в поле --id-field (по умолчанию "id") либо просто JSON-строка.
+
+Запуск из корня репозитория:
+    python -m src.batch_search documents queries.jsonl --output results.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from src.document_search import RelevantDocumentsSearch, RETRIEVAL_MODES
+from src.text_extration import TextExtraction
+
+
+def read_queries(path, field='query', id_field='id') -> list:
+    """ Прочитать запросы из JSONL
+    returns:
+        queries(list): список пар (идентификатор, текст запроса); без идентификатора - номер строки
+    """
+    queries = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                queries.append((line_number, record))
+            else:
+                queries.append((record.get(id_field, line_number), record[field]))
+    return queries
+
+
+def run_batch(folder, queries, output, results_count=5, chunk_length=400, retrieval='dense', batch_size=64,
+              extraction_workers=None) -> dict:
+    """ Проиндексировать папку и выполнить по ней все запросы
+    args:
+        folder: папка с документами
+        queries: список пар (идентификатор, текст запроса)
+        output: открытый на запись текстовый файл для JSONL-результатов
+        batch_size: сколько запросов эмбеддится одним вызовом модели
+    returns:
+        summary(dict): число запросов, время индексации и поиска, запросов в секунду
+    """
+    search = RelevantDocumentsSearch(folder, '', chunk_length=chunk_length, results_count=results_count,
+                                     shared_collection=True, retrieval=retrieval,
+                                     extraction_workers=extraction_workers)
+    start = time.perf_counter()
+    extractor = search.create_extractor()
+    extractor.get_paths(search.current_folder_path)
+    collection, inverted_index, current_paths, _ = search.refresh_shared_index(extractor)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        for i in range(0, len(queries), batch_size):
+            batch = queries[i:i + batch_size]
+            lemmatized = [TextExtraction.lemmatization_and_punct_clean(text) for _, text in batch]
+            embeddings = search.embedding_function(lemmatized) if current_paths else [None] * len(batch)
+            for (query_id, text), query_embedding in zip(batch, embeddings):
+                query_start = time.perf_counter()
+                distances = {}
+                if current_paths:
+                    distances = search.query_shared_collection(collection, inverted_index, current_paths.keys(),
+                                                               query_embedding, request=text)
+                ranking = sorted(distances.items(), key=lambda item: item[1])[:results_count]
+                output.write(json.dumps({
+                    'id': query_id,
+                    'query': text,
+                    'results': [{'path': path, 'distance': float(distance)} for path, distance in ranking],
+                    'seconds': round(time.perf_counter() - query_start, 6),
+                }, ensure_ascii=False) + '\n')
+    finally:
+        inverted_index.close()
+    search_seconds = time.perf_counter() - start
+
+    return {
+        'queries': len(queries),
+        'documents': len(current_paths),
+        'index_seconds': round(index_seconds, 3),
+        'search_seconds': round(search_seconds, 3),
+        'queries_per_second': round(len(queries) / search_seconds, 2) if search_seconds else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='папка с документами')
+    parser.add_argument('queries', help='JSONL-файл с запросами')
+    parser.add_argument('--output', help='JSONL-файл для результатов (по умолчанию stdout)')
+    parser.add_argument('--field', default='query', help='поле с текстом запроса')
+    parser.add_argument('--id-field', default='id', help='поле с идентификатором запроса')
+    parser.add_argument('--results', type=int, default=5, help='сколько документов вернуть на запрос')
+    parser.add_argument('--chunk-length', type=int, default=400)
+    parser.add_argument('--retrieval', choices=RETRIEVAL_MODES, default='dense')
+    parser.add_argument('--batch-size', type=int, default=64, help='запросов в одной пачке эмбеддинга')
+    parser.add_argument('--workers', type=int, help='процессов для извлечения текста')
+    args = parser.parse_args(argv)
+
+    folder = Path(args.folder)
+    if not folder.is_dir():
+        parser.error(f'folder not found: {folder}')
+    queries = read_queries(args.queries, args.field, args.id_field)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            summary = run_batch(folder, queries, output, args.results, args.chunk_length, args.retrieval,
+                                args.batch_size, args.workers)
+    else:
+        summary = run_batch(folder, queries, sys.stdout, args.results, args.chunk_length, args.retrieval,
+                            args.batch_size, args.workers)
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,22 @@
+from collections import deque
+from typing import NamedTuple, Optional
 from src.text_extration import TextExtraction
+import numpy as np
 import re
 
 
-def find_best_chunk(collection, request):
+def query_arguments(request, query_embedding=None) -> dict:
+    """ Аргументы collection.query: готовый эмбеддинг запроса, если он уже посчитан,
+    иначе лемматизированный текст запроса """
+    if query_embedding is not None:
+        return {'query_embeddings': [query_embedding]}
     request = TextExtraction.lemmatization_and_punct_clean(request)
+    return {'query_texts': [f'{request}']}
+
+
+def find_best_chunk(collection, request, query_embedding=None):
     results = collection.query(
-        query_texts=[f'{request}'],
+        **query_arguments(request, query_embedding),
         n_results=1
     )
     best_distance = results['distances'][0][0]
@@ -14,18 +25,268 @@ def find_best_chunk(collection, request):
     return best_chunk, best_distance
 
 
-def chunk_text_by_sentence(text: str, n: int):
-    sentences = re.split(r'(?<=[.?!])\s+', text)
-    chunks = []
-    current_chunk = ""
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) + 1 > n and current_chunk:
-            current_chunk += sentence + " "
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence + " "
+def find_best_documents(collection, request, results_count, n_results, allowed_paths=None, query_embedding=None):
+    """ Найти лучшие документы одним запросом к общей коллекции папки.
+    Чанки группируются по метаданным 'path', документу достаётся расстояние его лучшего чанка.
+    Если в top-N чанков попало меньше results_count документов, N удваивается.
+    returns:
+        distances(dict): словарь вида { 'путь': расстояние }
+    """
+    query = query_arguments(request, query_embedding)
+    total = collection.count()
+    n_results = min(n_results, total)
+    allowed = set(allowed_paths) if allowed_paths is not None else None
+    distances = {}
+    while n_results > 0:
+        results = collection.query(
+            **query,
+            n_results=n_results,
+            include=['metadatas', 'distances']
+        )
+        distances = {}
+        for metadata, distance in zip(results['metadatas'][0], results['distances'][0]):
+            path = metadata['path']
+            if allowed is not None and path not in allowed:
+                continue
+            if path not in distances or distance < distances[path]:
+                distances[path] = distance
+        if len(distances) >= results_count or n_results >= total:
+            break
+        n_results = min(n_results * 2, total)
+    return distances
+
+
+def collection_space(collection) -> str:
+    """ Метрика расстояния коллекции ChromaDB ('l2', 'cosine' или 'ip') """
+    configuration = getattr(collection, 'configuration', None) or {}
+    return (configuration.get('hnsw') or {}).get('space') or 'l2'
+
+
+def vector_distances(space, embeddings, query_embedding):
+    """ Расстояния от запроса до строк матрицы embeddings в тех же единицах, что возвращает ChromaDB """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    query_embedding = np.asarray(query_embedding, dtype=np.float32)
+    if space == 'cosine':
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+        return 1.0 - embeddings @ query_embedding / np.where(norms == 0, 1.0, norms)
+    if space == 'ip':
+        return 1.0 - embeddings @ query_embedding
+    difference = embeddings - query_embedding
+    return np.einsum('ij,ij->i', difference, difference)
+
+
+def min_max(scores):
+    """ Оценки, линейно приведённые к 0..1 (все равные оценки - единицы) """
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+
+def rerank_candidates(collection, candidates, query_embedding, hybrid_alpha=None) -> dict:
+    """ Переранжировать кандидатов первого этапа (BM25) по расстоянию эмбеддингов.
+    args:
+        collection: общая коллекция папки
+        candidates: список (id чанка, путь, bm25 score)
+        query_embedding: эмбеддинг запроса
+        hybrid_alpha: None - только плотное расстояние; иначе вес BM25 в линейном смешивании
+            оценок BM25 и близости, каждая из которых min-max нормирована к 0..1 по кандидатам;
+            итоговое "расстояние" равно 1 - смешанная оценка
+    returns:
+        distances(dict): словарь вида { 'путь': расстояние лучшего чанка }
+    """
+    stored = collection.get(ids=[chunk_id for chunk_id, _, _ in candidates], include=['embeddings'])
+    embeddings = dict(zip(stored['ids'], stored['embeddings']))
+    candidates = [candidate for candidate in candidates if candidate[0] in embeddings]
+    if not candidates:
+        return {}
+    distances = vector_distances(collection_space(collection),
+                                 [embeddings[chunk_id] for chunk_id, _, _ in candidates], query_embedding)
+    if hybrid_alpha is not None:
+        bm25 = min_max(np.array([score for _, _, score in candidates], dtype=np.float32))
+        dense = min_max(-np.asarray(distances, dtype=np.float32))
+        distances = 1.0 - (hybrid_alpha * bm25 + (1.0 - hybrid_alpha) * dense)
+    best = {}
+    for (_, path, _), distance in zip(candidates, distances.tolist()):
+        if path not in best or distance < best[path]:
+            best[path] = distance
+    return best
+
+
+SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.?!])\s+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class ChunkSpan(NamedTuple):
+    """ Чанк как диапазон склеенного текста страниц, без копии самого текста """
+    start: int  # смещение первого символа чанка
+    end: int  # смещение после последнего символа чанка
+    sentences: int  # число предложений (или частей слишком длинных предложений)
+    first_page: Optional[int]
+    last_page: Optional[int]
+
+
+def iter_sentence_spans(pages, max_length: Optional[int] = None):
+    """ Разбить поток страниц на предложения, не собирая весь текст в одну строку.
+    Предложение, начатое на одной странице, может закончиться на следующей. Результат совпадает
+    с разбиением склеенного текста всех страниц, каждый символ просматривается регулярным выражением один раз.
+    args:
+        pages: итерируемое из пар (номер страницы или None, текст страницы)
+        max_length: незаконченное предложение длиннее max_length отдаётся частями, как в split_long_sentence,
+            не дожидаясь его конца (логи без знаков препинания не копятся в памяти); None - без ограничения
+    returns:
+        генератор кортежей (начало, конец, номер страницы, на которой начинается предложение, предложение)
+    """
+    carry = ''
+    carry_offset = 0  # смещение начала carry в склеенном тексте
+    carry_page = page = None
+    scan_from = 0  # до этой позиции carry уже просмотрен и границ предложений в нём нет
+    for page, text in pages:
+        if not carry:
+            carry_page = page
+        buffer = carry + text
+        start = 0
+        scan_from_next = None
+        for match in SENTENCE_BOUNDARY_RE.finditer(buffer, scan_from):
+            if match.end() == len(buffer):
+                # пробелы в конце страницы могут продолжиться на следующей
+                scan_from_next = match.start()
+                break
+            yield (carry_offset + start, carry_offset + match.start(),
+                   carry_page if start < len(carry) else page, buffer[start:match.start()])
+            start = match.end()
+        if start >= len(carry):
+            carry_page = page
+        page_start = len(carry) - start  # начало текущей страницы в новом carry
+        carry = buffer[start:]
+        carry_offset += start
+        scan_from = len(carry) if scan_from_next is None else scan_from_next - start
+        # в просмотренной части carry границ предложений нет: её можно резать так же, как split_long_sentence
+        while max_length is not None and scan_from > max_length:
+            lead = WHITESPACE_RE.match(carry, 0, scan_from)
+            if lead:
+                # пробелы в начале текста: iter_chunks всё равно отрезает их от предложения
+                if lead.end() >= page_start:
+                    carry_page = page
+                carry = carry[lead.end():]
+                carry_offset += lead.end()
+                page_start -= lead.end()
+                scan_from -= lead.end()
+                continue
+            known = scan_from
+            while known > 0 and carry[known - 1].isspace():
+                known -= 1
+            if known <= max_length:
+                break
+            cut = carry.rfind(' ', 1, max_length + 1)
+            if cut == -1:
+                cut = max_length
+            yield carry_offset, carry_offset + cut, carry_page, carry[:cut]
+            match = WHITESPACE_RE.match(carry, cut)
+            skip = match.end() if match else cut
+            if skip >= page_start:
+                carry_page = page
+            carry = carry[skip:]
+            carry_offset += skip
+            page_start -= skip
+            scan_from = max(scan_from - skip, 0)
+    start = 0
+    for match in SENTENCE_BOUNDARY_RE.finditer(carry):
+        yield carry_offset + start, carry_offset + match.start(), carry_page if start == 0 else page, carry[start:match.start()]
+        start = match.end()
+    yield carry_offset + start, carry_offset + len(carry), carry_page if start == 0 else page, carry[start:]
+
+
+def split_long_sentence(start, sentence, max_length):
+    """ Разрезать слишком длинное предложение на части не длиннее max_length, по возможности по пробелам
+    returns:
+        генератор пар (смещение части, часть)
+    """
+    offset = 0
+    while len(sentence) - offset > max_length:
+        cut = sentence.rfind(' ', offset + 1, offset + max_length + 1)
+        if cut == -1:
+            cut = offset + max_length
+        yield start + offset, sentence[offset:cut].rstrip()
+        offset = cut
+        match = WHITESPACE_RE.match(sentence, offset)
+        if match:
+            offset = match.end()
+    yield start + offset, sentence[offset:]
+
+
+def iter_chunks(pages, n: int, overlap: int = 0, max_length: Optional[int] = None):
+    """ Потоковое разбиение страниц на чанки по предложениям длиной около n символов за линейное время
+    args:
+        pages: итерируемое из пар (номер страницы или None, текст страницы)
+        n: желаемая длина чанка; предложение, с которым чанк превысил бы n, начинает следующий чанк
+        overlap: сколько символов целых последних предложений чанка повторяется в начале следующего
+        max_length: предложения длиннее max_length режутся на части (None - без ограничения)
+    returns:
+        генератор пар (текст чанка - предложения через пробел, ChunkSpan)
+    """
+    current = deque()  # (начало, конец, страница, предложение) предложений текущего чанка
+    length = 0  # длина текста текущего чанка с пробелами между предложениями
+
+    def emit():
+        return ' '.join(sentence for *_, sentence in current), \
+            ChunkSpan(current[0][0], current[-1][1], len(current), current[0][2], current[-1][2])
+
+    emitted = False
+    page = None
+    for start, end, page, sentence in iter_sentence_spans(pages, max_length):
+        stripped = sentence.strip()
+        if not stripped:
+            continue
+        start += len(sentence) - len(sentence.lstrip())
+        end = start + len(stripped)
+        sentence = stripped
+        if max_length is not None and len(sentence) > max_length:
+            pieces = [(piece_start, piece_start + len(piece), page, piece)
+                      for piece_start, piece in split_long_sentence(start, sentence, max_length)]
         else:
-            current_chunk += sentence + " "
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+            pieces = [(start, end, page, sentence)]
+        for piece in pieces:
+            if current and length + 1 + len(piece[3]) > n:
+                yield emit()
+                emitted = True
+                # в следующий чанк переносятся последние предложения, уместившиеся в overlap, но не все
+                kept = 0
+                kept_length = -1
+                for sentence_span in reversed(current):
+                    if kept + 1 == len(current) or kept_length + 1 + len(sentence_span[3]) > overlap:
+                        break
+                    kept += 1
+                    kept_length += 1 + len(sentence_span[3])
+                while len(current) > kept:
+                    length -= len(current.popleft()[3]) + 1
+                length = max(kept_length, 0)
+            length += len(piece[3]) + (1 if current else 0)
+            current.append(piece)
+    if current:
+        yield emit()
+    elif not emitted:
+        # текст без единого предложения даёт один пустой чанк, как и раньше
+        yield '', ChunkSpan(0, 0, 0, page, page)
+
+
+def iter_chunk_spans(pages, n: int, overlap: int = 0, max_length: Optional[int] = None):
+    """ То же, что iter_chunks, но только диапазоны чанков (ChunkSpan) """
+    for _, span in iter_chunks(pages, n, overlap, max_length):
+        yield span
+
+
+def chunk_pages_by_sentence(pages, n: int, overlap: int = 0, max_length: Optional[int] = None):
+    """ Потоковое разбиение страниц на чанки по предложениям длиной около n символов
+    args:
+        pages: итерируемое из пар (номер страницы или None, текст страницы)
+        n: желаемая длина чанка
+        overlap: перекрытие соседних чанков в символах (целыми предложениями)
+        max_length: максимальная длина предложения, более длинные режутся
+    returns:
+        генератор кортежей (чанк, первая страница, последняя страница)
+    """
+    for chunk, span in iter_chunks(pages, n, overlap, max_length):
+        yield chunk, span.first_page, span.last_page
+
 
-    return chunks
+def chunk_text_by_sentence(text: str, n: int, overlap: int = 0, max_length: Optional[int] = None):
+    return [chunk for chunk, _, _ in chunk_pages_by_sentence([(None, text)], n, overlap, max_length)]
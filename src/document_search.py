@@ -1,59 +1,755 @@
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
+import hashlib
 import re
-import chromadb
+import threading
+import time
 import os
 
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-
-from text_extration import TextExtraction
-from chunk_processing import find_best_chunk, chunk_text_by_sentence
+from src.file_walker import DEFAULT_MAX_FILE_BYTES
+from src.text_extration import TextExtraction, DEFAULT_MAX_PDF_PAGES, DEFAULT_MAX_PDF_BYTES
+from src.chunk_processing import find_best_chunk, find_best_documents, rerank_candidates, chunk_pages_by_sentence
+from src.index_manifest import IndexManifest
+from src.embedding_pipeline import EmbeddingBatcher
+from src.indexing_pipeline import IndexingPipeline, DEFAULT_MEMORY_BUDGET
+from src.inverted_index import InvertedIndex
+from src.flat_index import FlatVectorIndex
+from src.result_cache import ResultCache, folder_fingerprint
+from src.instrumentation import SearchMetrics, publish
+from src.resource_registry import (MODEL_NAME, default_storage_path, get_client, get_embedding_cache,
+                                   get_embedding_function)
 
 # import nltk
 # nltk.download('punkt_tab')
 # nltk.download('wordnet')
 
 
+RETRIEVAL_MODES = ('dense', 'bm25', 'hybrid')
+VECTOR_BACKENDS = ('chroma', 'flat')
+
+
+class SearchCancelled(Exception):
+    """ Поиск отменён через cancel_event (например, пользователь ввёл новый запрос) """
+
+
+def check_cancelled(cancel_event) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise SearchCancelled()
+
+
+class QueryEmbeddingCache:
+    """ LRU-кэш эмбеддингов последних запросов, общий для всех экземпляров поиска """
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+        value = compute()
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+
+
+query_embedding_cache = QueryEmbeddingCache()
+
+
+class StagedChanges:
+    """ Изменения коллекции и инвертированного индекса одного документа, накопленные без записи в хранилище.
+    apply выполняет их по порядку, поэтому блокировку записи достаточно держать только на это время """
+
+    def __init__(self):
+        self.operations = []  # (метод хранилища, args, kwargs)
+
+    def record(self, method, *args, **kwargs) -> None:
+        self.operations.append((method, args, kwargs))
+
+    def stage(self, target):
+        return StagedTarget(self, target)
+
+    def apply(self) -> None:
+        operations, self.operations = self.operations, []
+        for method, args, kwargs in operations:
+            method(*args, **kwargs)
+
+
+class StagedTarget:
+    """ Коллекция или инвертированный индекс, изменения которых откладываются в StagedChanges """
+
+    def __init__(self, changes: StagedChanges, target):
+        self.changes = changes
+        self.target = target
+        self.name = getattr(target, 'name', None)
+
+    def upsert(self, **kwargs) -> None:
+        self.changes.record(self.target.upsert, **kwargs)
+
+    def delete(self, **kwargs) -> None:
+        self.changes.record(self.target.delete, **kwargs)
+
+    def add_chunk(self, chunk_id, path, tokens) -> None:
+        self.changes.record(self.target.add_chunk, chunk_id, path, tokens)
+
+    def delete_path(self, path) -> None:
+        self.changes.record(self.target.delete_path, path)
+
+
 class RelevantDocumentsSearch:
-    def __init__(self, current_folder_path, request, chunk_length=400, results_count=5):
-        self.app_data_path = os.path.join(os.environ.get('LOCALAPPDATA', 'C:\\Temp'), 'ChromaDBDocStorage')
+    def __init__(self, current_folder_path, request, chunk_length=400, results_count=5,
+                 shared_collection=False, top_chunks=None, extraction_workers=None,
+                 batch_chunks=256, batch_chars=100_000,
+                 max_pdf_pages=DEFAULT_MAX_PDF_PAGES, max_pdf_bytes=DEFAULT_MAX_PDF_BYTES,
+                 retrieval='dense', candidate_budget=200, hybrid_alpha=0.5, result_cache: ResultCache = None,
+                 use_embedding_cache=True, chunk_overlap=0, max_sentence_length=None, metrics_hooks=None,
+                 vector_backend='chroma', flat_dtype='float32', exclude_patterns=None,
+                 max_file_bytes=DEFAULT_MAX_FILE_BYTES, pipeline=False, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 queue_size=8, normalizer_workers=1, embedder_workers=1):
+        self.app_data_path = default_storage_path()
         os.makedirs(self.app_data_path, exist_ok=True)
-        self.client = chromadb.PersistentClient(path=self.app_data_path)
+        self.manifest = IndexManifest(self.app_data_path)
+        # размер и mtime изменённых файлов до чтения: {относительный путь с '/': (размер, mtime)}
+        self.stale_stats = {}
         self.request = request
         self.current_folder_path = current_folder_path
         self.chunk_length = chunk_length
+        # перекрытие соседних чанков (в символах, целыми предложениями)
+        self.chunk_overlap = chunk_overlap
+        # предложения без знаков препинания длиннее этого порога режутся, чтобы не получить огромный чанк
+        self.max_sentence_length = max_sentence_length or chunk_length * 2
         self.results_count = results_count
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f'retrieval must be one of {RETRIEVAL_MODES}, got {retrieval!r}')
+        # 'bm25' и 'hybrid': кандидаты отбираются по инвертированному индексу, эмбеддинги только переранжируют их
+        self.retrieval = retrieval
+        self.candidate_budget = candidate_budget
+        self.hybrid_alpha = hybrid_alpha
+        if vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f'vector_backend must be one of {VECTOR_BACKENDS}, got {vector_backend!r}')
+        # 'flat' - векторы папки в одной memory-mapped матрице NumPy вместо коллекции ChromaDB
+        self.vector_backend = vector_backend
+        self.flat_dtype = flat_dtype
+        # режим одной общей коллекции на папку: один запрос top-N чанков вместо запроса на каждый документ
+        self.shared_collection = shared_collection or retrieval != 'dense' or vector_backend != 'chroma'
+        self.top_chunks = top_chunks or max(50, results_count * 10)
+        # число процессов для параллельного извлечения текста (None - последовательно)
+        self.extraction_workers = extraction_workers
+        # размеры пачек для общего эмбеддинга чанков из разных документов
+        self.batch_chunks = batch_chunks
+        self.batch_chars = batch_chars
+        self.embedding_stats = None
+        # многопоточный конвейер индексации: извлечение, нормализация, эмбеддинг и запись идут одновременно,
+        # а прочитанные, но ещё не записанные данные ограничены бюджетом memory_budget байт
+        self.pipeline = pipeline
+        self.memory_budget = memory_budget
+        self.queue_size = queue_size
+        self.normalizer_workers = normalizer_workers
+        self.embedder_workers = embedder_workers
+        # кэш готовых результатов (None - каждый поиск считается заново)
+        self.result_cache = result_cache
+        # эмбеддинги одинаковых чанков (копии файлов в разных папках) берутся из дискового кэша
+        self.use_embedding_cache = use_embedding_cache
+        self.max_pdf_pages = max_pdf_pages
+        self.max_pdf_bytes = max_pdf_bytes
+        # шаблоны исключения в стиле .gitignore и предельный размер индексируемого файла (кроме текстовых форматов)
+        self.exclude_patterns = list(exclude_patterns or [])
+        self.max_file_bytes = max_file_bytes
+        # подписчики hook(metrics), получающие метрики каждого запуска find_documents
+        self.metrics_hooks = list(metrics_hooks or [])
+        self.metrics = SearchMetrics(current_folder_path, request)
 
-        self.embedding_function = SentenceTransformerEmbeddingFunction('sergeyzh/LaBSE-ru-sts')
 
+    @property
+    def client(self):
+        # клиент и модель общие на процесс и создаются при первом обращении
+        return get_client(self.app_data_path)
 
-    def create_collection(self, text_chunks, relative_path):
+
+    @property
+    def embedding_function(self):
+        return get_embedding_function(MODEL_NAME)
+
+
+    @staticmethod
+    def collection_name(relative_path) -> str:
         parts = re.split(r'[/\\]', str(relative_path))
-        name_str = '.'.join(parts)
+        return '.'.join(parts)
+
+
+    def chunking_options(self):
+        """ Параметры разбиения, кроме длины чанка, если они отличаются от значений по умолчанию (иначе None).
+        Входят в отпечаток манифеста, имя общей коллекции и ключ кэша результатов """
+        if self.chunk_overlap == 0 and self.max_sentence_length == self.chunk_length * 2:
+            return None
+        return {'chunk_overlap': self.chunk_overlap, 'max_sentence_length': self.max_sentence_length}
+
+
+    def folder_collection_name(self) -> str:
+        folder = str(Path(self.current_folder_path).resolve())
+        name = f'folder_{hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]}_{self.chunk_length}'
+        if self.chunking_options() is not None:
+            name += f'_o{self.chunk_overlap}_s{self.max_sentence_length}'
+        return name
+
+
+    def inverted_index_path(self) -> str:
+        return os.path.join(self.app_data_path, f'{self.folder_collection_name()}.bm25.sqlite3')
+
+
+    def embed_query(self, request=None):
+        """ Лемматизировать запрос (по умолчанию self.request) и получить его эмбеддинг
+        один раз на весь поиск (с LRU-кэшем) """
+        with self.metrics.stage('query_embedding'):
+            request = TextExtraction.lemmatization_and_punct_clean(self.request if request is None else request)
+            return query_embedding_cache.get_or_compute(
+                (MODEL_NAME, request), lambda: self.embedding_function([request])[0])
+
+
+    @property
+    def embedding_cache(self):
+        if not self.use_embedding_cache:
+            return None
+        return get_embedding_cache(self.app_data_path, MODEL_NAME)
+
+
+    def create_batcher(self) -> EmbeddingBatcher:
+        return EmbeddingBatcher(self.embedding_function, self.batch_chunks, self.batch_chars, self.embedding_cache)
+
+
+    def finish_batcher(self, batcher: EmbeddingBatcher) -> None:
+        batcher.flush()
+        self.record_embedding_stats(batcher)
+
+
+    def record_embedding_stats(self, stats) -> None:
+        """ Сохранить статистику EmbeddingBatcher или IndexingPipeline и добавить её время к метрикам """
+        stats.log_report()
+        self.embedding_stats = stats
+        # эмбеддинг и запись идут внутри накопителя (конвейера), их время берётся из его статистики
+        self.metrics.add_time('embedding', stats.embed_seconds)
+        self.metrics.add_time('upsert', stats.upsert_seconds)
+
+
+    def create_pipeline(self) -> IndexingPipeline:
+        return IndexingPipeline(self.embedding_function, self.embedding_cache, self.batch_chunks, self.batch_chars,
+                                self.memory_budget, self.queue_size, self.normalizer_workers, self.embedder_workers)
+
+
+    def run_pipeline(self, documents, make_job, total, progress_callback=None, cancel_event=None) -> int:
+        """ Проиндексировать документы конвейером IndexingPipeline
+        args:
+            documents: итерируемое из пар (относительный путь, части документа)
+            make_job: make_job(относительный путь, части) -> генератор записей чанков документа (см. IndexingPipeline.run)
+            total: шагов прогресса всего
+        returns:
+            int: число проиндексированных документов
+        """
+        pipeline = self.create_pipeline()
+        done = 0
+
+        def on_document(relative_path, seconds):
+            nonlocal done
+            self.metrics.add_file_time(Path(relative_path).as_posix(), seconds)
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, total, None)
+
+        pipeline.run(documents, make_job, cancel_event, on_document)
+        check_cancelled(cancel_event)
+        self.metrics.count('memory_peak_bytes', pipeline.budget.peak)
+        self.metrics.count('backpressure_waits', pipeline.budget.waits)
+        self.record_embedding_stats(pipeline)
+        return done
+
+
+    def create_extractor(self) -> TextExtraction:
+        return TextExtraction(self.current_folder_path, self.max_pdf_pages, self.max_pdf_bytes,
+                              self.exclude_patterns, self.max_file_bytes)
+
+
+    @staticmethod
+    def chunk_metadata(relative_path, first_page, last_page) -> dict:
+        metadata = {'path': str(relative_path)}
+        if first_page is not None:
+            metadata['page'] = first_page
+            metadata['page_end'] = last_page
+        return metadata
+
+
+    def create_collection(self, text_chunks, relative_path):
+        name_str = self.collection_name(relative_path)
         collection = self.client.get_or_create_collection(name=name_str, embedding_function=self.embedding_function)
         text_chunks_lemmed = []
         for chunk in text_chunks:
             chunk = TextExtraction.lemmatization_and_punct_clean(chunk)
             text_chunks_lemmed.append(chunk)
+        embeddings = None
+        if self.embedding_cache is not None and text_chunks_lemmed:
+            embeddings = self.embedding_cache.embed(text_chunks_lemmed, self.embedding_function)
+        existing_ids = collection.get(include=[])['ids']
         collection.upsert(
             documents = text_chunks_lemmed,
             ids = [f'{x}' for x in range(len(text_chunks_lemmed))],
-            metadatas=[{'path': str(relative_path)} for _ in range(len(text_chunks_lemmed))]
+            metadatas=[{'path': str(relative_path)} for _ in range(len(text_chunks_lemmed))],
+            embeddings=embeddings
         )
+        self.delete_stale_ids(collection, existing_ids, '', len(text_chunks_lemmed))
+        return collection
+
+
+    def delete_stale_ids(self, collection, existing_ids, id_prefix, chunk_count) -> None:
+        """ Удалить чанки прошлой версии документа с номерами за концом новой версии,
+        иначе "хвост" укоротившегося документа продолжает находиться поиском """
+        current_ids = {f'{id_prefix}{x}' for x in range(chunk_count)}
+        stale_ids = [chunk_id for chunk_id in existing_ids if chunk_id not in current_ids]
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+            self.metrics.count('stale_chunks_deleted', len(stale_ids))
+
+
+    def iter_chunk_records(self, collection, segments, relative_path, id_prefix,
+                           inverted_index: InvertedIndex = None):
+        """ Генератор записей (коллекция, id, лемматизированный текст, метаданные) чанков документа;
+        термы чанков сразу добавляются в инвертированный индекс """
+        chunks = chunk_pages_by_sentence(segments, self.chunk_length, self.chunk_overlap, self.max_sentence_length)
+        # страницы PDF читаются лениво, поэтому их извлечение попадает во время этапа chunking
+        for x, (chunk, first_page, last_page) in enumerate(self.metrics.timed_iter('chunking', chunks)):
+            with self.metrics.stage('normalization'):
+                chunk_lemmed = TextExtraction.lemmatization_and_punct_clean(chunk)
+            self.metrics.count('chunks')
+            self.metrics.count('tokens', len(chunk_lemmed.split()))
+            if inverted_index is not None:
+                inverted_index.add_chunk(f'{id_prefix}{x}', relative_path, chunk_lemmed.split())
+            yield collection, f'{id_prefix}{x}', chunk_lemmed, self.chunk_metadata(relative_path, first_page, last_page)
+
+
+    def add_chunks(self, collection, segments, relative_path, id_prefix, batcher: EmbeddingBatcher,
+                   inverted_index: InvertedIndex = None) -> int:
+        """ Разбить документ на чанки и по одному передать их в общую пачку эмбеддинга,
+        не собирая список всех чанков документа
+        returns:
+            int: число чанков документа
+        """
+        count = 0
+        for collection, chunk_id, chunk_lemmed, metadata in self.iter_chunk_records(
+                collection, segments, relative_path, id_prefix, inverted_index):
+            batcher.add(collection, [chunk_id], [chunk_lemmed], [metadata])
+            count += 1
+        return count
+
+
+    @staticmethod
+    def feed_batcher(batcher: EmbeddingBatcher, job) -> None:
+        """ Передать записи чанков задания индексации документа в накопитель; callback,
+        которым завершается задание, вызывается после записи всех его чанков """
+        while True:
+            try:
+                collection, chunk_id, chunk_lemmed, metadata = next(job)
+            except StopIteration as stop:
+                batcher.when_flushed(stop.value)
+                return
+            batcher.add(collection, [chunk_id], [chunk_lemmed], [metadata])
+
+
+    def get_indexed_collection(self, full_path, relative_path):
+        """ Вернуть уже построенную коллекцию документа, если файл не менялся с момента индексации,
+        иначе None """
+        name_str = self.collection_name(relative_path)
+        if not self.manifest.is_fresh(name_str, full_path, self.chunk_length, MODEL_NAME, self.chunking_options()):
+            return None
+        collection = self.client.get_or_create_collection(name=name_str, embedding_function=self.embedding_function)
+        if collection.count() == 0:  # хранилище очищено, а манифест остался
+            return None
+        return collection
+
+
+    def iter_stale_segments(self, extractor: TextExtraction, stale_paths):
+        """ Сегменты изменённых файлов; ожидание очередного файла считается временем этапа extraction.
+        Размер и mtime файлов запоминаются до чтения, чтобы не записать в манифест версию, изменённую во время индексации """
+        for full_path in stale_paths:
+            stat = IndexManifest.file_stat(full_path)
+            self.stale_stats[full_path.relative_to(self.current_folder_path).as_posix()] = stat
+            if stat is not None:
+                self.metrics.count('bytes', stat[0])
+        self.metrics.count('files_indexed', len(stale_paths))
+        return self.metrics.timed_iter('extraction', extractor.iter_segments(stale_paths, self.extraction_workers))
+
+
+    @contextmanager
+    def file_timer(self, relative_path):
+        """ Время разбиения, нормализации (и извлечения страниц PDF) одного файла - для поиска медленных файлов """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.add_file_time(Path(relative_path).as_posix(), time.perf_counter() - start)
+
+
+    def drop_dead_collections(self, full_paths) -> int:
+        """ Удалить коллекции удалённых и переименованных файлов папки (по записям манифеста).
+        Решение принимается по пути файла записи, а не по имени коллекции: имена коллекций - относительные пути,
+        и у вложенной папки и её родителя они разные для одного и того же файла
+        args:
+            full_paths: полные пути файлов папки, найденные обходом
+        returns:
+            int: число удалённых коллекций
+        """
+        from chromadb.errors import NotFoundError
+        folder = Path(self.current_folder_path).resolve()
+        walked = {str(Path(full_path).resolve()) for full_path in full_paths}
+        dropped = 0
+        for key, entry in list(self.manifest.entries.items()):
+            # ключи общих коллекций имеют вид 'коллекция/путь', коллекции документов - без '/'
+            if '/' in key or not Path(entry['path']).is_relative_to(folder):
+                continue
+            # файл есть и попал в обход (под любым относительным путём) - коллекция жива;
+            # существующий файл вне обхода отброшен фильтрами (исключения, размер, скрытые папки)
+            if entry['path'] in walked:
+                continue
+            try:
+                self.client.delete_collection(key)
+            except NotFoundError:
+                pass
+            self.manifest.remove(key)
+            dropped += 1
+        self.metrics.count('collections_dropped', dropped)
+        return dropped
+
+
+    def drop_dead_documents(self, collection, inverted_index: InvertedIndex, current_paths) -> int:
+        """ Удалить из общей коллекции и инвертированного индекса чанки файлов, которых больше нет в папке
+        returns:
+            int: число удалённых документов
+        """
+        prefix = f'{collection.name}/'
+        dropped = 0
+        for key in list(self.manifest.entries):
+            if not key.startswith(prefix) or key[len(prefix):] in current_paths:
+                continue
+            path_str = key[len(prefix):]
+            collection.delete(where={'path': path_str})
+            inverted_index.delete_path(path_str)
+            self.manifest.remove(key)
+            dropped += 1
+        self.metrics.count('documents_dropped', dropped)
+        return dropped
+
+
+    def document_collection(self, relative_path):
+        name_str = self.collection_name(relative_path)
+        return self.client.get_or_create_collection(name=name_str, embedding_function=self.embedding_function)
+
+
+    def update_manifest(self, key, relative_path) -> None:
+        """ Записать в манифест отпечаток проиндексированного файла, если он не менялся с начала его чтения """
+        full_path = Path(self.current_folder_path) / relative_path
+        if not self.manifest.update(key, full_path, self.chunk_length, MODEL_NAME, chunking=self.chunking_options(),
+                                    expected_stat=self.stale_stats.pop(Path(relative_path).as_posix(), None)):
+            self.metrics.count('changed_during_indexing')
+
+
+    def document_job(self, collection, segments, relative_path):
+        """ Задание индексации документа в его собственную коллекцию: генератор записей чанков,
+        возвращающий callback, который вызывается после записи всех чанков """
+        existing_ids = collection.get(include=[])['ids']
+        chunk_count = 0
+        for record in self.iter_chunk_records(collection, segments, str(relative_path), ''):
+            chunk_count += 1
+            yield record
+
+        def on_written():
+            # номера, которых нет в новой версии, никогда не будут перезаписаны
+            self.delete_stale_ids(collection, existing_ids, '', chunk_count)
+            # манифест обновляется только после реальной записи чанков в хранилище
+            self.update_manifest(self.collection_name(relative_path), relative_path)
+        return on_written
+
+
+    def index_document(self, segments, relative_path, batcher: EmbeddingBatcher):
+        collection = self.document_collection(relative_path)
+        self.feed_batcher(batcher, self.document_job(collection, segments, relative_path))
         return collection
 
 
-    def find_documents(self) -> list:
-        documents_dict = TextExtraction(self.current_folder_path).extract()  # {'path': 'text', ...}
+    def find_documents(self, progress_callback=None, cancel_event=None) -> list:
+        """ Найти самые релевантные документы папки, доиндексировав новые и изменённые файлы.
+        progress_callback(done, total, ranking) вызывается после каждого проиндексированного и каждого
+        оценённого документа; ranking - текущий (частичный) список путей или None на этапе индексации.
+        Если установлен cancel_event (threading.Event), поиск прерывается исключением SearchCancelled.
+        Метрики запуска сохраняются в self.metrics и передаются подписчикам metrics_hooks.
+        """
+        self.metrics = SearchMetrics(self.current_folder_path, self.request)
+        status = 'error'
+        try:
+            ranking = self.search_folder(progress_callback, cancel_event)
+            status = 'ok'
+            return ranking
+        except SearchCancelled:
+            status = 'cancelled'
+            raise
+        finally:
+            self.metrics.finish(status)
+            publish(self.metrics, self.metrics_hooks)
+
+
+    def search_folder(self, progress_callback=None, cancel_event=None) -> list:
+        extractor = self.create_extractor()
+        with self.metrics.stage('walk'):
+            extractor.get_paths(self.current_folder_path)
+        self.metrics.count('files', len(extractor.full_paths))
+        for reason, count in extractor.skipped.items():
+            self.metrics.count(f'skipped_{reason}', count)
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache_key(extractor.full_paths)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                self.metrics.count('result_cache_hits')
+                ranking = [Path(path) for path in cached]
+                if progress_callback is not None:
+                    progress_callback(1, 1, ranking)
+                return ranking
+        if self.shared_collection:
+            ranking = self.find_documents_in_shared_collection(extractor, progress_callback, cancel_event)
+        else:
+            ranking = self.find_documents_in_collections(extractor, progress_callback, cancel_event)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, [path.as_posix() for path in ranking])
+        return ranking
+
+
+    def result_cache_key(self, full_paths) -> str:
+        """ Ключ кэша результатов: нормализованный запрос, папка, все параметры, влияющие на ранжирование,
+        и отпечаток папки (исключения и предельный размер файла меняют набор путей, а с ним и отпечаток) """
+        return ResultCache.make_key(
+            TextExtraction.lemmatization_and_punct_clean(self.request),
+            Path(self.current_folder_path).resolve(),
+            self.chunk_length,
+            self.chunk_overlap,
+            self.max_sentence_length,
+            self.results_count,
+            self.retrieval if self.shared_collection else 'per_document',
+            self.vector_backend,
+            self.flat_dtype,
+            self.candidate_budget,
+            self.hybrid_alpha,
+            self.top_chunks,
+            self.max_pdf_pages,
+            self.max_pdf_bytes,
+            MODEL_NAME,
+            folder_fingerprint(full_paths, self.current_folder_path),
+        )
+
+
+    def find_documents_in_collections(self, extractor: TextExtraction, progress_callback=None,
+                                      cancel_event=None) -> list:
+        relative_paths = []
+        collections = {}
+        stale_paths = []
+        batcher = self.create_batcher()
+        try:
+            for full_path in extractor.full_paths:
+                relative_path = full_path.relative_to(self.current_folder_path)
+                relative_paths.append(relative_path)
+                collection = self.get_indexed_collection(full_path, relative_path)
+                if collection is None:
+                    stale_paths.append(full_path)
+                else:
+                    collections[relative_path] = collection
+            self.drop_dead_collections(extractor.full_paths)
+            total = len(stale_paths) + len(relative_paths)
+            done = 0
+            # изменённые файлы читаются (при extraction_workers > 1 - параллельно) и индексируются по мере готовности
+            if self.pipeline:
+                def make_job(relative_path, segments):
+                    collections[relative_path] = self.document_collection(relative_path)
+                    return self.document_job(collections[relative_path], segments, relative_path)
+                done = self.run_pipeline(self.iter_stale_segments(extractor, stale_paths), make_job, total,
+                                         progress_callback, cancel_event)
+            else:
+                for relative_path, segments in self.iter_stale_segments(extractor, stale_paths):
+                    check_cancelled(cancel_event)
+                    with self.file_timer(relative_path):
+                        collections[relative_path] = self.index_document(segments, relative_path, batcher)
+                    done += 1
+                    if progress_callback is not None:
+                        progress_callback(done, total, None)
+                self.finish_batcher(batcher)
+        finally:
+            self.manifest.save()
+        query_embedding = self.embed_query()
         distances = {}
-        for path in documents_dict:
-            text = documents_dict[path]
-            chunks = chunk_text_by_sentence(text, self.chunk_length)
-            collection = self.create_collection(chunks, path)
-            best_chunk, best_distance = find_best_chunk(collection, self.request)
-            distances[path] = best_distance
+        for relative_path in relative_paths:
+            check_cancelled(cancel_event)
+            if relative_path in collections:
+                with self.metrics.stage('query'):
+                    best_chunk, best_distance = find_best_chunk(collections[relative_path], self.request,
+                                                                query_embedding)
+                self.metrics.count('queries')
+                distances[relative_path] = best_distance
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, total, self.extract_rel_doc_paths(distances))
         return self.extract_rel_doc_paths(distances)
 
 
+    def shared_document_job(self, collection, segments, relative_path, inverted_index: InvertedIndex):
+        """ Задание индексации документа в общую коллекцию (см. document_job) """
+        path_str = relative_path.as_posix()
+        # старые чанки документа удаляются целиком, чтобы от прошлой версии не оставался "хвост"
+        collection.delete(where={'path': path_str})
+        inverted_index.delete_path(path_str)
+        yield from self.iter_chunk_records(collection, segments, path_str, f'{path_str}#', inverted_index)
+        key = f'{collection.name}/{path_str}'
+        return lambda: self.update_manifest(key, relative_path)
+
+
+    def staged_document_job(self, collection, segments, relative_path, inverted_index: InvertedIndex, write_locked):
+        """ Задание индексации документа в общую коллекцию, изменения которого копятся в памяти
+        и применяются под блокировкой write_locked одним шагом после эмбеддинга всех чанков:
+        параллельные поиски видят документ целиком в старой или целиком в новой версии """
+        changes = StagedChanges()
+        on_written = yield from self.shared_document_job(changes.stage(collection), segments, relative_path,
+                                                         changes.stage(inverted_index))
+
+        def apply():
+            with write_locked():
+                changes.apply()
+            on_written()
+        return apply
+
+
+    def refresh_shared_index(self, extractor: TextExtraction, progress_callback=None, cancel_event=None,
+                             extra_steps=0, inverted_index: InvertedIndex = None, write_locked=None):
+        """ Доиндексировать изменённые файлы папки в общую коллекцию и инвертированный индекс
+        args:
+            extractor: TextExtraction с уже собранными путями файлов папки
+            extra_steps: сколько шагов прогресса вызывающий код добавит после индексации
+            inverted_index: уже открытый инвертированный индекс папки (None - открыть новый)
+            write_locked: блокировка записи индекса, по которому параллельно идут поиски (None - без неё);
+                извлечение, разбиение и эмбеддинг идут вне блокировки, под ней - только записи в хранилище
+        returns:
+            кортеж (коллекция, открытый InvertedIndex, {относительный путь строкой: Path}, шагов прогресса всего);
+            инвертированный индекс закрывает вызывающий код
+        """
+        collection = self.open_shared_collection()
+        name_str = collection.name
+        owns_index = inverted_index is None
+        if owns_index:
+            inverted_index = InvertedIndex(self.inverted_index_path())
+        # хранилище или инвертированный индекс очищены, а манифест остался
+        rebuild = collection.count() == 0 or inverted_index.chunk_count() == 0
+        locked = write_locked or nullcontext
+        current_paths = {}
+        stale_paths = []
+        batcher = self.create_batcher()
+
+        def make_job(relative_path, segments):
+            if write_locked is None:
+                return self.shared_document_job(collection, segments, relative_path, inverted_index)
+            return self.staged_document_job(collection, segments, relative_path, inverted_index, write_locked)
+        try:
+            for full_path in extractor.full_paths:
+                relative_path = full_path.relative_to(self.current_folder_path)
+                current_paths[relative_path.as_posix()] = relative_path
+                key = f'{name_str}/{relative_path.as_posix()}'
+                if rebuild or not self.manifest.is_fresh(key, full_path, self.chunk_length, MODEL_NAME,
+                                                         self.chunking_options()):
+                    stale_paths.append(full_path)
+            with locked():
+                self.drop_dead_documents(collection, inverted_index, current_paths)
+            total = len(stale_paths) + extra_steps
+            done = 0
+            if self.pipeline:
+                self.run_pipeline(self.iter_stale_segments(extractor, stale_paths), make_job, total,
+                                  progress_callback, cancel_event)
+            else:
+                for relative_path, segments in self.iter_stale_segments(extractor, stale_paths):
+                    check_cancelled(cancel_event)
+                    with self.file_timer(relative_path):
+                        self.feed_batcher(batcher, make_job(relative_path, segments))
+                    done += 1
+                    if progress_callback is not None:
+                        progress_callback(done, total, None)
+                self.finish_batcher(batcher)
+        except BaseException:
+            if owns_index:
+                inverted_index.close()
+            raise
+        finally:
+            if isinstance(collection, FlatVectorIndex):
+                with locked():
+                    collection.save()
+            self.manifest.save()
+        with locked():
+            inverted_index.commit()
+        return collection, inverted_index, current_paths, total
+
+
+    def open_shared_collection(self):
+        """ Общая коллекция папки: коллекция ChromaDB или плоский индекс NumPy (vector_backend='flat') """
+        name_str = self.folder_collection_name()
+        if self.vector_backend == 'flat':
+            name_str = f'{name_str}.flat'
+            return FlatVectorIndex(os.path.join(self.app_data_path, name_str), name_str, self.flat_dtype)
+        return self.client.get_or_create_collection(name=name_str, embedding_function=self.embedding_function)
+
+
+    def find_documents_in_shared_collection(self, extractor: TextExtraction, progress_callback=None,
+                                            cancel_event=None) -> list:
+        # индексация изменённых файлов и один общий запрос
+        collection, inverted_index, current_paths, total = self.refresh_shared_index(
+            extractor, progress_callback, cancel_event, extra_steps=1)
+        try:
+            check_cancelled(cancel_event)
+            best = self.rank_shared_collection(collection, inverted_index, current_paths.keys()) if current_paths else {}
+        finally:
+            inverted_index.close()
+        ranking = self.extract_rel_doc_paths({current_paths[path]: distance for path, distance in best.items()})
+        if progress_callback is not None:
+            progress_callback(total, total, ranking)
+        return ranking
+
+
+    def rank_shared_collection(self, collection, inverted_index: InvertedIndex, allowed_paths) -> dict:
+        """ Расстояния до лучших документов общей коллекции: один плотный запрос top-N
+        либо BM25-кандидаты, переранжированные по эмбеддингам """
+        query_embedding = self.embed_query()
+        self.metrics.count('queries')
+        with self.metrics.stage('query'):
+            return self.query_shared_collection(collection, inverted_index, allowed_paths, query_embedding)
+
+
+    def query_shared_collection(self, collection, inverted_index: InvertedIndex, allowed_paths,
+                                query_embedding, request=None) -> dict:
+        """ Расстояния до лучших документов общей коллекции для запроса request (по умолчанию self.request)
+        с уже посчитанным эмбеддингом """
+        request = self.request if request is None else request
+        if self.retrieval != 'dense':
+            tokens = TextExtraction.lemmatization_and_punct_clean(request).split()
+            candidates = inverted_index.search(tokens, self.candidate_budget, allowed_paths)
+            if candidates:
+                hybrid_alpha = self.hybrid_alpha if self.retrieval == 'hybrid' else None
+                return rerank_candidates(collection, candidates, query_embedding, hybrid_alpha)
+            # ни один терм запроса не встретился в корпусе - остаётся только плотный поиск
+        if isinstance(collection, FlatVectorIndex):
+            return collection.best_documents(query_embedding, self.results_count, allowed_paths)
+        return find_best_documents(collection, request, self.results_count, self.top_chunks,
+                                   allowed_paths=allowed_paths, query_embedding=query_embedding)
+
+
     def extract_rel_doc_paths(self, distances: dict) -> list:
         sorted_d = dict(sorted(distances.items(), key=lambda x: x[1])[:self.results_count])
         relevant_paths = []
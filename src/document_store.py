@@ -0,0 +1,187 @@
+""" Долгоживущий потокобезопасный индекс одной папки.
+
+DocumentStore держит открытыми общую коллекцию папки и её инвертированный индекс и отделяет их
+от запросов: запрос передаётся аргументом search, поэтому один объект обслуживает любое число потоков.
+Поиски выполняются параллельно, переиндексации - по одной за раз. Переиндексация извлекает, разбивает
+и эмбеддит изменённые файлы параллельно с поисками, а блокировку записи ("много читателей или один
+писатель") берёт только на запись готового документа в хранилище, так что поиск никогда не видит
+наполовину записанный документ. get_store возвращает общий на процесс объект для папки и параметров индекса.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from src.document_search import RelevantDocumentsSearch
+from src.instrumentation import SearchMetrics
+from src.inverted_index import InvertedIndex
+from src.resource_registry import default_storage_path
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ReadWriteLock:
+    """ Блокировка "много читателей или один писатель". Ожидающий писатель не пропускает
+    вперёд новых читателей, иначе при непрерывном потоке поисков переиндексация не дождалась бы очереди
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.max_readers = 0  # наибольшее число одновременных читателей (для статистики и тестов)
+
+    @contextmanager
+    def read_locked(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+            self.max_readers = max(self.max_readers, self.readers)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write_locked(self):
+        with self.condition:
+            self.waiting_writers += 1
+            try:
+                while self.writer or self.readers:
+                    self.condition.wait()
+            finally:
+                self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class DocumentStore:
+    """ Индекс папки (общая коллекция и инвертированный индекс), общий для параллельных поисков """
+
+    def __init__(self, folder, chunk_length=400, results_count=5, retrieval='dense', vector_backend='chroma',
+                 **options):
+        """ Конструктор индекса
+        args:
+            folder: папка с документами
+            chunk_length: длина чанка
+            results_count: сколько документов возвращать на запрос (максимум для limit)
+            retrieval: режим поиска ('dense', 'bm25' или 'hybrid')
+            vector_backend: хранилище векторов ('chroma' или 'flat')
+            options: остальные параметры RelevantDocumentsSearch (extraction_workers, pipeline, ...)
+        returns:
+        """
+        # параметры индексации и общие ресурсы (клиент, модель); собственный запрос у него не используется
+        self.indexer = RelevantDocumentsSearch(folder, '', chunk_length=chunk_length, results_count=results_count,
+                                               shared_collection=True, retrieval=retrieval,
+                                               vector_backend=vector_backend, **options)
+        # одно соединение с инвертированным индексом на всё время жизни объекта
+        self.inverted_index = InvertedIndex(self.indexer.inverted_index_path())
+        self.collection = None
+        self.current_paths = {}  # {относительный путь строкой: Path}
+        self.lock = ReadWriteLock()
+        # переиндексация идёт в основном вне блокировки записи, поэтому переиндексации дополнительно сериализуются
+        self.refresh_lock = threading.Lock()
+        self.searches = 0
+        self.searches_lock = threading.Lock()
+
+    @property
+    def folder(self):
+        return self.indexer.current_folder_path
+
+    @property
+    def ready(self) -> bool:
+        return self.collection is not None
+
+    def refresh(self, progress_callback=None, cancel_event=None) -> dict:
+        """ Доиндексировать изменённые файлы папки. Обход, извлечение и эмбеддинг идут параллельно с поисками,
+        под блокировкой записи - только удаление и запись чанков каждого документа
+        args:
+            progress_callback: progress_callback(done, total, None) после каждого проиндексированного файла
+            cancel_event: threading.Event, установка которого прерывает индексацию исключением SearchCancelled
+        returns:
+            summary(dict): число документов папки, проиндексированных файлов и время в секундах
+        """
+        with self.refresh_lock:
+            start = time.perf_counter()
+            # метрики индексатора описывают последнюю переиндексацию (и поиски после неё)
+            self.indexer.metrics = SearchMetrics(self.folder)
+            extractor = self.indexer.create_extractor()
+            extractor.get_paths(self.folder)
+            collection, _, current_paths, indexed = self.indexer.refresh_shared_index(
+                extractor, progress_callback, cancel_event, inverted_index=self.inverted_index,
+                write_locked=self.lock.write_locked)
+            with self.lock.write_locked():
+                self.collection, self.current_paths = collection, current_paths
+            return {'documents': len(current_paths), 'indexed': indexed,
+                    'seconds': round(time.perf_counter() - start, 6)}
+
+    def search(self, query, limit=None, allowed_paths=None) -> list:
+        """ Найти самые релевантные документы папки для запроса
+        args:
+            query: текст запроса
+            limit: сколько документов вернуть (не больше results_count)
+            allowed_paths: искать только среди этих относительных путей (строки с '/'; None - вся папка)
+        returns:
+            list: пары (относительный путь Path, расстояние) по возрастанию расстояния
+        """
+        with self.lock.read_locked():
+            if self.collection is None:
+                raise RuntimeError('index is not built, call refresh first')
+            paths = self.current_paths.keys() if allowed_paths is None else \
+                {path for path in allowed_paths if path in self.current_paths}
+            distances = {}
+            if paths:
+                query_embedding = self.indexer.embed_query(query)
+                distances = self.indexer.query_shared_collection(self.collection, self.inverted_index, paths,
+                                                                 query_embedding, request=query)
+            limit = min(limit or self.indexer.results_count, self.indexer.results_count)
+            ranking = sorted(distances.items(), key=lambda item: item[1])[:limit]
+            ranking = [(self.current_paths[path], float(distance)) for path, distance in ranking]
+        with self.searches_lock:
+            self.searches += 1
+        return ranking
+
+    def documents(self) -> int:
+        with self.lock.read_locked():
+            return len(self.current_paths)
+
+    def close(self) -> None:
+        with self.refresh_lock, self.lock.write_locked():
+            self.collection = None
+            self.current_paths = {}
+            self.inverted_index.close()
+
+
+def get_store(folder, chunk_length=400, results_count=5, retrieval='dense', vector_backend='chroma',
+              **options) -> DocumentStore:
+    """ Вернуть общий на процесс DocumentStore папки с этими параметрами индекса, создав его при первом обращении
+    (options учитываются только при создании) """
+    key = (os.path.abspath(default_storage_path()), str(Path(folder).resolve()), chunk_length,
+           results_count, retrieval, vector_backend)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = DocumentStore(folder, chunk_length, results_count, retrieval, vector_backend, **options)
+            _stores[key] = store
+        return store
+
+
+def close_stores() -> None:
+    """ Закрыть все открытые через get_store индексы """
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
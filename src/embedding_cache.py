@@ -0,0 +1,133 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """ Дисковый кэш эмбеддингов, адресуемый содержимым чанка.
+    Векторы дописываются в файл float32, который читается через np.memmap,
+    а в SQLite хранится индекс: sha1(модель + текст) -> номер строки.
+    Повторяющиеся чанки (копии файлов, одинаковые колонтитулы) эмбеддятся моделью один раз.
+    """
+
+    def __init__(self, storage_path, model_name):
+        """ Конструктор кэша
+        args:
+            storage_path: папка, в которой хранятся файлы кэша
+            model_name: имя модели эмбеддингов (у каждой модели свои файлы)
+        returns:
+        """
+        self.model_name = model_name
+        slug = re.sub(r'[^0-9A-Za-z_.-]+', '_', model_name)
+        self.vectors_path = os.path.join(storage_path, f'embeddings_{slug}.f32')
+        self.connection = sqlite3.connect(os.path.join(storage_path, f'embeddings_{slug}.sqlite3'),
+                                          check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS vectors (hash TEXT PRIMARY KEY, row INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        ''')
+        self.lock = threading.Lock()
+        self.dim = self._stored_dim()
+        self.rows = self._stored_rows()
+        self.matrix = None
+        self.hits = 0
+        self.misses = 0
+
+    def _stored_dim(self):
+        stored_dim = self.connection.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return stored_dim[0] if stored_dim else None
+
+    def _stored_rows(self) -> int:
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        # строки индекса, векторы которых не успели дописаться (прерванная запись), забываются
+        self.connection.execute('DELETE FROM vectors WHERE row >= ?', (rows,))
+        self.connection.commit()
+        return rows
+
+    def key(self, text) -> str:
+        return hashlib.sha1(f'{self.model_name}\0{text}'.encode('utf-8')).hexdigest()
+
+    def _vector(self, row):
+        if self.dim is None:
+            # кэш открыт пустым, а векторы с тех пор записала другая копия кэша
+            self.dim = self._stored_dim()
+        if self.matrix is None or row >= self.matrix.shape[0]:
+            # файл вырос с момента прошлого отображения (в том числе записями другого процесса) - отображаем заново
+            self.rows = max(self.rows, os.path.getsize(self.vectors_path) // (self.dim * 4))
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+        return np.array(self.matrix[row])
+
+    def lookup(self, texts) -> list:
+        """ Вернуть сохранённые векторы текстов (None для отсутствующих в кэше) """
+        with self.lock:
+            result = []
+            for text in texts:
+                found = self.connection.execute('SELECT row FROM vectors WHERE hash = ?', (self.key(text),)).fetchone()
+                result.append(self._vector(found[0]) if found else None)
+            return result
+
+    def store(self, texts, embeddings) -> None:
+        """ Дописать векторы текстов в кэш.
+        Тот же кэш могут дописывать другие процессы (приложение, пакетный поиск, сервис), поэтому запись идёт
+        под блокировкой записи SQLite (BEGIN IMMEDIATE), а номер первой строки берётся из размера файла
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            return
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                # размерность могла записать другая копия кэша
+                self.dim = self._stored_dim() or vectors.shape[1]
+                if vectors.shape[1] != self.dim:
+                    # размерность модели изменилась - такие векторы не кэшируются
+                    self.connection.rollback()
+                    return
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,))
+                row_bytes = self.dim * 4
+                with open(self.vectors_path, 'r+b' if os.path.exists(self.vectors_path) else 'wb') as file:
+                    file.seek(0, os.SEEK_END)
+                    first_row = file.tell() // row_bytes
+                    # хвост прерванной записи отбрасывается, чтобы строки оставались выровненными
+                    file.seek(first_row * row_bytes)
+                    file.truncate()
+                    file.write(vectors.tobytes())
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO vectors VALUES (?, ?)',
+                    [(self.key(text), first_row + i) for i, text in enumerate(texts)]
+                )
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.rows = first_row + len(vectors)
+
+    def embed(self, texts, embedding_function) -> list:
+        """ Эмбеддинги текстов: из кэша, а недостающие - одним вызовом модели (каждый уникальный текст один раз)
+        args:
+            texts: список текстов
+            embedding_function: функция эмбеддингов (список строк -> список векторов)
+        returns:
+            embeddings(list): векторы в порядке texts
+        """
+        embeddings = self.lookup(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, embeddings) if vector is None))
+        self.hits += len(texts) - sum(vector is None for vector in embeddings)
+        self.misses += len(missing)
+        if missing:
+            computed = [np.asarray(vector, dtype=np.float32) for vector in embedding_function(missing)]
+            self.store(missing, computed)
+            by_text = dict(zip(missing, computed))
+            embeddings = [by_text[text] if vector is None else vector for text, vector in zip(texts, embeddings)]
+        return embeddings
+
+    def close(self) -> None:
+        with self.lock:
+            self.matrix = None
+            self.connection.close()
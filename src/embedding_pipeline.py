@@ -0,0 +1,100 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """ Накопитель лемматизированных чанков из многих документов.
+    Чанки копятся до max_chunks штук или max_chars символов, затем эмбеддятся одним вызовом модели
+    и записываются в коллекции через upsert с готовыми embeddings=, чтобы хранилище не считало их повторно.
+    """
+
+    def __init__(self, embedding_function, max_chunks=256, max_chars=100_000, embedding_cache=None):
+        """ Конструктор накопителя
+        args:
+            embedding_function: функция эмбеддингов (список строк -> список векторов)
+            max_chunks: максимальное число чанков в одной пачке
+            max_chars: максимальная суммарная длина чанков в пачке
+            embedding_cache: EmbeddingCache, к которому обращаются до вызова модели (None - без кэша)
+        returns:
+        """
+        self.embedding_function = embedding_function
+        self.embedding_cache = embedding_cache
+        self.max_chunks = max_chunks
+        self.max_chars = max_chars
+        self.pending = []  # (коллекция, id, текст, метаданные, список callback-ов)
+        self.pending_chars = 0
+        self.chunks_embedded = 0
+        self.batches = 0
+        self.embed_seconds = 0.0
+        self.upsert_seconds = 0.0
+
+    def add(self, collection, ids, documents, metadatas, on_flushed=None) -> None:
+        """ Добавить чанки одного документа.
+        on_flushed вызывается после того, как последний чанк документа записан в хранилище
+        """
+        for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            callbacks = [on_flushed] if on_flushed is not None and i == len(ids) - 1 else []
+            self.pending.append((collection, chunk_id, document, metadata, callbacks))
+            self.pending_chars += len(document)
+            if len(self.pending) >= self.max_chunks or self.pending_chars >= self.max_chars:
+                self.flush()
+        if not ids and on_flushed is not None:
+            self.when_flushed(on_flushed)
+
+    def when_flushed(self, callback) -> None:
+        """ Вызвать callback, когда всё добавленное к этому моменту будет записано в хранилище """
+        if self.pending:
+            self.pending[-1][4].append(callback)
+        else:
+            callback()
+
+    def flush(self) -> None:
+        """ Посчитать эмбеддинги накопленной пачки и записать её в коллекции """
+        if not self.pending:
+            return
+        pending, self.pending, self.pending_chars = self.pending, [], 0
+
+        start = time.perf_counter()
+        documents = [document for _, _, document, _, _ in pending]
+        if self.embedding_cache is not None:
+            embeddings = self.embedding_cache.embed(documents, self.embedding_function)
+        else:
+            embeddings = self.embedding_function(documents)
+        self.embed_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        groups = {}
+        for (collection, chunk_id, document, metadata, _), embedding in zip(pending, embeddings):
+            group = groups.setdefault(id(collection), (collection, [], [], [], []))
+            group[1].append(chunk_id)
+            group[2].append(document)
+            group[3].append(metadata)
+            group[4].append(embedding)
+        for collection, ids, documents, metadatas, group_embeddings in groups.values():
+            collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=group_embeddings)
+        self.upsert_seconds += time.perf_counter() - start
+
+        self.chunks_embedded += len(pending)
+        self.batches += 1
+        for *_, callbacks in pending:
+            for callback in callbacks:
+                callback()
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks_embedded / self.embed_seconds if self.embed_seconds else 0.0
+
+    def report(self) -> str:
+        """ Строка со статистикой пропускной способности """
+        report = (f'embedded {self.chunks_embedded} chunks in {self.batches} batches: '
+                  f'{self.chunks_per_second:.1f} chunks/s (embed {self.embed_seconds:.2f}s, '
+                  f'upsert {self.upsert_seconds:.2f}s)')
+        if self.embedding_cache is not None:
+            report += f', cache {self.embedding_cache.hits} hits / {self.embedding_cache.misses} misses'
+        return report
+
+    def log_report(self) -> None:
+        if self.chunks_embedded:
+            logger.info(self.report())
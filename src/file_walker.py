@@ -0,0 +1,228 @@
+""" Быстрый обход папки с документами на os.scandir.
+
+Обход итеративный (без рекурсии), тип файла отбрасывается по расширению до того, как путь
+попадает в список, поэтому неподдерживаемые файлы не читаются и не индексируются.
+Пропускаются скрытые и системные папки, файлы по шаблонам в стиле .gitignore, петли символических
+ссылок и файлы больше заданного размера (кроме форматов, читаемых потоком); число пропущенных файлов и папок считается по причинам.
+"""
+import os
+import re
+import stat
+from pathlib import Path
+
+IGNORE_FILES = ('.gitignore', '.docsearchignore')
+SYSTEM_DIRS = frozenset(('__pycache__', 'node_modules', '$RECYCLE.BIN', 'System Volume Information'))
+# файлы больше этого размера не индексируются (образы дисков, архивы, дампы)
+DEFAULT_MAX_FILE_BYTES = 200 * 1024 * 1024
+
+# на Windows скрытые и системные файлы отмечены атрибутами, а не точкой в начале имени
+_WINDOWS_HIDDEN = stat.FILE_ATTRIBUTE_HIDDEN | stat.FILE_ATTRIBUTE_SYSTEM if os.name == 'nt' else 0
+
+
+def translate_pattern(pattern) -> str:
+    """ Перевести шаблон .gitignore (без '!' и завершающего '/') в регулярное выражение
+    для относительного пути с разделителем '/' """
+    result = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            result.append('.*')
+            i += 2
+            continue
+        if char == '*':
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                result.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                result.append(f'[{body}]')
+                i = end
+        else:
+            result.append(re.escape(char))
+        i += 1
+    return ''.join(result)
+
+
+class IgnoreRules:
+    """ Набор правил исключения в стиле .gitignore.
+    Правило без '/' сравнивается с именем на любой глубине, правило с '/' - с путём от папки,
+    в которой оно задано; '!' возвращает исключённое, завершающий '/' - правило только для папок.
+    Побеждает последнее подошедшее правило
+    """
+
+    def __init__(self, patterns=()):
+        self.rules = []  # (регулярное выражение, отрицание, только папки, базовая папка)
+        self.add(patterns)
+
+    def add(self, patterns, base='') -> None:
+        """ Добавить шаблоны
+        args:
+            patterns: строки шаблонов (пустые строки и комментарии '#' пропускаются)
+            base: папка с файлом правил относительно корня обхода ('' - корень)
+        returns:
+        """
+        for line in patterns:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            anchored = '/' in line
+            line = line.lstrip('/')
+            regex = translate_pattern(line) if anchored else f'(?:.*/)?{translate_pattern(line)}'
+            self.rules.append((re.compile(regex, re.DOTALL), negate, dir_only, base))
+
+    def add_file(self, path, base='') -> None:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                self.add(file.readlines(), base)
+        except OSError:
+            pass
+
+    def ignored(self, relative_path, is_dir=False) -> bool:
+        """ Исключён ли путь (относительно корня обхода, с разделителем '/') """
+        ignored = False
+        for regex, negate, dir_only, base in self.rules:
+            if dir_only and not is_dir:
+                continue
+            path = relative_path
+            if base:
+                if not relative_path.startswith(base + '/'):
+                    continue
+                path = relative_path[len(base) + 1:]
+            if regex.fullmatch(path):
+                ignored = not negate
+        return ignored
+
+
+class FileWalker:
+    """ Итеративный обход папки с фильтрами и подсчётом пропущенного """
+
+    def __init__(self, extensions, exclude_patterns=(), max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+                 include_hidden=False, follow_symlinks=True, ignore_files=IGNORE_FILES, uncapped_extensions=()):
+        """ Конструктор обхода
+        args:
+            extensions: поддерживаемые расширения в нижнем регистре ('.txt', ...)
+            exclude_patterns: шаблоны исключения в стиле .gitignore относительно корня обхода
+            max_file_bytes: файлы больше этого размера пропускаются (None - без ограничения)
+            include_hidden: обходить скрытые файлы и папки
+            follow_symlinks: заходить в папки по символическим ссылкам (петли обнаруживаются)
+            ignore_files: имена файлов с правилами исключения, читаемые в каждой папке
+            uncapped_extensions: расширения, на которые max_file_bytes не действует
+                (форматы, которые читаются потоком и не загружаются в память целиком)
+        returns:
+        """
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self.exclude_patterns = list(exclude_patterns or ())
+        self.max_file_bytes = max_file_bytes
+        self.include_hidden = include_hidden
+        self.follow_symlinks = follow_symlinks
+        self.ignore_files = tuple(ignore_files or ())
+        self.uncapped_extensions = frozenset(extension.lower() for extension in uncapped_extensions)
+        self.skipped = {}  # причина -> число пропущенных файлов и папок
+
+    def skip(self, reason) -> None:
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def is_hidden(self, entry) -> bool:
+        if entry.name.startswith('.'):
+            return True
+        if _WINDOWS_HIDDEN:
+            try:
+                return bool(entry.stat(follow_symlinks=False).st_file_attributes & _WINDOWS_HIDDEN)
+            except OSError:
+                return False
+        return False
+
+    def walk(self, root):
+        """ Генератор полных путей (Path) поддерживаемых файлов папки root """
+        root = Path(root)
+        rules = IgnoreRules(self.exclude_patterns)
+        visited = set()
+        try:
+            root_stat = os.stat(root)
+            visited.add((root_stat.st_dev, root_stat.st_ino))
+        except OSError:
+            self.skip('error')
+            return
+        stack = [(root, '')]
+        while stack:
+            directory, relative_directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                self.skip('error')
+                continue
+            # правила папки действуют на всё её содержимое, поэтому читаются до разбора записей
+            for entry in entries:
+                if entry.name in self.ignore_files and entry.is_file():
+                    rules.add_file(entry.path, relative_directory)
+            subdirectories = []
+            for entry in entries:
+                relative_path = f'{relative_directory}/{entry.name}' if relative_directory else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=self.follow_symlinks)
+                except OSError:
+                    self.skip('error')
+                    continue
+                if is_dir:
+                    if (not self.include_hidden and self.is_hidden(entry)) or entry.name in SYSTEM_DIRS:
+                        self.skip('hidden')
+                    elif rules.ignored(relative_path, is_dir=True):
+                        self.skip('ignored')
+                    else:
+                        subdirectories.append((entry, relative_path))
+                    continue
+                if entry.name in self.ignore_files:
+                    continue
+                extension = os.path.splitext(entry.name)[1].lower()
+                if extension not in self.extensions:
+                    self.skip('unsupported')
+                    continue
+                if not self.include_hidden and self.is_hidden(entry):
+                    self.skip('hidden')
+                    continue
+                if rules.ignored(relative_path):
+                    self.skip('ignored')
+                    continue
+                if self.max_file_bytes is not None and extension not in self.uncapped_extensions:
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        self.skip('error')
+                        continue
+                    if size > self.max_file_bytes:
+                        self.skip('too_large')
+                        continue
+                yield directory / entry.name
+            # папки в стек в обратном порядке, чтобы обходить их в порядке scandir
+            for entry, relative_path in reversed(subdirectories):
+                try:
+                    # os.stat, а не entry.stat: на Windows у записей scandir нет st_ino
+                    directory_stat = os.stat(entry.path)
+                except OSError:
+                    self.skip('error')
+                    continue
+                key = (directory_stat.st_dev, directory_stat.st_ino)
+                if key in visited:
+                    self.skip('symlink_loop')
+                    continue
+                visited.add(key)
+                stack.append((directory / entry.name, relative_path))
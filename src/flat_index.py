@@ -0,0 +1,279 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class FlatVectorIndex:
+    """ Плоский индекс эмбеддингов чанков в памяти процесса: матрица float32 (или float16) в .npy,
+    открытая через memory map, и JSON с id и метаданными строк.
+    Векторы нормируются один раз при добавлении, запрос - одно матрично-векторное произведение
+    и argpartition. Повторяет методы коллекции ChromaDB, которыми пользуются EmbeddingBatcher
+    и rerank_candidates (upsert, delete, get, count, name, configuration).
+    """
+
+    VECTORS_FILE = 'vectors.npy'
+    META_FILE = 'meta.json'
+    BLOCK_ROWS = 65536  # строк матрицы, переводимых во float32 за один шаг
+
+    def __init__(self, directory, name, dtype='float32'):
+        """ Конструктор индекса
+        args:
+            directory: папка с файлами индекса
+            name: имя индекса (аналог имени коллекции, используется в ключах манифеста)
+            dtype: тип хранения векторов на диске ('float32' или 'float16')
+        returns:
+        """
+        self.directory = str(directory)
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        # векторы нормированы, расстояние - косинусное, как у коллекций с SentenceTransformer
+        self.configuration = {'hnsw': {'space': 'cosine'}}
+        self.lock = threading.RLock()
+        self.matrix = None
+        self.ids = []
+        self.metadatas = []
+        self.dim = None
+        self._load()
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._index_paths()
+        self.pending = {}  # id -> (нормированный вектор float32, метаданные)
+        self.pending_of_path = {}  # путь -> id добавленных, но не сохранённых чанков
+        self.changed = False
+
+    def _load(self) -> None:
+        meta_path = os.path.join(self.directory, self.META_FILE)
+        vectors_path = os.path.join(self.directory, self.VECTORS_FILE)
+        if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+            return
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            matrix = np.load(vectors_path, mmap_mode='r')
+        except (OSError, ValueError):
+            # повреждённый индекс равносилен пустому: он будет перестроен
+            return
+        if matrix.shape[0] != len(meta['ids']) or matrix.dtype != self.dtype:
+            return
+        self.matrix = matrix
+        self.ids = meta['ids']
+        self.metadatas = meta['metadatas']
+        self.dim = matrix.shape[1] if matrix.ndim == 2 else None
+
+    def _index_paths(self) -> None:
+        """ Таблица путей сохранённых строк, считаемая один раз при загрузке и сохранении: код пути каждой строки
+        (int32), строки каждого пути (для delete по пути) и порядок строк по коду пути (для группировки reduceat) """
+        self.path_table = []
+        self.path_index = {}
+        self.rows_of_path = {}
+        codes = np.empty(len(self.ids), dtype=np.int32)
+        for row, metadata in enumerate(self.metadatas):
+            path = metadata.get('path')
+            code = self.path_index.get(path)
+            if code is None:
+                code = self.path_index[path] = len(self.path_table)
+                self.path_table.append(path)
+            codes[row] = code
+            self.rows_of_path.setdefault(path, []).append(row)
+        self.path_codes = codes
+        self.path_order = np.argsort(codes, kind='stable')
+        # начало группы каждого кода в path_order; коды идут подряд с нуля, так что группа i - это код i
+        self.path_starts = np.flatnonzero(np.diff(codes[self.path_order], prepend=-1))
+
+    def _pop_pending(self, chunk_id) -> None:
+        _, metadata = self.pending.pop(chunk_id)
+        chunk_ids = self.pending_of_path.get(metadata.get('path'))
+        chunk_ids.discard(chunk_id)
+        if not chunk_ids:
+            del self.pending_of_path[metadata.get('path')]
+
+    def count(self) -> int:
+        with self.lock:
+            return int(self.alive.sum()) + len(self.pending)
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        """ Добавить или заменить векторы чанков (тексты documents не хранятся) """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError('embeddings must be a 2-d array')
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        metadatas = metadatas or [{} for _ in ids]
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f'embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}')
+            for chunk_id, vector, metadata in zip(ids, vectors, metadatas):
+                row = self.row_of.pop(chunk_id, None)
+                if row is not None:
+                    self.alive[row] = False
+                if chunk_id in self.pending:
+                    self._pop_pending(chunk_id)
+                self.pending[chunk_id] = (vector, dict(metadata))
+                self.pending_of_path.setdefault(metadata.get('path'), set()).add(chunk_id)
+            self.changed = True
+
+    def delete(self, ids=None, where=None) -> None:
+        """ Удалить чанки по id или по равенству метаданных where={'path': ...} """
+        wanted = None if ids is None else set(ids)
+        with self.lock:
+            # кандидаты берутся из карт путь -> строки и id, полный перебор - только для других условий where
+            if where is not None and set(where) == {'path'}:
+                path = where['path']
+                candidates = [self.ids[row] for row in self.rows_of_path.get(path, ()) if self.alive[row]]
+                candidates += list(self.pending_of_path.get(path, ()))
+            elif wanted is not None:
+                candidates = list(wanted)
+            else:
+                candidates = list(self.row_of) + list(self.pending)
+            for chunk_id in candidates:
+                if wanted is not None and chunk_id not in wanted:
+                    continue
+                if chunk_id in self.pending:
+                    metadata = self.pending[chunk_id][1]
+                elif chunk_id in self.row_of:
+                    metadata = self.metadatas[self.row_of[chunk_id]]
+                else:
+                    continue
+                if where is not None and not all(metadata.get(key) == value for key, value in where.items()):
+                    continue
+                if chunk_id in self.pending:
+                    self._pop_pending(chunk_id)
+                else:
+                    self.alive[self.row_of.pop(chunk_id)] = False
+                self.changed = True
+
+    def get(self, ids=None, include=('embeddings',)) -> dict:
+        """ Векторы и метаданные чанков по id (отсутствующие пропускаются), без ids - всех чанков индекса """
+        with self.lock:
+            if ids is None:
+                ids = [chunk_id for chunk_id in self.ids if chunk_id in self.row_of] + list(self.pending)
+            found_ids, embeddings, metadatas = [], [], []
+            for chunk_id in ids:
+                if chunk_id in self.pending:
+                    vector, metadata = self.pending[chunk_id]
+                elif chunk_id in self.row_of:
+                    row = self.row_of[chunk_id]
+                    vector, metadata = np.asarray(self.matrix[row], dtype=np.float32), self.metadatas[row]
+                else:
+                    continue
+                found_ids.append(chunk_id)
+                embeddings.append(vector)
+                metadatas.append(metadata)
+        result = {'ids': found_ids}
+        if 'embeddings' in include:
+            result['embeddings'] = embeddings
+        if 'metadatas' in include:
+            result['metadatas'] = metadatas
+        return result
+
+    def save(self) -> None:
+        """ Атомарно переписать файлы индекса: живые строки и добавленные векторы одной матрицей """
+        with self.lock:
+            if not self.changed:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            live_rows = np.flatnonzero(self.alive)
+            ids = [self.ids[row] for row in live_rows] + list(self.pending)
+            metadatas = [self.metadatas[row] for row in live_rows] + [m for _, m in self.pending.values()]
+            vectors_path = os.path.join(self.directory, self.VECTORS_FILE)
+            tmp_path = os.path.join(self.directory, 'vectors.tmp.npy')
+            output = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=self.dtype,
+                                               shape=(len(ids), self.dim or 0))
+            for start in range(0, len(live_rows), self.BLOCK_ROWS):
+                block = live_rows[start:start + self.BLOCK_ROWS]
+                output[start:start + len(block)] = self.matrix[block]
+            if self.pending:
+                output[len(live_rows):] = np.stack([vector for vector, _ in self.pending.values()])
+            output.flush()
+            del output
+            self.matrix = None  # на Windows файл под отображением нельзя заменить
+            os.replace(tmp_path, vectors_path)
+            meta_tmp = os.path.join(self.directory, self.META_FILE + '.tmp')
+            with open(meta_tmp, 'w', encoding='utf-8') as file:
+                json.dump({'ids': ids, 'metadatas': metadatas}, file, ensure_ascii=False)
+            os.replace(meta_tmp, os.path.join(self.directory, self.META_FILE))
+            self.matrix = np.load(vectors_path, mmap_mode='r')
+            self.ids = ids
+            self.metadatas = metadatas
+            self.alive = np.ones(len(ids), dtype=bool)
+            self.row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+            self._index_paths()
+            self.pending = {}
+            self.pending_of_path = {}
+            self.changed = False
+
+    def _similarities(self, query_embedding):
+        """ Косинусная близость запроса ко всем строкам, удалённые строки - -inf
+        returns:
+            кортеж (близости, коды путей строк int32, таблица путей по коду, словарь путь -> код,
+                (порядок, начала групп) сохранённых строк)
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        with self.lock:
+            matrix, alive, codes, table = self.matrix, self.alive.copy(), self.path_codes, self.path_table
+            index = self.path_index
+            groups = (self.path_order, self.path_starts)
+            pending = list(self.pending.values())
+            if pending:
+                # пути несохранённых строк, которых ещё нет в таблице, получают коды после неё
+                extra = {}
+                pending_codes = np.empty(len(pending), dtype=np.int32)
+                for i, (_, metadata) in enumerate(pending):
+                    path = metadata.get('path')
+                    code = self.path_index.get(path)
+                    if code is None:
+                        code = extra.setdefault(path, len(table) + len(extra))
+                    pending_codes[i] = code
+                codes = np.concatenate([codes, pending_codes])
+                if extra:
+                    table = table + list(extra)
+                    index = {**index, **extra}
+        stored = len(alive)
+        scores = np.empty(stored + len(pending), dtype=np.float32)
+        for start in range(0, stored, self.BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + self.BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        scores[:stored][~alive] = -np.inf
+        if pending:
+            scores[stored:] = np.stack([vector for vector, _ in pending]) @ query
+        return scores, codes, table, index, groups
+
+    def search(self, query_embedding, k) -> list:
+        """ k ближайших чанков: список (путь, косинусное расстояние) по возрастанию расстояния """
+        scores, codes, table, _, _ = self._similarities(query_embedding)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(table[codes[row]], float(1.0 - scores[row])) for row in top]
+
+    def best_documents(self, query_embedding, results_count, allowed_paths=None) -> dict:
+        """ Лучшие документы: близость документа - максимум по его чанкам, как в find_documents
+        returns:
+            distances(dict): словарь вида { 'путь': косинусное расстояние лучшего чанка }
+        """
+        scores, codes, table, index, (order, starts) = self._similarities(query_embedding)
+        if not len(scores):
+            return {}
+        best = np.full(len(table), -np.inf, dtype=np.float32)
+        stored = len(order)
+        if stored:
+            best[:len(starts)] = np.maximum.reduceat(scores[:stored][order], starts)
+        if len(scores) > stored:
+            np.maximum.at(best, codes[stored:], scores[stored:])
+        if allowed_paths is not None:
+            allowed = np.zeros(len(table), dtype=bool)
+            allowed[[index[path] for path in allowed_paths if path in index]] = True
+            best[~allowed] = -np.inf
+        k = min(results_count, int(np.isfinite(best).sum()))
+        if k <= 0:
+            return {}
+        top = np.argpartition(-best, k - 1)[:k]
+        return {table[i]: float(1.0 - best[i]) for i in top}
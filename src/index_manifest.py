@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# блокировки файлов ОС не разделяют потоки одного процесса, поэтому сохранения в процессе
+# дополнительно сериализуются общей на путь манифеста блокировкой
+_save_locks = {}
+_save_locks_lock = threading.Lock()
+
+
+@contextmanager
+def locked_file(path):
+    """ Исключительная блокировка файла path (создаётся при необходимости) для потоков и процессов """
+    with _save_locks_lock:
+        thread_lock = _save_locks.setdefault(os.path.abspath(path), threading.Lock())
+    with thread_lock, open(path, 'a+b') as file:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK ждёт около 10 секунд и сдаётся исключением - ждём дальше
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class IndexManifest:
+    """ Манифест проиндексированных файлов.
+    Хранит для каждой коллекции отпечаток исходного файла (путь, размер, mtime, хэш содержимого),
+    параметры разбиения и имя модели, чтобы неизменённые файлы не индексировались повторно.
+    Манифест общий для всех папок хранилища, и его одновременно ведут несколько объектов (поиски, DocumentStore,
+    другие процессы), поэтому save записывает поверх файла на диске только ключи, изменённые этим объектом.
+    """
+
+    FILE_NAME = 'index_manifest.json'
+
+    def __init__(self, storage_path):
+        """ Конструктор манифеста
+        args:
+            storage_path: папка, в которой хранятся данные ChromaDB
+        returns:
+        """
+        self.manifest_path = os.path.join(storage_path, self.FILE_NAME)
+        self.lock_path = self.manifest_path + '.lock'
+        self.entries = self._load()
+        self.dirty = {}  # ключ -> новая запись или None для удалённой, ещё не сохранённые
+        self.changed = False
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            # повреждённый манифест равносилен пустому: всё будет переиндексировано
+            return {}
+
+    def save(self) -> None:
+        """ Метод для атомарной записи манифеста на диск (только если были изменения).
+        Под блокировкой файла манифест перечитывается, и в него вносятся только изменения этого объекта,
+        так что записи, сохранённые с тех пор другими объектами и процессами, не теряются
+        """
+        if not self.changed:
+            return
+        with locked_file(self.lock_path):
+            entries = self._load()
+            for key, entry in self.dirty.items():
+                if entry is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = entry
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(entries, file, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+        self.entries = entries
+        self.dirty = {}
+        self.changed = False
+
+    @staticmethod
+    def content_hash(path) -> str:
+        """ Метод для вычисления sha256 содержимого файла блоками по 1 МБ """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_fresh(self, key, path: Path, chunk_length, model_name, chunking=None) -> bool:
+        """ Метод для проверки, что коллекция key построена по текущей версии файла
+        args:
+            key: имя коллекции (или другой ключ хранилища)
+            path: полный путь до файла
+            chunk_length: длина чанка, с которой строится индекс
+            model_name: имя модели эмбеддингов
+            chunking: остальные параметры разбиения (перекрытие и т.п.), None - значения по умолчанию
+        returns:
+            bool: True, если файл можно не переиндексировать
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if (entry['path'] != str(Path(path).resolve()) or entry['chunk_length'] != chunk_length
+                or entry['model'] != model_name or entry.get('chunking') != chunking):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime']:
+            return True
+        # mtime изменился, но размер тот же - сверяем содержимое
+        if self.content_hash(path) != entry['hash']:
+            return False
+        entry['mtime'] = stat.st_mtime_ns
+        self.dirty[key] = entry
+        self.changed = True
+        return True
+
+    @staticmethod
+    def file_stat(path):
+        """ Размер и mtime файла - снимок, который берётся до чтения файла для индексации (None, если файла нет) """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def update(self, key, path: Path, chunk_length, model_name, content_hash=None, chunking=None,
+               expected_stat=None) -> bool:
+        """ Метод для записи отпечатка только что проиндексированного файла
+        (content_hash - уже посчитанный хэш содержимого, чтобы не читать файл повторно).
+        expected_stat - снимок file_stat, взятый до чтения файла: если файл с тех пор изменился, чанки построены
+        по старой версии, и запись не обновляется, чтобы следующий поиск переиндексировал файл
+        returns:
+            bool: записан ли отпечаток
+        """
+        stat = os.stat(path)
+        if expected_stat is not None and (stat.st_size, stat.st_mtime_ns) != tuple(expected_stat):
+            return False
+        entry = {
+            'path': str(Path(path).resolve()),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': content_hash or self.content_hash(path),
+            'chunk_length': chunk_length,
+            'model': model_name,
+        }
+        if chunking is not None:
+            entry['chunking'] = chunking
+        self.entries[key] = entry
+        self.dirty[key] = entry
+        self.changed = True
+        return True
+
+    def remove(self, key) -> None:
+        """ Метод для удаления записи из манифеста """
+        if self.entries.pop(key, None) is not None:
+            self.dirty[key] = None
+            self.changed = True
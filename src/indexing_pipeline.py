@@ -0,0 +1,348 @@
+""" Конвейер индексации с ограниченными очередями и общим бюджетом памяти.
+
+Этапы работают в своих потоках и соединены очередями ограниченной длины:
+    извлечение -> разбиение и нормализация -> эмбеддинг -> запись в хранилище
+Чтение файлов с диска идёт одновременно с работой модели, а тексты, чанки и векторы, которые уже
+получены, но ещё не записаны, занимают бюджет памяти: когда он исчерпан, извлечение следующего документа
+ждёт, пока запись не освободит место (backpressure), вместо того чтобы держать в памяти всю папку.
+"""
+import logging
+import queue
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+_POLL_SECONDS = 0.1
+_DONE = object()  # метка конца потока элементов этапа
+
+
+class PipelineStopped(Exception):
+    """ Конвейер остановлен (ошибка в другом этапе или отмена) """
+
+
+class MemoryBudget:
+    """ Счётчик байт, занятых элементами в конвейере. acquire ждёт, пока хватит места;
+    элемент больше всего бюджета пропускается, только когда конвейер пуст, иначе он ждал бы вечно
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BUDGET, stop_event: threading.Event = None):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.peak = 0
+        self.waits = 0  # сколько раз этапы ждали освобождения памяти
+        self.stop_event = stop_event or threading.Event()
+        self.condition = threading.Condition()
+
+    def acquire(self, size, block=True) -> None:
+        """ Занять size байт; block=False - занять сразу, даже сверх бюджета """
+        with self.condition:
+            if block and self.used and self.used + size > self.max_bytes:
+                self.waits += 1
+                while self.used and self.used + size > self.max_bytes:
+                    if self.stop_event.is_set():
+                        raise PipelineStopped()
+                    self.condition.wait(_POLL_SECONDS)
+            self.used += size
+            self.peak = max(self.peak, self.used)
+
+    def release(self, size) -> None:
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+def text_size(text) -> int:
+    return sys.getsizeof(text)
+
+
+class _Document:
+    """ Состояние документа в конвейере: запись завершена, когда нормализация закончилась
+    и все его чанки записаны """
+
+    def __init__(self, relative_path):
+        self.relative_path = relative_path
+        self.on_written = None
+        self.pending_chunks = 0
+        self.finished = False
+        self.seconds = 0.0
+
+
+class IndexingPipeline:
+    """ Многопоточный конвейер индексации документов. Повторяет статистику EmbeddingBatcher
+    (chunks_embedded, batches, embed_seconds, upsert_seconds, report), чтобы её можно было учитывать так же
+    """
+
+    def __init__(self, embedding_function, embedding_cache=None, batch_chunks=256, batch_chars=100_000,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, queue_size=8, normalizer_workers=1, embedder_workers=1):
+        """ Конструктор конвейера
+        args:
+            embedding_function: функция эмбеддингов (список строк -> список векторов)
+            embedding_cache: EmbeddingCache, к которому обращаются до вызова модели (None - без кэша)
+            batch_chunks, batch_chars: размеры пачки эмбеддинга, как у EmbeddingBatcher
+            memory_budget: сколько байт могут занимать прочитанные, но ещё не записанные данные
+            queue_size: длина очереди между соседними этапами
+            normalizer_workers: потоков разбиения и нормализации
+            embedder_workers: потоков, одновременно вызывающих модель
+        returns:
+        """
+        self.embedding_function = embedding_function
+        self.embedding_cache = embedding_cache
+        self.batch_chunks = batch_chunks
+        self.batch_chars = batch_chars
+        self.queue_size = queue_size
+        self.normalizer_workers = max(1, normalizer_workers)
+        self.embedder_workers = max(1, embedder_workers)
+        self.stop_event = threading.Event()
+        self.budget = MemoryBudget(memory_budget, self.stop_event)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.chunks_embedded = 0
+        self.batches = 0
+        self.embed_seconds = 0.0
+        self.upsert_seconds = 0.0
+
+    def put(self, target: queue.Queue, item) -> None:
+        while True:
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, source: queue.Queue, block=True):
+        while True:
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+            try:
+                return source.get(timeout=_POLL_SECONDS) if block else source.get_nowait()
+            except queue.Empty:
+                if not block:
+                    raise
+
+    def run(self, documents, make_job, cancel_event=None, on_document=None) -> int:
+        """ Проиндексировать документы
+        args:
+            documents: итерируемое из пар (относительный путь, части документа); перебирается в отдельном потоке
+            make_job: make_job(относительный путь, части) -> генератор кортежей (коллекция, id, текст, метаданные),
+                который по завершении возвращает callback, вызываемый после записи всех чанков документа
+            cancel_event: threading.Event, установка которого останавливает конвейер (SearchCancelled вызывающего кода)
+            on_document: on_document(относительный путь, секунды) - вызывается в текущем потоке после записи
+                каждого документа
+        returns:
+            int: число записанных документов; при отмене возвращается досрочно, ошибка этапа пробрасывается
+        """
+        extracted = queue.Queue(self.queue_size)
+        normalized = queue.Queue(self.queue_size)
+        embedded = queue.Queue(self.queue_size)
+        written = queue.Queue()
+        self.normalizers_left = self.normalizer_workers
+        self.embedders_left = self.embedder_workers
+        stages = [threading.Thread(target=self.stage, args=(self.extract, documents, extracted),
+                                   name='pipeline-extract', daemon=True)]
+        stages += [threading.Thread(target=self.stage, args=(self.normalize, extracted, normalized, make_job, written),
+                                    name=f'pipeline-normalize-{i}', daemon=True)
+                   for i in range(self.normalizer_workers)]
+        stages += [threading.Thread(target=self.stage, args=(self.embed, normalized, embedded),
+                                    name=f'pipeline-embed-{i}', daemon=True)
+                   for i in range(self.embedder_workers)]
+        stages.append(threading.Thread(target=self.stage, args=(self.write, embedded, written),
+                                       name='pipeline-write', daemon=True))
+        for thread in stages:
+            thread.start()
+
+        done = 0
+        writer = stages[-1]
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return done
+                try:
+                    document = written.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if not writer.is_alive() and written.empty():
+                        break
+                    continue
+                if document is _DONE:
+                    break
+                # callback-и (обновление манифеста) выполняются в вызывающем потоке
+                if document.on_written is not None:
+                    document.on_written()
+                done += 1
+                if on_document is not None:
+                    on_document(document.relative_path, document.seconds)
+        finally:
+            # после нормального завершения этапы уже вышли, иначе (отмена, ошибка) их нужно остановить
+            self.stop_event.set()
+            for thread in stages:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return done
+
+    def stage(self, work, *args) -> None:
+        try:
+            work(*args)
+        except PipelineStopped:
+            pass
+        except BaseException as error:
+            with self.lock:
+                self.errors.append(error)
+            self.stop_event.set()
+
+    def extract(self, documents, output: queue.Queue) -> None:
+        try:
+            for relative_path, segments in documents:
+                # части, уже прочитанные целиком (из дочерних процессов), занимают бюджет до конца нормализации;
+                # ленивые (страницы PDF, окна текстовых файлов) читаются этапом нормализации
+                size = sum(text_size(text) for _, text in segments) if isinstance(segments, list) else 0
+                self.budget.acquire(size)
+                self.put(output, (relative_path, segments, size))
+        finally:
+            for _ in range(self.normalizer_workers):
+                self.put(output, _DONE)
+
+    def normalize(self, source: queue.Queue, output: queue.Queue, make_job, written: queue.Queue) -> None:
+        try:
+            while True:
+                item = self.get(source)
+                if item is _DONE:
+                    return
+                relative_path, segments, size = item
+                document = _Document(relative_path)
+                start = time.perf_counter()
+                try:
+                    job = make_job(relative_path, segments)
+                    batch, batch_chars = [], 0
+                    while True:
+                        try:
+                            collection, chunk_id, text, metadata = next(job)
+                        except StopIteration as stop:
+                            document.on_written = stop.value
+                            break
+                        # ждёт только извлечение: этапы после него не блокируются на бюджете, иначе документ,
+                        # занявший бюджет, ждал бы сам себя
+                        chunk_size = text_size(text)
+                        self.budget.acquire(chunk_size, block=False)
+                        batch.append((document, collection, chunk_id, text, metadata, chunk_size))
+                        batch_chars += len(text)
+                        if len(batch) >= self.batch_chunks or batch_chars >= self.batch_chars:
+                            self.emit(output, document, batch)
+                            batch, batch_chars = [], 0
+                    if batch:
+                        self.emit(output, document, batch)
+                finally:
+                    self.budget.release(size)
+                document.seconds = time.perf_counter() - start
+                with self.lock:
+                    document.finished = True
+                    complete = document.pending_chunks == 0
+                if complete:
+                    self.put(written, document)
+        finally:
+            # пачки уходят по одной на поток эмбеддинга, последний поток нормализации дописывает метки конца
+            with self.lock:
+                self.normalizers_left -= 1
+                last = self.normalizers_left == 0
+            if last:
+                for _ in range(self.embedder_workers):
+                    self.put(output, _DONE)
+
+    def emit(self, output: queue.Queue, document: _Document, batch) -> None:
+        with self.lock:
+            document.pending_chunks += len(batch)
+        self.put(output, batch)
+
+    def embed(self, source: queue.Queue, output: queue.Queue) -> None:
+        try:
+            finished = False
+            while not finished:
+                batch = self.get(source)
+                if batch is _DONE:
+                    return
+                # пачки документов из очереди объединяются до размера пачки модели
+                chars = sum(len(text) for _, _, _, text, _, _ in batch)
+                while len(batch) < self.batch_chunks and chars < self.batch_chars:
+                    try:
+                        more = self.get(source, block=False)
+                    except queue.Empty:
+                        break
+                    if more is _DONE:
+                        finished = True
+                        break
+                    batch = batch + more
+                    chars += sum(len(text) for _, _, _, text, _, _ in more)
+                start = time.perf_counter()
+                texts = [text for _, _, _, text, _, _ in batch]
+                if self.embedding_cache is not None:
+                    embeddings = self.embedding_cache.embed(texts, self.embedding_function)
+                else:
+                    embeddings = self.embedding_function(texts)
+                seconds = time.perf_counter() - start
+                vectors_size = sum(getattr(vector, 'nbytes', 0) for vector in embeddings)
+                # векторы уже посчитаны: они занимают бюджет без ожидания, освободит их запись
+                self.budget.acquire(vectors_size, block=False)
+                with self.lock:
+                    self.embed_seconds += seconds
+                    self.chunks_embedded += len(batch)
+                    self.batches += 1
+                self.put(output, (batch, embeddings, vectors_size))
+        finally:
+            with self.lock:
+                self.embedders_left -= 1
+                last = self.embedders_left == 0
+            if last:
+                self.put(output, _DONE)
+
+    def write(self, source: queue.Queue, written: queue.Queue) -> None:
+        try:
+            while True:
+                item = self.get(source)
+                if item is _DONE:
+                    return
+                batch, embeddings, vectors_size = item
+                start = time.perf_counter()
+                groups = {}
+                for (_, collection, chunk_id, text, metadata, _), embedding in zip(batch, embeddings):
+                    group = groups.setdefault(id(collection), (collection, [], [], [], []))
+                    group[1].append(chunk_id)
+                    group[2].append(text)
+                    group[3].append(metadata)
+                    group[4].append(embedding)
+                for collection, ids, texts, metadatas, group_embeddings in groups.values():
+                    collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=group_embeddings)
+                with self.lock:
+                    self.upsert_seconds += time.perf_counter() - start
+                self.budget.release(vectors_size + sum(chunk_size for *_, chunk_size in batch))
+                completed = []
+                with self.lock:
+                    for document, *_ in batch:
+                        document.pending_chunks -= 1
+                        if document.finished and document.pending_chunks == 0:
+                            completed.append(document)
+                for document in completed:
+                    self.put(written, document)
+        finally:
+            written.put(_DONE)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks_embedded / self.embed_seconds if self.embed_seconds else 0.0
+
+    def report(self) -> str:
+        """ Строка со статистикой пропускной способности и памяти """
+        report = (f'embedded {self.chunks_embedded} chunks in {self.batches} batches: '
+                  f'{self.chunks_per_second:.1f} chunks/s (embed {self.embed_seconds:.2f}s, '
+                  f'upsert {self.upsert_seconds:.2f}s), memory peak {self.budget.peak / 2 ** 20:.1f} MiB '
+                  f'of {self.budget.max_bytes / 2 ** 20:.1f} MiB, {self.budget.waits} waits')
+        if self.embedding_cache is not None:
+            report += f', cache {self.embedding_cache.hits} hits / {self.embedding_cache.misses} misses'
+        return report
+
+    def log_report(self) -> None:
+        if self.chunks_embedded:
+            logger.info(self.report())
@@ -0,0 +1,152 @@
+""" Метрики одного запуска поиска: время этапов, счётчики и самые медленные файлы.
+Подписчики (hooks) получают SearchMetrics после каждого find_documents; готовые подписчики
+пишут метрики JSON-строкой в лог или файлом в текстовом формате Prometheus.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+
+class SearchMetrics:
+    """ Накопитель метрик одного запуска find_documents """
+
+    def __init__(self, folder=None, request=None):
+        self.folder = str(folder) if folder is not None else None
+        self.request = request
+        self.stages = {}  # этап -> суммарное время в секундах
+        self.counts = {}  # счётчик -> значение (files, bytes, chunks, tokens, ...)
+        self.file_seconds = {}  # относительный путь -> время извлечения и разбиения файла
+        self.started = time.perf_counter()
+        self.total_seconds = None
+        self.status = 'running'
+        # этапы конвейера индексации пишут метрики из нескольких потоков
+        self.lock = threading.Lock()
+
+    def add_time(self, stage, seconds) -> None:
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """ Контекстный менеджер, добавляющий время блока к этапу name """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        """ Обернуть итератор так, чтобы ожидание каждого элемента считалось временем этапа name """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, value=1) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_file_time(self, path, seconds) -> None:
+        path = str(path)
+        with self.lock:
+            self.file_seconds[path] = self.file_seconds.get(path, 0.0) + seconds
+
+    def outliers(self, limit=5) -> list:
+        """ Самые медленные файлы: список (путь, секунды) по убыванию времени """
+        return sorted(self.file_seconds.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def finish(self, status='ok') -> None:
+        self.total_seconds = time.perf_counter() - self.started
+        self.status = status
+
+    def to_dict(self) -> dict:
+        return {
+            'folder': self.folder,
+            'request': self.request,
+            'status': self.status,
+            'total_seconds': round(self.total_seconds or 0.0, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counts': dict(self.counts),
+            'outliers': [{'path': path, 'seconds': round(seconds, 6)} for path, seconds in self.outliers()],
+        }
+
+    def to_json_line(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_prometheus(self, prefix='docsearch') -> str:
+        """ Метрики в текстовом формате Prometheus (для node_exporter textfile collector) """
+        lines = [
+            f'# HELP {prefix}_search_seconds Wall time of the last search.',
+            f'# TYPE {prefix}_search_seconds gauge',
+            f'{prefix}_search_seconds{{status="{self.status}"}} {self.total_seconds or 0.0:.6f}',
+            f'# HELP {prefix}_stage_seconds Wall time of each search stage.',
+            f'# TYPE {prefix}_stage_seconds gauge',
+        ]
+        lines += [f'{prefix}_stage_seconds{{stage="{name}"}} {seconds:.6f}' for name, seconds in self.stages.items()]
+        lines += [
+            f'# HELP {prefix}_items Items processed by the last search.',
+            f'# TYPE {prefix}_items gauge',
+        ]
+        lines += [f'{prefix}_items{{kind="{name}"}} {value}' for name, value in self.counts.items()]
+        lines += [
+            f'# HELP {prefix}_slowest_file_seconds Slowest files of the last search.',
+            f'# TYPE {prefix}_slowest_file_seconds gauge',
+        ]
+        for path, seconds in self.outliers():
+            escaped = path.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            lines.append(f'{prefix}_slowest_file_seconds{{path="{escaped}"}} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def add_hook(hook) -> None:
+    """ Подписать hook(metrics) на метрики всех запусков поиска в процессе """
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook) -> None:
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def publish(metrics: SearchMetrics, hooks=()) -> None:
+    """ Передать метрики глобальным и переданным подписчикам; ошибка подписчика не ломает поиск """
+    with _hooks_lock:
+        all_hooks = list(_hooks)
+    for hook in all_hooks + list(hooks):
+        try:
+            hook(metrics)
+        except Exception:
+            logger.exception('metrics hook %r failed', hook)
+
+
+def json_log_hook(target_logger=logger, level=logging.INFO):
+    """ Подписчик, пишущий метрики одной JSON-строкой в лог """
+    def hook(metrics: SearchMetrics):
+        target_logger.log(level, metrics.to_json_line())
+    return hook
+
+
+def prometheus_file_hook(path, prefix='docsearch'):
+    """ Подписчик, атомарно перезаписывающий файл path метриками в формате Prometheus """
+    def hook(metrics: SearchMetrics):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(metrics.to_prometheus(prefix))
+        os.replace(tmp_path, path)
+    return hook
@@ -0,0 +1,111 @@
+from collections import Counter
+import heapq
+import math
+import sqlite3
+import threading
+
+
+class InvertedIndex:
+    """ Персистентный инвертированный индекс лемматизированных чанков для BM25.
+    Хранится в SQLite: для каждого терма - постинги (id чанка, частота терма в чанке),
+    для каждого чанка - путь документа и длина в токенах.
+    """
+
+    def __init__(self, db_path, k1=1.5, b=0.75):
+        """ Конструктор индекса
+        args:
+            db_path: путь до файла базы SQLite
+            k1, b: параметры BM25
+        returns:
+        """
+        self.db_path = str(db_path)
+        self.k1 = k1
+        self.b = b
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        # одно соединение может использоваться из нескольких потоков (сервис поиска), операции сериализуются
+        self.lock = threading.RLock()
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, path TEXT NOT NULL, length INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);
+            CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                                                 PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+        ''')
+
+    def add_chunk(self, chunk_id, path, tokens) -> None:
+        """ Добавить (или заменить) чанк с его токенами """
+        with self.lock:
+            self.connection.execute('DELETE FROM postings WHERE chunk_id = ?', (chunk_id,))
+            self.connection.execute('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)', (chunk_id, path, len(tokens)))
+            self.connection.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                                        [(term, chunk_id, tf) for term, tf in Counter(tokens).items()])
+
+    def delete_path(self, path) -> None:
+        """ Удалить все чанки документа """
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE path = ?)', (path,))
+            self.connection.execute('DELETE FROM chunks WHERE path = ?', (path,))
+
+    def chunk_terms(self, chunk_ids) -> dict:
+        """ Частоты термов чанков: словарь вида { id чанка: {терм: частота} } """
+        chunk_ids = list(chunk_ids)
+        terms = {chunk_id: {} for chunk_id in chunk_ids}
+        with self.lock:
+            # не больше 500 параметров в одном запросе (ограничение SQLite)
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                rows = self.connection.execute(
+                    f'SELECT chunk_id, term, tf FROM postings WHERE chunk_id IN ({",".join("?" * len(batch))})',
+                    batch).fetchall()
+                for chunk_id, term, tf in rows:
+                    terms[chunk_id][term] = tf
+        return terms
+
+    def chunk_count(self) -> int:
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+
+    def commit(self) -> None:
+        with self.lock:
+            self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def search(self, tokens, limit, allowed_paths=None) -> list:
+        """ Найти чанки с наибольшим BM25 для токенов запроса
+        args:
+            tokens: лемматизированные токены запроса
+            limit: сколько кандидатов вернуть
+            allowed_paths: если задано, чанки других документов пропускаются
+        returns:
+            candidates(list): список (id чанка, путь, score) по убыванию score
+        """
+        with self.lock:
+            total, average_length = self.connection.execute('SELECT COUNT(*), AVG(length) FROM chunks').fetchone()
+            if not total:
+                return []
+            term_postings = [
+                self.connection.execute(
+                    'SELECT p.chunk_id, p.tf, c.length, c.path FROM postings p '
+                    'JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term = ?', (term,)).fetchall()
+                for term in set(tokens)
+            ]
+        allowed = set(allowed_paths) if allowed_paths is not None else None
+        scores = {}
+        paths = {}
+        for postings in term_postings:
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf, length, path in postings:
+                if allowed is not None and path not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                paths[chunk_id] = path
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(chunk_id, paths[chunk_id], score) for chunk_id, score in best]
@@ -1,7 +1,11 @@
 import flet
 import os
+import threading
 from src.ui.layout import create_main_layout
-from src.document_search import RelevantDocumentsSearch
+from src.document_search import RelevantDocumentsSearch, SearchCancelled
+from src.result_cache import ResultCache
+from src.instrumentation import add_hook, json_log_hook
+from src.resource_registry import default_storage_path
 
 def main(page: flet.Page):
     """Точка входа в приложение и управление состояниями.
@@ -17,6 +21,11 @@ def main(page: flet.Page):
 
     # переменная для хранения пути
     current_directory = None
+    # событие отмены текущего поиска (None, если поиск не идёт)
+    current_search = None
+    # повторные запросы по неизменённой папке берутся из кэша, он переживает перезапуск приложения
+    os.makedirs(default_storage_path(), exist_ok=True)
+    result_cache = ResultCache(persist_path=os.path.join(default_storage_path(), 'result_cache.json'))
 
     def show_message(text, color=flet.Colors.BLUE_400):
         """Отобразить всплывающее уведомление пользователю.
@@ -35,20 +44,29 @@ def main(page: flet.Page):
         snack.open = True
         page.update()
 
-    def get_database_results(query, folder_path):
+    def get_database_results(query, folder_path, progress_callback=None, cancel_event=None):
         """Поиск по векторной базе данных и получение релевантных документов.
 
         query (str): поисковый запрос.
         folder_path (str): путь к папке для поиска.
+        progress_callback (function): получает (done, total, ranking) по ходу поиска.
+        cancel_event (threading.Event): установленное событие прерывает поиск.
         """
 
         if not folder_path:
             return []
         
-        search_instance = RelevantDocumentsSearch(folder_path, query)
-        docs = search_instance.find_documents()
+        search_instance = RelevantDocumentsSearch(folder_path, query, result_cache=result_cache)
+        docs = search_instance.find_documents(progress_callback, cancel_event)
         return [os.path.join(folder_path, doc) for doc in docs]
 
+    def cancel_current_search():
+        """Отменить выполняющийся поиск, если он есть."""
+        nonlocal current_search
+        if current_search is not None:
+            current_search.set()
+            current_search = None
+
 
     def handle_folder_result(e: flet.FilePickerResultEvent):
         """Обработать результат выбора директории пользователем.
@@ -71,11 +89,12 @@ def main(page: flet.Page):
         search_field.value = ""
         show_message("Results cleared", color=flet.Colors.GREY_700)
 
-    def update_results(file_paths):
+    def update_results(file_paths, final=True):
         """Отобразить найденные файлы в списке в заданном порядке.
         Очищает предыдущие результаты и создает интерактивные карточки для новых путей.
 
         file_paths (list[str]): Массив строк с абсолютными путями к файлам.
+        final (bool): False для промежуточного рейтинга, пока поиск ещё идёт.
 
         Пример:
             >>> update_results(['C:/file1.pdf', 'C:/file2.docx'])
@@ -84,8 +103,9 @@ def main(page: flet.Page):
         results_area.controls.clear()
 
         if not file_paths:
-            show_message("No matches found", color=flet.Colors.ORANGE_700)
-            results_area.controls.append(flet.Text("No files found", color=flet.Colors.RED_400))
+            if final:
+                show_message("No matches found", color=flet.Colors.ORANGE_700)
+                results_area.controls.append(flet.Text("No files found", color=flet.Colors.RED_400))
         else:
             for path in file_paths:
                 file_name = os.path.basename(path)
@@ -104,12 +124,49 @@ def main(page: flet.Page):
                 )
         page.update()
 
+    def run_search(search_query, folder_path, cancel_event):
+        """Выполнить поиск в фоновом потоке, обновляя прогресс и промежуточные результаты.
+        Результаты отменённого поиска на экран не попадают.
+
+        search_query (str): поисковый запрос.
+        folder_path (str): путь к папке для поиска.
+        cancel_event (threading.Event): событие отмены этого поиска.
+        """
+        nonlocal current_search
+
+        def on_progress(done, total, ranking):
+            if cancel_event.is_set():
+                return
+            loader.value = done / total if total else None
+            if ranking is not None:
+                update_results([os.path.join(folder_path, doc) for doc in ranking], final=False)
+            else:
+                page.update()
+
+        try:
+            db_results = get_database_results(search_query, folder_path, on_progress, cancel_event)
+        except SearchCancelled:
+            return
+        except Exception as error:
+            if not cancel_event.is_set():
+                current_search = None
+                loader.visible = False
+                show_message(f"Search failed: {error}", color=flet.Colors.RED_400)
+            return
+
+        if cancel_event.is_set():
+            return
+        current_search = None
+        loader.visible = False
+        update_results(db_results)
+
     def handle_search(e):
-        """Запустить процесс поиска и визуализировать состояние загрузки.
-        Управляет видимостью ProgressBar и передает данные для отрисовки.
+        """Запустить процесс поиска в фоновом потоке и визуализировать его прогресс.
+        Предыдущий незавершённый поиск отменяется.
 
         e (any): Событие нажатия кнопки или клавиши Enter.
         """
+        nonlocal current_search
 
         if not search_field.value:
             show_message("Please enter a search term", color=flet.Colors.RED_400)
@@ -119,18 +176,33 @@ def main(page: flet.Page):
             show_message("Please select a folder first", color=flet.Colors.ORANGE_700)
             return
 
+        cancel_current_search()
+        current_search = threading.Event()
+
+        loader.value = 0
         loader.visible = True
         page.update()
 
-        search_query = search_field.value
-        db_results = get_database_results(search_query, current_directory)
+        page.run_thread(run_search, search_field.value, current_directory, current_search)
 
-        loader.visible = False
-        update_results(db_results)
+    def handle_query_change(e):
+        """Отменить выполняющийся поиск, когда пользователь начинает вводить новый запрос.
+
+        e (flet.ControlEvent): Событие изменения текста в поле поиска.
+        """
+
+        if current_search is not None:
+            cancel_current_search()
+            loader.visible = False
+            page.update()
 
-    layout, search_field, results_area, selected_path_label, loader = create_main_layout(page, handle_search, handle_folder_result, handle_clear)
+    layout, search_field, results_area, selected_path_label, loader = create_main_layout(
+        page, handle_search, handle_folder_result, handle_clear, handle_query_change)
 
     page.add(layout)
 
 if __name__ == "__main__":
+    # метрики каждого поиска (время этапов, счётчики, медленные файлы) пишутся JSON-строкой в лог;
+    # подписчик глобальный, поэтому регистрируется один раз на процесс, а не в каждой сессии main
+    add_hook(json_log_hook())
     flet.app(target=main)
@@ -0,0 +1,148 @@
+""" Обслуживание хранилища индексов: сборка мусора и сжатие.
+
+Удаляет коллекции и чанки файлов, которых больше нет на диске, коллекции, инвертированные
+и плоские индексы, на которые не ссылается манифест, затем сжимает базы SQLite (VACUUM)
+и сообщает, сколько места освобождено.
+
+Запуск из корня репозитория:
+    python -m src.maintenance [--storage ПАПКА] [--dry-run]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+
+from src.flat_index import FlatVectorIndex
+from src.index_manifest import IndexManifest
+from src.inverted_index import InvertedIndex
+from src.resource_registry import default_storage_path, get_client
+
+BM25_SUFFIX = '.bm25.sqlite3'
+FLAT_SUFFIX = '.flat'
+CHROMA_DATABASE = 'chroma.sqlite3'
+
+
+def directory_size(path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def vacuum(database_path) -> bool:
+    """ Сжать базу SQLite; False, если база занята другим процессом """
+    try:
+        connection = sqlite3.connect(database_path, timeout=5)
+        try:
+            connection.execute('VACUUM')
+        finally:
+            connection.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def compact(storage_path=None, dry_run=False) -> dict:
+    """ Собрать мусор в хранилище индексов
+    args:
+        storage_path: папка хранилища (по умолчанию папка приложения)
+        dry_run: только посчитать, что было бы удалено
+    returns:
+        report(dict): удалённые коллекции, документы и файлы, размер хранилища до и после
+    """
+    from chromadb.errors import NotFoundError
+    storage_path = storage_path or default_storage_path()
+    report = {'storage': storage_path, 'dry_run': dry_run, 'bytes_before': directory_size(storage_path),
+              'collections_dropped': 0, 'documents_dropped': 0, 'files_removed': 0, 'vacuumed': []}
+    manifest = IndexManifest(storage_path)
+    client = get_client(storage_path)
+
+    # 1. записи манифеста об исчезнувших файлах
+    dead_documents = {}  # общая коллекция -> пути удалённых документов
+    for key, entry in list(manifest.entries.items()):
+        if os.path.exists(entry['path']):
+            continue
+        if '/' in key:
+            collection_name, path_str = key.split('/', 1)
+            dead_documents.setdefault(collection_name, []).append(path_str)
+        else:
+            report['collections_dropped'] += 1
+            if not dry_run:
+                try:
+                    client.delete_collection(key)
+                except NotFoundError:
+                    pass
+        if not dry_run:
+            manifest.remove(key)
+    for collection_name, paths in dead_documents.items():
+        report['documents_dropped'] += len(paths)
+        if dry_run:
+            continue
+        bm25_path = os.path.join(storage_path, collection_name.removesuffix(FLAT_SUFFIX) + BM25_SUFFIX)
+        inverted_index = InvertedIndex(bm25_path) if os.path.exists(bm25_path) else None
+        if collection_name.endswith(FLAT_SUFFIX):
+            collection = FlatVectorIndex(os.path.join(storage_path, collection_name), collection_name)
+        else:
+            try:
+                collection = client.get_collection(collection_name)
+            except NotFoundError:
+                collection = None
+        for path_str in paths:
+            if collection is not None:
+                collection.delete(where={'path': path_str})
+            if inverted_index is not None:
+                inverted_index.delete_path(path_str)
+        if isinstance(collection, FlatVectorIndex):
+            collection.save()
+        if inverted_index is not None:
+            inverted_index.close()
+
+    # 2. коллекции и индексы, на которые манифест больше не ссылается
+    referenced = {key.split('/', 1)[0] for key in manifest.entries}
+    for collection in client.list_collections():
+        if collection.name not in referenced:
+            report['collections_dropped'] += 1
+            if not dry_run:
+                client.delete_collection(collection.name)
+    referenced_bm25 = {name.removesuffix(FLAT_SUFFIX) + BM25_SUFFIX for name in referenced}
+    for name in os.listdir(storage_path):
+        path = os.path.join(storage_path, name)
+        unreferenced_bm25 = name.endswith(BM25_SUFFIX) and name not in referenced_bm25
+        unreferenced_flat = name.endswith(FLAT_SUFFIX) and os.path.isdir(path) and name not in referenced
+        if not (unreferenced_bm25 or unreferenced_flat):
+            continue
+        report['files_removed'] += 1
+        if dry_run:
+            continue
+        if unreferenced_flat:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+    # 3. сжатие баз SQLite
+    if not dry_run:
+        manifest.save()
+        for name in sorted(os.listdir(storage_path)):
+            if (name.endswith(BM25_SUFFIX) or name == CHROMA_DATABASE) and \
+                    vacuum(os.path.join(storage_path, name)):
+                report['vacuumed'].append(name)
+    report['bytes_after'] = directory_size(storage_path)
+    report['reclaimed_bytes'] = report['bytes_before'] - report['bytes_after']
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--storage', help='папка хранилища (по умолчанию папка приложения)')
+    parser.add_argument('--dry-run', action='store_true', help='только показать, что будет удалено')
+    args = parser.parse_args(argv)
+    print(json.dumps(compact(args.storage, args.dry_run), ensure_ascii=False, indent=1))
+
+
+if __name__ == '__main__':
+    main()
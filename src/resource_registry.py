@@ -0,0 +1,75 @@
+""" Общий на процесс реестр тяжёлых ресурсов: клиентов ChromaDB, моделей эмбеддингов и их дисковых кэшей.
+chromadb и sentence-transformers импортируются только при первом обращении,
+поэтому запуск приложения не тратит время на их загрузку.
+"""
+import os
+import threading
+
+MODEL_NAME = 'sergeyzh/LaBSE-ru-sts'
+
+_clients = {}
+_clients_lock = threading.Lock()
+_embedding_functions = {}
+_embedding_functions_lock = threading.Lock()
+_embedding_caches = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def default_storage_path() -> str:
+    """ Папка с данными ChromaDB по умолчанию """
+    return os.path.join(os.environ.get('LOCALAPPDATA', 'C:\\Temp'), 'ChromaDBDocStorage')
+
+
+def get_client(path):
+    """ Вернуть PersistentClient для папки path, открыв его при первом обращении """
+    path = os.path.abspath(path)
+    with _clients_lock:
+        client = _clients.get(path)
+        if client is None:
+            import chromadb
+            os.makedirs(path, exist_ok=True)
+            client = chromadb.PersistentClient(path=path)
+            _clients[path] = client
+        return client
+
+
+def get_embedding_function(model_name=MODEL_NAME):
+    """ Вернуть функцию эмбеддингов модели model_name, загрузив модель при первом обращении """
+    with _embedding_functions_lock:
+        embedding_function = _embedding_functions.get(model_name)
+        if embedding_function is None:
+            from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+            embedding_function = SentenceTransformerEmbeddingFunction(model_name)
+            _embedding_functions[model_name] = embedding_function
+        return embedding_function
+
+
+def get_embedding_cache(path, model_name=MODEL_NAME):
+    """ Вернуть дисковый кэш эмбеддингов модели model_name в папке path, открыв его при первом обращении """
+    key = (os.path.abspath(path), model_name)
+    with _embedding_caches_lock:
+        embedding_cache = _embedding_caches.get(key)
+        if embedding_cache is None:
+            from src.embedding_cache import EmbeddingCache
+            os.makedirs(key[0], exist_ok=True)
+            embedding_cache = EmbeddingCache(key[0], model_name)
+            _embedding_caches[key] = embedding_cache
+        return embedding_cache
+
+
+def register_embedding_function(embedding_function, model_name=MODEL_NAME) -> None:
+    """ Подменить функцию эмбеддингов модели (например, офлайн-заглушкой в бенчмарках и тестах) """
+    with _embedding_functions_lock:
+        _embedding_functions[model_name] = embedding_function
+
+
+def clear() -> None:
+    """ Забыть все открытые клиенты и загруженные модели """
+    with _clients_lock:
+        _clients.clear()
+    with _embedding_functions_lock:
+        _embedding_functions.clear()
+    with _embedding_caches_lock:
+        for embedding_cache in _embedding_caches.values():
+            embedding_cache.close()
+        _embedding_caches.clear()
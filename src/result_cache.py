@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def folder_fingerprint(full_paths, root) -> str:
+    """ Отпечаток состояния папки: относительные пути, размеры и mtime всех файлов.
+    Меняется при добавлении, удалении или изменении любого файла
+    args:
+        full_paths: полные пути до файлов папки
+        root: корень папки
+    returns:
+        str: sha1 от отсортированного списка (путь, размер, mtime)
+    """
+    digest = hashlib.sha1()
+    for path in sorted(Path(p) for p in full_paths):
+        try:
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime = -1, -1
+        digest.update(f'{path.relative_to(root).as_posix()}\0{size}\0{mtime}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """ LRU-кэш готовых результатов поиска с временем жизни записей.
+    Ключ включает отпечаток папки, поэтому изменение любого файла делает старые записи недостижимыми;
+    при persist_path кэш сохраняется в JSON и переживает перезапуск приложения.
+    """
+
+    def __init__(self, max_size=256, ttl=600.0, persist_path=None, clock=time.time):
+        """ Конструктор кэша
+        args:
+            max_size: максимальное число записей
+            ttl: время жизни записи в секундах
+            persist_path: путь до JSON-файла кэша (None - только в памяти)
+            clock: источник времени (подменяется в тестах)
+        returns:
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.clock = clock
+        self.items = OrderedDict()  # ключ -> (время записи, список относительных путей)
+        self.lock = threading.Lock()
+        # записи на диск идут по одной, иначе более старый снимок мог бы перезаписать более новый
+        self.save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if persist_path is not None:
+            self._load()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return json.dumps([str(part) for part in parts], ensure_ascii=False)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            # повреждённый файл кэша просто игнорируется
+            return
+        now = self.clock()
+        for key, created, value in stored:
+            if now - created < self.ttl:
+                self.items[key] = (created, value)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def save(self) -> None:
+        """ Атомарно записать кэш на диск (если задан persist_path).
+        Временный файл у каждой записи свой, поэтому одновременные сохранения (в том числе из разных процессов)
+        не портят друг другу JSON
+        """
+        if self.persist_path is None:
+            return
+        with self.save_lock:
+            with self.lock:
+                stored = [[key, created, value] for key, (created, value) in self.items.items()]
+            directory, name = os.path.split(os.path.abspath(self.persist_path))
+            descriptor, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                    json.dump(stored, file, ensure_ascii=False)
+                os.replace(tmp_path, self.persist_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def get(self, key):
+        """ Вернуть сохранённый результат или None, если записи нет или она устарела """
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and self.clock() - item[0] >= self.ttl:
+                del self.items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return list(item[1])
+
+    def put(self, key, value) -> None:
+        """ Запомнить результат (список относительных путей в виде строк) """
+        with self.lock:
+            self.items[key] = (self.clock(), list(value))
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+        self.save()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+        self.save()
@@ -0,0 +1,215 @@
+""" Локальный HTTP-сервис поиска с прогретыми моделью и индексом папки.
+
+Эндпоинты:
+    GET  /search?q=<запрос>&limit=<n>   или   POST /search {"query": ..., "limit": ...}
+    POST /reindex                        доиндексировать изменённые файлы папки
+    GET  /health
+
+Запросы обрабатывает пул из workers потоков; ещё queue_size запросов могут ждать в очереди,
+остальные сразу получают 503. Сервис работает полностью офлайн.
+
+Запуск из корня репозитория:
+    python -m src.search_service documents --port 8765
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+from src.document_search import RETRIEVAL_MODES
+from src.document_store import DocumentStore
+
+logger = logging.getLogger(__name__)
+
+
+class SearchService:
+    """ Долгоживущий поиск по одной папке поверх DocumentStore: общая коллекция и инвертированный индекс
+    открыты между запросами, модель загружена один раз. Поиски выполняются параллельно, переиндексация -
+    по одной за раз и только между поисками.
+    """
+
+    def __init__(self, folder, results_count=5, chunk_length=400, retrieval='dense', extraction_workers=None):
+        """ Конструктор сервиса
+        args:
+            folder: папка с документами
+            results_count: сколько документов возвращать на запрос (максимум для limit)
+            chunk_length: длина чанка
+            retrieval: режим поиска ('dense', 'bm25' или 'hybrid')
+            extraction_workers: число процессов для извлечения текста при переиндексации
+        returns:
+        """
+        self.store = DocumentStore(folder, chunk_length=chunk_length, results_count=results_count,
+                                   retrieval=retrieval, extraction_workers=extraction_workers)
+
+    def reindex(self) -> dict:
+        """ Доиндексировать изменённые файлы папки """
+        return self.store.refresh()
+
+    def warm_up(self) -> dict:
+        """ Построить индекс и загрузить модель до первого запроса """
+        summary = self.reindex()
+        self.store.indexer.embed_query('warm up')
+        return summary
+
+    def search(self, query, limit=None) -> dict:
+        start = time.perf_counter()
+        ranking = self.store.search(query, limit)
+        return {
+            'query': query,
+            'results': [{'path': path.as_posix(), 'distance': distance} for path, distance in ranking],
+            'seconds': round(time.perf_counter() - start, 6),
+        }
+
+    def health(self) -> dict:
+        return {'status': 'ok', 'folder': str(self.store.folder), 'documents': self.store.documents(),
+                'searches': self.store.searches}
+
+    def close(self) -> None:
+        self.store.close()
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """ Разбор HTTP-запросов и JSON-ответы; сама работа выполняется в SearchService """
+
+    server_version = 'DocumentsSearch/1.0'
+
+    def send_json(self, status, payload) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(payload, dict):
+            raise ValueError('request body must be a JSON object')
+        return payload
+
+    def handle_search(self, query, limit) -> None:
+        if not query or not str(query).strip():
+            self.send_json(400, {'error': 'query is required'})
+            return
+        self.send_json(200, self.server.service.search(str(query), int(limit) if limit else None))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self.send_json(200, self.server.service.health())
+        elif url.path == '/search':
+            params = parse_qs(url.query)
+            self.run(lambda: self.handle_search(params.get('q', [''])[0], params.get('limit', [None])[0]))
+        else:
+            self.send_json(404, {'error': f'unknown endpoint {url.path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == '/search':
+            self.run(lambda: self.handle_search(*self.search_arguments()))
+        elif url.path == '/reindex':
+            self.run(lambda: self.send_json(200, self.server.service.reindex()))
+        else:
+            self.send_json(404, {'error': f'unknown endpoint {url.path}'})
+
+    def search_arguments(self):
+        payload = self.read_json()
+        return payload.get('query'), payload.get('limit')
+
+    def run(self, action) -> None:
+        try:
+            action()
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            logger.exception('request %s failed', self.path)
+            self.send_json(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """ HTTP-сервер с ограниченным пулом потоков и ограниченной очередью ожидающих запросов """
+
+    def __init__(self, address, service: SearchService, workers=4, queue_size=32):
+        super().__init__(address, SearchRequestHandler)
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search')
+        # обрабатываемые и ожидающие запросы занимают по слоту
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.reject(request)
+            return
+        self.executor.submit(self.process_request_in_pool, request, client_address)
+
+    def process_request_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def reject(self, request) -> None:
+        """ Очередь заполнена - ответить 503 сразу, не занимая поток пула """
+        body = b'{"error": "server is busy"}'
+        try:
+            request.sendall(b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n'
+                            b'Retry-After: 1\r\nConnection: close\r\n'
+                            + f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.service.close()
+
+
+def create_server(folder, host='127.0.0.1', port=8765, workers=4, queue_size=32, **service_options):
+    """ Создать сервис по папке, прогреть его и вернуть готовый к serve_forever сервер """
+    service = SearchService(folder, **service_options)
+    service.warm_up()
+    return PooledHTTPServer((host, port), service, workers, queue_size)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='папка с документами')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=4, help='потоков обработки запросов')
+    parser.add_argument('--queue', type=int, default=32, help='запросов, ожидающих свободный поток')
+    parser.add_argument('--results', type=int, default=5)
+    parser.add_argument('--chunk-length', type=int, default=400)
+    parser.add_argument('--retrieval', choices=RETRIEVAL_MODES, default='dense')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(Path(args.folder), args.host, args.port, args.workers, args.queue,
+                           results_count=args.results, chunk_length=args.chunk_length, retrieval=args.retrieval)
+    host, port = server.server_address[:2]
+    logger.info('serving %s on http://%s:%s', args.folder, host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+""" Перенос готового индекса папки между машинами.
+
+Экспорт упаковывает общую коллекцию папки или коллекции её отдельных документов (режим приложения
+по умолчанию) - чанки, эмбеддинги, метаданные, - имя модели, параметры разбиения и отпечатки файлов
+из манифеста в один ZIP-архив. Импорт раскладывает архив в хранилище другой машины:
+чанки файла попадают в индекс, только если файл по (пересчитанному) относительному пути совпадает
+с экспортированным по размеру и sha256. Остальные файлы переиндексирует первый поиск, а эмбеддинги
+их неизменённых чанков к этому времени уже лежат в дисковом кэше.
+
+Запуск из корня репозитория:
+    python -m src.snapshot export documents index.docsearch [--refresh] [--per-document]
+    python -m src.snapshot import index.docsearch documents [--map СТАРЫЙ=НОВЫЙ]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from src.document_search import RelevantDocumentsSearch, VECTOR_BACKENDS
+from src.flat_index import FlatVectorIndex
+from src.index_manifest import IndexManifest
+from src.inverted_index import InvertedIndex
+from src.resource_registry import MODEL_NAME
+
+SNAPSHOT_FORMAT = 'docsearch-snapshot'
+SNAPSHOT_VERSION = 1
+HEADER_FILE = 'snapshot.json'
+CHUNKS_FILE = 'chunks.jsonl'
+VECTORS_FILE = 'embeddings.bin'  # строки эмбеддингов подряд, тип и размерность - в snapshot.json
+# 'shared' - общая коллекция папки, 'documents' - по коллекции на документ (режим приложения по умолчанию)
+SNAPSHOT_LAYOUTS = ('shared', 'documents')
+
+
+def remap_path(path_str, path_map) -> str:
+    """ Заменить префикс относительного пути по первому подходящему правилу (старый префикс, новый префикс)
+    ('' - корень папки) """
+    for old, new in path_map or ():
+        old, new = old.strip('/'), new.strip('/')
+        if not old:
+            return f'{new}/{path_str}' if new else path_str
+        if path_str == old or path_str.startswith(old + '/'):
+            rest = path_str[len(old):].lstrip('/')
+            return '/'.join(part for part in (new, rest) if part)
+    return path_str
+
+
+def open_index(searcher: RelevantDocumentsSearch, refresh=False):
+    """ Общая коллекция и инвертированный индекс папки; при refresh папка сначала доиндексируется """
+    if refresh:
+        extractor = searcher.create_extractor()
+        extractor.get_paths(searcher.current_folder_path)
+        collection, inverted_index, _, _ = searcher.refresh_shared_index(extractor)
+        return collection, inverted_index
+    return searcher.open_shared_collection(), InvertedIndex(searcher.inverted_index_path())
+
+
+def is_exported(searcher: RelevantDocumentsSearch, entry) -> bool:
+    """ Проиндексирован ли файл записи манифеста с параметрами индекса searcher """
+    return (entry['chunk_length'] == searcher.chunk_length and entry['model'] == MODEL_NAME
+            and entry.get('chunking') == searcher.chunking_options())
+
+
+def shared_files(searcher: RelevantDocumentsSearch, collection) -> dict:
+    """ Отпечатки файлов общей коллекции из манифеста: {относительный путь с '/': отпечаток} """
+    prefix = f'{collection.name}/'
+    return {key[len(prefix):]: {'size': entry['size'], 'hash': entry['hash'], 'chunks': 0}
+            for key, entry in searcher.manifest.entries.items()
+            if key.startswith(prefix) and is_exported(searcher, entry)}
+
+
+def document_files(searcher: RelevantDocumentsSearch) -> dict:
+    """ Отпечатки файлов папки, у которых есть собственная коллекция: {относительный путь с '/': отпечаток}.
+    Записи той же папки, проиндексированной как часть родительской, имеют другие имена коллекций и не берутся """
+    folder = Path(searcher.current_folder_path).resolve()
+    files = {}
+    for key, entry in searcher.manifest.entries.items():
+        if '/' in key or not Path(entry['path']).is_relative_to(folder) or not is_exported(searcher, entry):
+            continue
+        path_str = Path(entry['path']).relative_to(folder).as_posix()
+        if key == searcher.collection_name(path_str):
+            files[path_str] = {'size': entry['size'], 'hash': entry['hash'], 'chunks': 0}
+    return files
+
+
+def iter_records(collection, inverted_index: InvertedIndex, files, batch_size, path_str=None):
+    """ Пачки чанков экспортируемых файлов коллекции
+    args:
+        collection: общая коллекция папки или коллекция одного документа
+        inverted_index: инвертированный индекс папки (нужен для плоского индекса, у которого нет текстов)
+        files: отпечатки экспортируемых файлов по относительным путям
+        batch_size: сколько чанков читается из хранилища за раз
+        path_str: относительный путь документа для коллекции одного документа (None - общая коллекция)
+    returns:
+        генератор пар (записи чанков, эмбеддинги float32)
+    """
+    all_ids = collection.get(include=[])['ids']
+    for start in range(0, len(all_ids), batch_size):
+        include = ['embeddings', 'metadatas']
+        if not isinstance(collection, FlatVectorIndex):
+            include.append('documents')
+        result = collection.get(ids=all_ids[start:start + batch_size], include=include)
+        documents = result.get('documents') or [None] * len(result['ids'])
+        metadatas = result['metadatas'] if path_str is None else \
+            [dict(metadata, path=path_str) for metadata in result['metadatas']]
+        rows = [i for i, metadata in enumerate(metadatas) if metadata.get('path') in files]
+        if not rows:
+            continue
+        # у плоского индекса текстов нет - для BM25 переносятся частоты термов
+        terms = inverted_index.chunk_terms(result['ids'][i] for i in rows) \
+            if isinstance(collection, FlatVectorIndex) else {}
+        records = []
+        for i in rows:
+            record = {'id': result['ids'][i], 'metadata': metadatas[i]}
+            if documents[i] is not None:
+                record['document'] = documents[i]
+            else:
+                record['terms'] = terms.get(result['ids'][i], {})
+            records.append(record)
+        yield records, np.asarray([result['embeddings'][i] for i in rows], dtype=np.float32)
+
+
+def export_snapshot(folder, bundle_path, chunk_length=400, vector_backend='chroma', dtype='float32',
+                    refresh=False, batch_size=1000, chunk_overlap=0, max_sentence_length=None,
+                    shared_collection=True) -> dict:
+    """ Сохранить индекс папки в архив
+    args:
+        folder: папка с документами
+        bundle_path: путь до создаваемого архива
+        chunk_length, vector_backend, chunk_overlap, max_sentence_length: параметры индекса,
+            с которыми папка индексировалась
+        dtype: тип эмбеддингов в архиве ('float32' или 'float16' - вдвое компактнее)
+        refresh: доиндексировать изменённые файлы перед экспортом (нужна модель эмбеддингов)
+        batch_size: сколько чанков читается из хранилища за раз
+        shared_collection: экспортировать общую коллекцию папки (False - коллекции отдельных документов,
+            которые строит поиск в приложении)
+    returns:
+        report(dict): число файлов и чанков, размер архива
+    """
+    searcher = RelevantDocumentsSearch(folder, '', chunk_length=chunk_length, shared_collection=shared_collection,
+                                       vector_backend=vector_backend, chunk_overlap=chunk_overlap,
+                                       max_sentence_length=max_sentence_length)
+    if searcher.shared_collection:
+        collection, inverted_index = open_index(searcher, refresh)
+        files = shared_files(searcher, collection)
+        batches = iter_records(collection, inverted_index, files, batch_size)
+    else:
+        if refresh:
+            # поиск в режиме коллекций документов доиндексирует изменённые файлы
+            searcher.find_documents()
+        inverted_index = None
+        files = document_files(searcher)
+        batches = (batch for path_str in list(files)
+                   for batch in iter_records(searcher.document_collection(path_str), None, files, batch_size,
+                                             path_str))
+    dtype = np.dtype(dtype)
+    dim = None
+    chunk_count = 0
+    bundle_path = Path(bundle_path)
+    tmp_path = bundle_path.with_name(bundle_path.name + '.tmp')
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as bundle, \
+                tempfile.TemporaryFile('w+b') as chunks_file:
+            # строки чанков копятся во временном файле: в ZIP одновременно пишется только один член
+            with bundle.open(VECTORS_FILE, 'w', force_zip64=True) as vectors_file:
+                for records, vectors in batches:
+                    dim = dim or vectors.shape[1]
+                    vectors_file.write(vectors.astype(dtype.newbyteorder('<')).tobytes())
+                    for record in records:
+                        chunks_file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                        files[record['metadata']['path']]['chunks'] += 1
+                    chunk_count += len(records)
+            chunks_file.seek(0)
+            with bundle.open(CHUNKS_FILE, 'w', force_zip64=True) as member:
+                shutil.copyfileobj(chunks_file, member)
+            header = {
+                'format': SNAPSHOT_FORMAT,
+                'version': SNAPSHOT_VERSION,
+                'model': MODEL_NAME,
+                'layout': 'shared' if searcher.shared_collection else 'documents',
+                'chunk_length': chunk_length,
+                'chunk_overlap': searcher.chunk_overlap,
+                'max_sentence_length': searcher.max_sentence_length,
+                'vector_backend': vector_backend,
+                'dtype': dtype.name,
+                'dim': dim,
+                'chunks': chunk_count,
+                # файлы без чанков в хранилище (хранилище очищалось) не экспортируются
+                'files': {path: fingerprint for path, fingerprint in files.items() if fingerprint['chunks']},
+            }
+            bundle.writestr(HEADER_FILE, json.dumps(header, ensure_ascii=False, indent=1))
+        os.replace(tmp_path, bundle_path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    finally:
+        if inverted_index is not None:
+            inverted_index.close()
+    return {'bundle': str(bundle_path), 'files': len(header['files']), 'chunks': chunk_count,
+            'bytes': bundle_path.stat().st_size}
+
+
+def read_header(bundle: zipfile.ZipFile) -> dict:
+    header = json.loads(bundle.read(HEADER_FILE).decode('utf-8'))
+    if header.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError('not an index snapshot')
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'unsupported snapshot version {header.get("version")}, expected {SNAPSHOT_VERSION}')
+    if header['model'] != MODEL_NAME:
+        raise ValueError(f'snapshot was built with model {header["model"]!r}, this build uses {MODEL_NAME!r}')
+    if header['vector_backend'] not in VECTOR_BACKENDS:
+        raise ValueError(f'unknown vector backend {header["vector_backend"]!r}')
+    if header.get('layout', 'shared') not in SNAPSHOT_LAYOUTS:
+        raise ValueError(f'unknown snapshot layout {header["layout"]!r}')
+    return header
+
+
+def import_snapshot(bundle_path, folder, path_map=None, batch_size=1000) -> dict:
+    """ Загрузить индекс из архива для папки folder
+    args:
+        bundle_path: архив, созданный export_snapshot
+        folder: папка с документами на этой машине
+        path_map: список пар (старый префикс относительного пути, новый префикс)
+        batch_size: сколько чанков записывается в хранилище за раз
+    returns:
+        report(dict): сколько файлов импортировано, изменилось или отсутствует, сколько чанков записано
+    """
+    with zipfile.ZipFile(bundle_path) as bundle:
+        header = read_header(bundle)
+        shared = header.get('layout', 'shared') == 'shared'
+        searcher = RelevantDocumentsSearch(folder, '', chunk_length=header['chunk_length'], shared_collection=shared,
+                                           vector_backend=header['vector_backend'],
+                                           chunk_overlap=header.get('chunk_overlap', 0),
+                                           max_sentence_length=header.get('max_sentence_length'))
+        report = {'files': len(header['files']), 'imported': 0, 'changed': 0, 'missing': 0, 'chunks': 0,
+                  'cached_embeddings': 0}
+        # файлы, совпадающие с экспортированными: старый путь -> (новый путь, полный путь)
+        accepted = {}
+        for path_str, fingerprint in header['files'].items():
+            new_path = remap_path(path_str, path_map)
+            full_path = Path(folder) / new_path
+            if not full_path.is_file():
+                report['missing'] += 1
+            elif (full_path.stat().st_size != fingerprint['size']
+                  or IndexManifest.content_hash(full_path) != fingerprint['hash']):
+                report['changed'] += 1
+            else:
+                accepted[path_str] = (new_path, full_path)
+
+        collection = inverted_index = None
+        embedding_cache = searcher.embedding_cache
+        try:
+            if shared:
+                collection = searcher.open_shared_collection()
+                inverted_index = InvertedIndex(searcher.inverted_index_path())
+                for new_path, _ in accepted.values():
+                    collection.delete(where={'path': new_path})
+                    inverted_index.delete_path(new_path)
+            else:
+                collections = {path_str: replace_document_collection(searcher, new_path)
+                               for path_str, (new_path, _) in accepted.items()}
+            dtype = np.dtype(header['dtype']).newbyteorder('<')
+            row_bytes = header['dim'] * dtype.itemsize if header['dim'] else 0
+            with bundle.open(CHUNKS_FILE) as chunks_file, bundle.open(VECTORS_FILE) as vectors_file:
+                records = (json.loads(line) for line in chunks_file)
+                while True:
+                    batch = [record for _, record in zip(range(batch_size), records)]
+                    if not batch:
+                        break
+                    vectors = np.frombuffer(vectors_file.read(row_bytes * len(batch)), dtype=dtype)
+                    vectors = vectors.reshape(len(batch), header['dim']).astype(np.float32)
+                    report['cached_embeddings'] += seed_embedding_cache(embedding_cache, batch, vectors)
+                    if shared:
+                        report['chunks'] += write_chunks(collection, inverted_index, batch, vectors, accepted)
+                    else:
+                        report['chunks'] += write_document_chunks(collections, batch, vectors, accepted)
+            for path_str, (new_path, full_path) in accepted.items():
+                key = f'{collection.name}/{new_path}' if shared else searcher.collection_name(new_path)
+                searcher.manifest.update(key, full_path, header['chunk_length'], MODEL_NAME,
+                                         content_hash=header['files'][path_str]['hash'],
+                                         chunking=searcher.chunking_options())
+            report['imported'] = len(accepted)
+        finally:
+            if isinstance(collection, FlatVectorIndex):
+                collection.save()
+            searcher.manifest.save()
+            if inverted_index is not None:
+                inverted_index.close()
+    return report
+
+
+def replace_document_collection(searcher: RelevantDocumentsSearch, path_str):
+    """ Пустая коллекция документа: прежние чанки файла с этим путём удаляются вместе с коллекцией """
+    from chromadb.errors import NotFoundError
+    try:
+        searcher.client.delete_collection(searcher.collection_name(path_str))
+    except NotFoundError:
+        pass
+    return searcher.document_collection(path_str)
+
+
+def seed_embedding_cache(embedding_cache, records, vectors) -> int:
+    """ Положить эмбеддинги чанков архива в дисковый кэш, чтобы переиндексация изменённых файлов
+    не считала заново их неизменённые чанки
+    returns:
+        int: сколько векторов добавлено
+    """
+    if embedding_cache is None:
+        return 0
+    rows = [i for i, record in enumerate(records) if record.get('document') is not None]
+    texts = [records[i]['document'] for i in rows]
+    missing = [i for i, vector in zip(rows, embedding_cache.lookup(texts)) if vector is None]
+    if missing:
+        embedding_cache.store([records[i]['document'] for i in missing], vectors[missing])
+    return len(missing)
+
+
+def write_chunks(collection, inverted_index: InvertedIndex, records, vectors, accepted) -> int:
+    """ Записать чанки принятых файлов в коллекцию и инвертированный индекс с новыми путями
+    returns:
+        int: сколько чанков записано
+    """
+    ids, metadatas, documents, rows = [], [], [], []
+    for i, record in enumerate(records):
+        path_str = record['metadata']['path']
+        if path_str not in accepted:
+            continue
+        new_path = accepted[path_str][0]
+        # id чанка - '<путь>#<номер>', путь заменяется целиком
+        chunk_id = new_path + record['id'][len(path_str):]
+        document = record.get('document')
+        tokens = document.split() if document is not None else \
+            [term for term, tf in record.get('terms', {}).items() for _ in range(tf)]
+        inverted_index.add_chunk(chunk_id, new_path, tokens)
+        ids.append(chunk_id)
+        metadatas.append(dict(record['metadata'], path=new_path))
+        documents.append(document)
+        rows.append(i)
+    if not ids:
+        return 0
+    if any(document is None for document in documents):
+        collection.upsert(ids=ids, embeddings=vectors[rows], metadatas=metadatas)
+    else:
+        collection.upsert(ids=ids, embeddings=vectors[rows], metadatas=metadatas, documents=documents)
+    return len(ids)
+
+
+def write_document_chunks(collections, records, vectors, accepted) -> int:
+    """ Записать чанки принятых файлов в их коллекции документов (id чанка - его номер в документе)
+    returns:
+        int: сколько чанков записано
+    """
+    rows = {}
+    for i, record in enumerate(records):
+        if record['metadata']['path'] in accepted:
+            rows.setdefault(record['metadata']['path'], []).append(i)
+    for path_str, indices in rows.items():
+        # путь в метаданных - в том виде, в каком его записывает индексация документа
+        new_path = str(Path(accepted[path_str][0]))
+        collections[path_str].upsert(ids=[records[i]['id'] for i in indices], embeddings=vectors[indices],
+                                     metadatas=[dict(records[i]['metadata'], path=new_path) for i in indices],
+                                     documents=[records[i]['document'] for i in indices])
+    return sum(len(indices) for indices in rows.values())
+
+
+def parse_path_map(values) -> list:
+    path_map = []
+    for value in values or ():
+        if '=' not in value:
+            raise argparse.ArgumentTypeError(f'expected OLD=NEW, got {value!r}')
+        old, new = value.split('=', 1)
+        path_map.append((old, new))
+    return path_map
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='сохранить индекс папки в архив')
+    export_parser.add_argument('folder', help='папка с документами')
+    export_parser.add_argument('bundle', help='создаваемый архив')
+    export_parser.add_argument('--chunk-length', type=int, default=400)
+    export_parser.add_argument('--chunk-overlap', type=int, default=0)
+    export_parser.add_argument('--max-sentence-length', type=int, default=None)
+    export_parser.add_argument('--backend', choices=VECTOR_BACKENDS, default='chroma')
+    export_parser.add_argument('--dtype', choices=('float32', 'float16'), default='float32')
+    export_parser.add_argument('--refresh', action='store_true', help='доиндексировать папку перед экспортом')
+    export_parser.add_argument('--per-document', action='store_true',
+                               help='экспортировать коллекции отдельных документов, которые строит поиск '
+                                    'в приложении (по умолчанию - общую коллекцию папки)')
+    import_parser = commands.add_parser('import', help='загрузить индекс папки из архива')
+    import_parser.add_argument('bundle', help='архив, созданный командой export')
+    import_parser.add_argument('folder', help='папка с документами на этой машине')
+    import_parser.add_argument('--map', action='append', metavar='OLD=NEW',
+                               help='заменить префикс относительных путей (можно повторять)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        report = export_snapshot(Path(args.folder), args.bundle, args.chunk_length, args.backend, args.dtype,
+                                 args.refresh, chunk_overlap=args.chunk_overlap,
+                                 max_sentence_length=args.max_sentence_length,
+                                 shared_collection=not args.per_document)
+    else:
+        try:
+            path_map = parse_path_map(args.map)
+        except argparse.ArgumentTypeError as error:
+            parser.error(str(error))
+        report = import_snapshot(args.bundle, Path(args.folder), path_map)
+    print(json.dumps(report, ensure_ascii=False, indent=1))
+
+
+if __name__ == '__main__':
+    main()
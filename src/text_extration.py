@@ -1,76 +1,327 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
+import codecs
+import logging
+import mmap
+import os
 import docx2txt
 import PyPDF2
-from nltk import word_tokenize, SnowballStemmer
-from nltk.stem import WordNetLemmatizer
-import re
+from src.file_walker import FileWalker, DEFAULT_MAX_FILE_BYTES
+from src.text_normalizer import normalizer
+
+
+TEXT_EXTENSIONS = ('.txt', '.csv', '.json', '.xml', '.html', '.md', '.log', '.py')
+# расширения, из которых read_text умеет извлекать текст; остальные файлы отбрасываются при обходе папки
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + ('.doc', '.docx', '.pdf')
+# ограничения для огромных PDF (например, сканов на тысячи страниц): остальные страницы не читаются
+DEFAULT_MAX_PDF_PAGES = 1000
+DEFAULT_MAX_PDF_BYTES = 20 * 1024 * 1024
+# текстовые файлы (в том числе многогигабайтные логи) декодируются окнами такого размера
+TEXT_WINDOW_BYTES = 1024 * 1024
+# по такому началу файла определяются кодировка и двоичное содержимое
+SNIFF_BYTES = 64 * 1024
+# кодировка для файлов, которые не являются корректным UTF-8 (старые русскоязычные документы)
+FALLBACK_ENCODING = 'cp1251'
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+logger = logging.getLogger(__name__)
+
+
+def iter_pdf_pages(path: Path, max_pages=DEFAULT_MAX_PDF_PAGES, max_bytes=DEFAULT_MAX_PDF_BYTES):
+    """ Функция для постраничного чтения PDF.
+    Файл открывается сразу (ошибки открытия возникают при вызове), страницы извлекаются лениво.
+    Страница, текст которой не удалось извлечь, пропускается
+    args:
+        path: полный путь до файла
+        max_pages: максимальное число читаемых страниц (None - без ограничения)
+        max_bytes: максимальный суммарный размер текста в байтах UTF-8 (None - без ограничения)
+    returns:
+        генератор пар (номер страницы, текст страницы)
+    """
+    file = open(path, 'rb')
+    try:
+        reader = PyPDF2.PdfReader(file)
+        page_count = len(reader.pages)
+    except Exception:
+        file.close()
+        raise
+    return _pdf_pages(path, file, reader, page_count, max_pages, max_bytes)
+
+
+def _pdf_pages(path, file, reader, page_count, max_pages, max_bytes):
+    with file:
+        total_bytes = 0
+        for number in range(1, page_count + 1):
+            if max_pages is not None and number > max_pages:
+                logger.warning('%s: read only the first %d of %d pages', path, max_pages, page_count)
+                return
+            try:
+                text = reader.pages[number - 1].extract_text() or ''
+            except Exception as error:
+                logger.warning('%s: page %d skipped: %s', path, number, error)
+                continue
+            total_bytes += len(text.encode('utf-8'))
+            if max_bytes is not None and total_bytes > max_bytes:
+                logger.warning('%s: text limit of %d bytes reached on page %d', path, max_bytes, number)
+                return
+            yield number, text
+
+
+def sniff_encoding(prefix: bytes, complete=False) -> str:
+    """ Определить кодировку по началу файла
+    args:
+        prefix: первые байты файла
+        complete: prefix - это весь файл (иначе последний символ может быть обрезан)
+    returns:
+        encoding(str): кодировка по BOM, 'utf-8' или FALLBACK_ENCODING
+    """
+    for bom, encoding in BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    if b'\x00' in prefix:
+        # нулевые байты без BOM UTF-16 бывают только в двоичных файлах
+        raise ValueError('binary content')
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=complete)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
+
+def iter_text_windows(path: Path, window_bytes=TEXT_WINDOW_BYTES):
+    """ Функция для потокового чтения текстового файла через memory map.
+    Файл открывается и проверяется сразу (двоичный файл - ValueError при вызове), а декодируется лениво
+    окнами по window_bytes байт, так что память не зависит от размера файла. Переводы строк
+    приводятся к '\n', как при чтении в текстовом режиме; байты, недопустимые в кодировке, заменяются
+    args:
+        path: полный путь до файла
+        window_bytes: размер окна в байтах
+    returns:
+        генератор фрагментов текста
+    """
+    file = open(path, 'rb')
+    try:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            file.close()
+            return iter(())
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        file.close()
+        raise
+    try:
+        encoding = sniff_encoding(mapped[:SNIFF_BYTES], complete=size <= SNIFF_BYTES)
+    except Exception:
+        mapped.close()
+        file.close()
+        raise
+    return _text_windows(file, mapped, size, encoding, window_bytes)
+
+
+def _text_windows(file, mapped, size, encoding, window_bytes):
+    with file, mapped:
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        pending_cr = False
+        for start in range(0, size, window_bytes):
+            final = start + window_bytes >= size
+            text = decoder.decode(mapped[start:start + window_bytes], final=final)
+            if pending_cr:
+                text = '\r' + text
+            # '\r' в конце окна может оказаться началом '\r\n'
+            pending_cr = not final and text.endswith('\r')
+            if pending_cr:
+                text = text[:-1]
+            if text:
+                yield text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def read_segments(path: Path, max_pages=DEFAULT_MAX_PDF_PAGES, max_bytes=DEFAULT_MAX_PDF_BYTES):
+    """ Функция для чтения файла частями: пары (номер страницы, текст).
+    PDF читается постранично, текстовые файлы - окнами без номера страницы (и то и другое лениво),
+    у документов Word одна часть без номера страницы
+    """
+    extension = path.suffix.lower()
+    if extension == '.pdf':
+        return iter_pdf_pages(path, max_pages, max_bytes)
+    if extension in TEXT_EXTENSIONS:
+        return ((None, text) for text in iter_text_windows(path))
+    return [(None, read_text(path))]
+
+
+def read_text(path: Path, max_pages=DEFAULT_MAX_PDF_PAGES, max_bytes=DEFAULT_MAX_PDF_BYTES) -> str:
+    """ Функция для извлечения текста из файла по его расширению.
+    Вынесена на уровень модуля, чтобы её можно было выполнять в дочерних процессах
+    args:
+        path: полный путь до файла
+        max_pages, max_bytes: ограничения для PDF, см. iter_pdf_pages
+    returns:
+        file_text(str): текст файла, пустая строка для неподдерживаемых расширений
+    """
+    extension = path.suffix.lower()
+    file_text = ""
+    if extension in TEXT_EXTENSIONS:
+        file_text = ''.join(iter_text_windows(path))
+
+    elif extension in ('.doc', '.docx'):
+        file_text = docx2txt.process(path)
+
+    elif extension == '.pdf':
+        file_text = ''.join(text for _, text in iter_pdf_pages(path, max_pages, max_bytes))
+    return file_text
+
+
+def read_segments_batch(paths: list, max_pages=DEFAULT_MAX_PDF_PAGES, max_bytes=DEFAULT_MAX_PDF_BYTES) -> list:
+    """ Функция для чтения пачки файлов в одном дочернем процессе.
+    Ошибка в одном файле не прерывает обработку остальных
+    returns:
+        results(list): список кортежей (путь, список частей или None, текст ошибки или None)
+    """
+    results = []
+    for path in paths:
+        try:
+            results.append((path, list(read_segments(path, max_pages, max_bytes)), None))
+        except Exception as error:
+            results.append((path, None, f'{type(error).__name__}: {error}'))
+    return results
 
 
 class TextExtraction:
 
-    def __init__(self, main_folder_path):
+    def __init__(self, main_folder_path, max_pdf_pages=DEFAULT_MAX_PDF_PAGES, max_pdf_bytes=DEFAULT_MAX_PDF_BYTES,
+                 exclude_patterns=None, max_file_bytes=DEFAULT_MAX_FILE_BYTES, include_hidden=False):
         """ Конструктор класса для извлечения текста
         args:
             main_folder_path: путь до папки, в которой пользователь планирует искать файлы
+            max_pdf_pages: сколько страниц PDF читать не более (None - все)
+            max_pdf_bytes: сколько байт текста PDF извлекать не более (None - без ограничения)
+            exclude_patterns: шаблоны исключения в стиле .gitignore (дополняют .gitignore/.docsearchignore папки)
+            max_file_bytes: файлы больше этого размера не индексируются (None - без ограничения);
+                текстовые форматы читаются потоком, поэтому индексируются при любом размере
+            include_hidden: искать также в скрытых файлах и папках
         returns:
         """
         self.main_folder_path = main_folder_path
+        self.max_pdf_pages = max_pdf_pages
+        self.max_pdf_bytes = max_pdf_bytes
+        self.exclude_patterns = list(exclude_patterns or [])
+        self.max_file_bytes = max_file_bytes
+        self.include_hidden = include_hidden
         self.full_paths = []
+        self.skipped = {}  # причина пропуска при обходе -> число файлов и папок
         self.texts = {}
+        self.errors = {}
 
     def extract(self) -> dict:
-        """ Метод для извлечения текста из всех найденных файлов
+        """ Метод для извлечения текста из всех найденных файлов.
+        Обёртка над iter_documents: держит в памяти тексты всех файлов сразу,
+        поэтому для больших папок лучше перебирать iter_documents
         args:
         returns:
             texts(dict): словарь вида { <путь>: 'текст файла' }
         """
-        self.get_paths(self.main_folder_path)
-        for path in self.full_paths:
-            self.read_text_from_file(path)
+        self.texts = dict(self.iter_documents())
         return self.texts.copy()
 
+    def iter_documents(self, workers=None, batch_size=8):
+        """ Генератор документов папки: (относительный путь, текст) по одному файлу за раз,
+        так что в памяти одновременно находится только текущий документ.
+        Файлы, которые не удалось прочитать, пропускаются и попадают в self.errors
+        args:
+            workers, batch_size: см. iter_texts
+        returns:
+        """
+        self.full_paths = []
+        self.skipped = {}
+        self.get_paths(self.main_folder_path)
+        yield from self.iter_texts(workers=workers, batch_size=batch_size)
+
+    def iter_texts(self, paths=None, workers=None, batch_size=8):
+        """ Генератор текстов файлов: (относительный путь, текст) по мере готовности.
+        Ошибки чтения отдельных файлов сохраняются в self.errors, а файл пропускается.
+        args:
+            paths: полные пути файлов (по умолчанию self.full_paths)
+            workers: число процессов для PDF и документов Word; None или 1 - последовательное чтение
+                в текущем процессе (текстовые файлы всегда читаются потоком в текущем процессе)
+            batch_size: сколько файлов отправляется в процесс одной задачей
+        returns:
+        """
+        for relative_path, segments in self.iter_segments(paths, workers, batch_size):
+            yield relative_path, ''.join(text for _, text in segments)
+
+    def iter_segments(self, paths=None, workers=None, batch_size=8):
+        """ Генератор файлов по частям: (относительный путь, итерируемое из пар (номер страницы, текст)).
+        При последовательном чтении страницы PDF извлекаются лениво, по мере потребления,
+        поэтому книга целиком в памяти не держится. Аргументы те же, что у iter_texts
+        """
+        paths = self.full_paths if paths is None else list(paths)
+        if not workers or workers <= 1:
+            results = self._iter_segments_sequential(paths)
+        else:
+            results = self._iter_segments_parallel(paths, workers, batch_size)
+        for path, segments, error in results:
+            relative_path = path.relative_to(self.main_folder_path)
+            if error is not None:
+                self.errors[relative_path] = error
+                continue
+            yield relative_path, segments
+
+    def _iter_segments_sequential(self, paths):
+        for path in paths:
+            try:
+                yield path, read_segments(path, self.max_pdf_pages, self.max_pdf_bytes), None
+            except Exception as error:
+                yield path, None, f'{type(error).__name__}: {error}'
+
+    def _iter_segments_parallel(self, paths, workers, batch_size):
+        # текстовые файлы читаются окнами в этом процессе, пока пул разбирает PDF и Word:
+        # дочерний процесс вернул бы текст целиком, и файл любого размера оказался бы в памяти
+        streamed = [path for path in paths if path.suffix.lower() in TEXT_EXTENSIONS]
+        pooled = [path for path in paths if path.suffix.lower() not in TEXT_EXTENSIONS]
+        batches = [pooled[i:i + batch_size] for i in range(0, len(pooled), batch_size)]
+        max_pending = workers * 2  # ограничение числа задач в полёте, чтобы не держать в памяти все тексты
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            next_batch = 0
+
+            def submit():
+                nonlocal next_batch
+                while next_batch < len(batches) and len(pending) < max_pending:
+                    pending.add(executor.submit(read_segments_batch, batches[next_batch],
+                                                self.max_pdf_pages, self.max_pdf_bytes))
+                    next_batch += 1
+
+            submit()
+            for path in streamed:
+                yield from self._iter_segments_sequential([path])
+                done = {future for future in pending if future.done()}
+                pending -= done
+                for future in done:
+                    yield from future.result()
+                submit()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+                submit()
+
     def get_paths(self, folder_path) -> None:
-        """ Метод для поиска путей всех файлов """
-        for path in Path.iterdir(Path(folder_path)):
-            if Path.is_dir(path):
-                self.get_paths(path)
-            else:
-                self.full_paths.append(path)
+        """ Метод для поиска путей файлов поддерживаемых форматов.
+        Пропущенные файлы и папки (неподдерживаемые, скрытые, исключённые, слишком большие документы Word и PDF,
+        петли ссылок) считаются в self.skipped
+        """
+        walker = FileWalker(SUPPORTED_EXTENSIONS, self.exclude_patterns, self.max_file_bytes, self.include_hidden,
+                            uncapped_extensions=TEXT_EXTENSIONS)
+        self.full_paths.extend(walker.walk(folder_path))
+        for reason, count in walker.skipped.items():
+            self.skipped[reason] = self.skipped.get(reason, 0) + count
 
     @staticmethod
     def lemmatization_and_punct_clean(text):
         """ Метод для лемматизации текста и удаления знаков препинания.
         Лемматизация текста - удаление окончаний для повышения эффективности обработки"""
-        en_lemmatizer = WordNetLemmatizer()
-        ru_stemmer = SnowballStemmer("russian")
-        lemmatized_words = []
-        tokens = word_tokenize(text)
-        for token in tokens:
-            if re.search(r'[а-яёА-ЯЁ]', token):
-                lemmatized_words.append(ru_stemmer.stem(token))
-            else:
-                lemmatized_words.append(en_lemmatizer.lemmatize(token))
-        lemmed = ' '.join(lemmatized_words)
-        text = re.sub(r'[^\w\s]', '', lemmed)
-        return text
+        return normalizer.normalize(text)
 
     def read_text_from_file(self, path: Path):
         """ Функция для извлечения текста из файлов разного расширения"""
-        extension = path.suffix
         relative_path = path.relative_to(self.main_folder_path)
-        file_text = ""
-        if extension in ('.txt', '.csv', '.json', '.xml', '.html', '.md', '.log', '.py'):
-            with open(path, 'r', encoding='utf-8') as file:
-                file_text = file.read()
-
-        elif extension in ('.doc', '.docx'):
-            file_text = docx2txt.process(path)
-
-        elif extension == '.pdf':
-            with open(path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    file_text += page.extract_text()
-        else:
-            pass
-        self.texts[relative_path] = file_text
+        self.texts[relative_path] = read_text(path, self.max_pdf_pages, self.max_pdf_bytes)
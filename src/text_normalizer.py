@@ -0,0 +1,56 @@
+from functools import lru_cache
+import re
+
+from nltk import word_tokenize, SnowballStemmer
+from nltk.corpus import wordnet
+from nltk.stem import WordNetLemmatizer
+
+
+class TextNormalizer:
+    """ Долгоживущий нормализатор текста: стемминг русских и лемматизация английских слов,
+    удаление знаков препинания. Стеммер, лемматизатор и регулярные выражения создаются один раз,
+    результаты для отдельных токенов запоминаются в ограниченном LRU-кэше.
+    """
+
+    CYRILLIC_RE = re.compile(r'[а-яёА-ЯЁ]')
+    PUNCT_RE = re.compile(r'[^\w\s]')
+
+    def __init__(self, cache_size=200_000):
+        """ Конструктор нормализатора
+        args:
+            cache_size: максимальное число запомненных токенов
+        returns:
+        """
+        self.en_lemmatizer = WordNetLemmatizer()
+        # корпус wordnet загружается лениво, и первая загрузка (LazyCorpusLoader) не потокобезопасна:
+        # потоки нормализации конвейера и параллельные поиски DocumentStore падали бы с AttributeError
+        try:
+            wordnet.ensure_loaded()
+        except LookupError:
+            # данных nltk нет - лемматизация сообщит об этом при первом обращении
+            pass
+        self.ru_stemmer = SnowballStemmer("russian")
+        self.normalize_token = lru_cache(maxsize=cache_size)(self._normalize_token)
+
+    def _normalize_token(self, token: str) -> str:
+        if self.CYRILLIC_RE.search(token):
+            return self.ru_stemmer.stem(token)
+        return self.en_lemmatizer.lemmatize(token)
+
+    def normalize(self, text: str) -> str:
+        """ Метод для лемматизации текста и удаления знаков препинания """
+        normalize_token = self.normalize_token
+        lemmed = ' '.join([normalize_token(token) for token in word_tokenize(text)])
+        return self.PUNCT_RE.sub('', lemmed)
+
+    def normalize_many(self, texts) -> list:
+        """ Метод для нормализации пачки текстов (например, всех чанков документа) """
+        normalize = self.normalize
+        return [normalize(text) for text in texts]
+
+    def cache_info(self):
+        return self.normalize_token.cache_info()
+
+
+# общий нормализатор процесса, его кэш токенов переиспользуется всеми поисками
+normalizer = TextNormalizer()
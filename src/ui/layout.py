@@ -1,6 +1,6 @@
 import flet
 
-def create_main_layout(page: flet.Page, on_search_click, on_folder_result, on_clear_click):
+def create_main_layout(page: flet.Page, on_search_click, on_folder_result, on_clear_click, on_query_change=None):
     """Создать базовый шаблон интерфейса приложения.
     Функция инициализирует основные визуальные компоненты, включая поле поиска,
     список результатов и индикатор загрузки.
@@ -9,6 +9,7 @@ def create_main_layout(page: flet.Page, on_search_click, on_folder_result, on_cl
     on_search_click (function): Обработчик события запуска поиска.
     on_folder_result (function): Обработчик события выбора папки.
     on_clear_click (function): Обработчик для очистки списка результатов.
+    on_query_change (function): Обработчик изменения текста запроса (необязательный).
     """
 
     directory_picker = flet.FilePicker(on_result=on_folder_result)
@@ -16,13 +17,14 @@ def create_main_layout(page: flet.Page, on_search_click, on_folder_result, on_cl
 
     path_display = flet.Text("No folder selected", italic=True, color=flet.Colors.GREY_500)
 
-    loader = flet.ProgressBar(visible=False, color=flet.Colors.BLUE_700)
+    loader = flet.ProgressBar(value=0, visible=False, color=flet.Colors.BLUE_700)
 
     search_input = flet.TextField(
         label="Search term",
         hint_text="Enter search term",
         expand = True,
         on_submit = on_search_click,
+        on_change = on_query_change,
     )
 
     results_list = flet.ListView(
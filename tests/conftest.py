@@ -0,0 +1,57 @@
+import hashlib
+
+import numpy as np
+import pytest
+from chromadb import EmbeddingFunction
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """Детерминированная офлайн-замена LaBSE: мешок хэшированных токенов"""
+
+    DIM = 32
+
+    def __init__(self):
+        self.calls = 0
+        self.embedded_texts = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        self.embedded_texts += len(input)
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.DIM, dtype=np.float32)
+            for token in str(text).lower().split():
+                vector[int(hashlib.md5(token.encode('utf-8')).hexdigest(), 16) % self.DIM] += 1.0
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector + 1.0 / np.sqrt(self.DIM))
+        return vectors
+
+    @staticmethod
+    def name():
+        return 'fake_test_embedding'
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return FakeEmbeddingFunction()
+
+
+@pytest.fixture
+def fake_embedding_function():
+    return FakeEmbeddingFunction()
+
+
+@pytest.fixture
+def app_data_dir(tmp_path, monkeypatch):
+    """Перенаправляет хранилище ChromaDB во временную папку"""
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / 'appdata'))
+    return tmp_path / 'appdata' / 'ChromaDBDocStorage'
+
+
+@pytest.fixture
+def plain_lemmatization(monkeypatch):
+    """Заменяет лемматизацию на приведение к нижнему регистру (без данных nltk)"""
+    from src.text_extration import TextExtraction
+    monkeypatch.setattr(TextExtraction, 'lemmatization_and_punct_clean', staticmethod(lambda text: text.lower()))
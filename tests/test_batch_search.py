@@ -0,0 +1,60 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from src.batch_search import main, read_queries
+
+
+class TestBatchSearch:
+
+    def make_folder(self, tmp_path):
+        folder = tmp_path / "docs"
+        (folder / "extra").mkdir(parents=True)
+        (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+        (folder / "extra" / "birds.txt").write_text("Птицы летают. Птицы поют.", encoding='utf-8')
+        return folder
+
+    def test_read_queries_formats(self, tmp_path):
+        path = tmp_path / "queries.jsonl"
+        path.write_text('{"id": "q1", "query": "кошки"}\n\n"собаки"\n{"query": "птицы"}\n', encoding='utf-8')
+        titles = tmp_path / "titles.jsonl"
+        titles.write_text('{"request_id": "r1", "title": "кошки"}\n', encoding='utf-8')
+
+        assert read_queries(path) == [('q1', 'кошки'), (3, 'собаки'), (4, 'птицы')]
+        assert read_queries(titles, field='title', id_field='request_id') == [('r1', 'кошки')]
+        with pytest.raises(KeyError):
+            read_queries(titles)
+
+    @pytest.mark.parametrize('retrieval', ['dense', 'hybrid'])
+    def test_indexes_once_and_batches_query_embeddings(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                       plain_lemmatization, capsys, retrieval):
+        folder = self.make_folder(tmp_path)
+        queries = tmp_path / "queries.jsonl"
+        texts = ['кошки спят', 'собаки лают', 'птицы поют'] * 3
+        queries.write_text(''.join(json.dumps({'id': i, 'query': text}, ensure_ascii=False) + '\n'
+                                   for i, text in enumerate(texts)), encoding='utf-8')
+        output = tmp_path / "results.jsonl"
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            main([str(folder), str(queries), '--output', str(output), '--batch-size', '4', '--results', '2',
+                  '--chunk-length', '20', '--retrieval', retrieval])
+            calls_after_first_run = fake_embedding_function.calls
+            main([str(folder), str(queries), '--output', str(output), '--batch-size', '4',
+                  '--chunk-length', '20', '--retrieval', retrieval])
+
+        results = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+        summary = json.loads(capsys.readouterr().err.splitlines()[0])
+
+        assert [r['id'] for r in results] == list(range(9))
+        assert [r['results'][0]['path'] for r in results[:3]] == ['cats.txt', 'dogs.txt', 'extra/birds.txt']
+        assert summary['queries'] == 9 and summary['documents'] == 3
+        assert summary['queries_per_second'] > 0
+        # индексация (одна пачка чанков) и три пачки запросов; второй запуск переиндексации не требует
+        assert calls_after_first_run == 4
+        assert fake_embedding_function.calls == calls_after_first_run + 3
+
+    def test_missing_folder(self, tmp_path):
+        with pytest.raises(SystemExit):
+            main([str(tmp_path / "missing"), str(tmp_path / "queries.jsonl")])
@@ -0,0 +1,37 @@
+import numpy as np
+
+from benchmarks.bench_pipeline import run, STAGES
+from benchmarks.compare import compare
+from benchmarks.corpus import generate_corpus
+from benchmarks.measure import percentile
+from benchmarks.stub_embedding import HashEmbeddingFunction
+
+
+class TestBenchmarks:
+
+    def test_percentile_matches_numpy(self):
+        values = [5.0, 1.0, 4.0, 2.0, 3.0, 10.0]
+
+        for q in (0, 50, 95, 100):
+            assert percentile(values, q) == np.percentile(values, q)
+        assert percentile([], 50) == 0.0
+
+    def test_stub_embedding_is_deterministic(self):
+        embedding_function = HashEmbeddingFunction(dim=16)
+
+        first, second, other = embedding_function(['кошка dog', 'кошка dog', 'river'])
+        assert np.array_equal(first, second)
+        assert not np.array_equal(first, other)
+        assert np.isclose(np.linalg.norm(first), 1.0)
+
+    def test_pipeline_reports_every_stage(self, tmp_path):
+        folder = tmp_path / "corpus"
+        generate_corpus(folder, files=3, sentences_per_file=20, languages=('ru', 'en'))
+
+        results = run(folder, tmp_path / "storage", chunk_length=200, batch=8, queries=5, walk_repeat=1, dim=16)
+
+        assert results['parameters']['files'] == 3
+        assert set(results['stages']) == {name for name, _ in STAGES}
+        assert all(stage['items'] > 0 for stage in results['stages'].values())
+        assert results['stages']['query']['operations'] == 5
+        assert [row['stage'] for row in compare(results, results)] == [name for name, _ in STAGES]
@@ -1,4 +1,7 @@
-from src.chunk_processing import chunk_text_by_sentence, find_best_chunk
+from src.chunk_processing import (chunk_text_by_sentence, chunk_pages_by_sentence, find_best_chunk,
+                                  find_best_documents, iter_chunk_spans, iter_chunks, iter_sentence_spans)
+import random
+import re
 from unittest.mock import Mock, patch
 
 
@@ -65,7 +68,9 @@ class TestChunkTextBySentence:
         text = "Dr. Smith is here. He will meet you at noon."
         result = chunk_text_by_sentence(text, 10)
         assert len(result) > 0
-        assert any("Dr. Smith is here." in chunk for chunk in result)
+        # граничное предложение больше не дублируется в соседних чанках
+        assert result == ["Dr.", "Smith is here.", "He will meet you at noon."]
+        assert any("Dr. Smith is here." in chunk for chunk in chunk_text_by_sentence(text, 20))
 
 
 class TestFindBestChunk:
@@ -156,4 +161,178 @@ class TestFindBestChunk:
             chunk, distance = find_best_chunk(mock_collection, 'long query')
         
         assert chunk == long_chunk
-        assert distance == 0.4
\ No newline at end of file
+        assert distance == 0.4
+
+    def test_find_best_chunk_with_query_embedding(self):
+        mock_collection = Mock()
+        mock_collection.query.return_value = {
+            'distances': [[0.2]],
+            'documents': [['chunk']]
+        }
+
+        with patch('src.chunk_processing.TextExtraction.lemmatization_and_punct_clean') as mock_lem:
+            find_best_chunk(mock_collection, 'request', query_embedding=[0.1, 0.2])
+
+        mock_lem.assert_not_called()
+        mock_collection.query.assert_called_once_with(query_embeddings=[[0.1, 0.2]], n_results=1)
+
+class TestFindBestDocuments:
+
+    @staticmethod
+    def make_collection(paths, distances, total=None):
+        collection = Mock()
+        collection.count.return_value = total if total is not None else len(paths)
+        collection.query.return_value = {
+            'metadatas': [[{'path': p} for p in paths]],
+            'distances': [distances]
+        }
+        return collection
+
+    def test_groups_chunks_by_path(self):
+        collection = self.make_collection(['a.txt', 'b.txt', 'a.txt'], [0.1, 0.2, 0.3])
+
+        with patch('src.chunk_processing.TextExtraction.lemmatization_and_punct_clean', return_value='q'):
+            result = find_best_documents(collection, 'q', results_count=2, n_results=10)
+
+        assert result == {'a.txt': 0.1, 'b.txt': 0.2}
+        collection.query.assert_called_once_with(query_texts=['q'], n_results=3, include=['metadatas', 'distances'])
+
+    def test_expands_n_results_when_too_few_documents(self):
+        collection = self.make_collection(['a.txt', 'a.txt'], [0.1, 0.2], total=8)
+
+        with patch('src.chunk_processing.TextExtraction.lemmatization_and_punct_clean', return_value='q'):
+            find_best_documents(collection, 'q', results_count=2, n_results=2)
+
+        assert [c.kwargs['n_results'] for c in collection.query.call_args_list] == [2, 4, 8]
+
+    def test_filters_not_allowed_paths(self):
+        collection = self.make_collection(['deleted.txt', 'a.txt'], [0.1, 0.2])
+
+        with patch('src.chunk_processing.TextExtraction.lemmatization_and_punct_clean', return_value='q'):
+            result = find_best_documents(collection, 'q', results_count=1, n_results=2, allowed_paths=['a.txt'])
+
+        assert result == {'a.txt': 0.2}
+
+    def test_empty_collection(self):
+        collection = self.make_collection([], [], total=0)
+
+        with patch('src.chunk_processing.TextExtraction.lemmatization_and_punct_clean', return_value='q'):
+            assert find_best_documents(collection, 'q', results_count=3, n_results=10) == {}
+        collection.query.assert_not_called()
+
+
+class TestChunkPagesBySentence:
+
+    def test_matches_chunking_of_concatenated_text(self):
+        pages = [(1, "First sentence. Second sen"), (2, "tence continues. Third"), (3, " one. Last.")]
+        text = ''.join(page_text for _, page_text in pages)
+
+        result = [chunk for chunk, _, _ in chunk_pages_by_sentence(pages, 25)]
+
+        assert result == chunk_text_by_sentence(text, 25)
+
+    def test_records_page_range(self):
+        pages = [(1, "Alpha beta. Gamma "), (2, "delta. Epsilon.")]
+
+        result = list(chunk_pages_by_sentence(pages, 100))
+
+        assert result == [("Alpha beta. Gamma delta. Epsilon.", 1, 2)]
+
+    def test_sentence_starting_on_next_page(self):
+        pages = [(1, "One. "), (2, "Two. Three.")]
+
+        result = list(chunk_pages_by_sentence(pages, 6))
+
+        assert result[0][1] == 1
+        assert result[-1][1:] == (2, 2)
+
+    def test_is_lazy(self):
+        consumed = []
+
+        def pages():
+            for number in range(1, 1000):
+                consumed.append(number)
+                yield number, f"Sentence number {number}. "
+
+        first = next(chunk_pages_by_sentence(pages(), 30))
+
+        assert first[1] == 1
+        assert len(consumed) < 5
+
+
+class TestSpanChunker:
+
+    def test_sentence_spans_match_regex_split(self):
+        rng = random.Random(7)
+        alphabet = ['a', 'b', ' ', '  ', '.', '?', '!', '\n']
+        for _ in range(2000):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+            cuts = sorted(rng.sample(range(len(text) + 1), min(3, len(text) + 1)))
+            pages = [(number, text[a:b]) for number, (a, b) in enumerate(zip([0] + cuts, cuts + [len(text)]))]
+
+            spans = list(iter_sentence_spans(pages))
+
+            assert [sentence for *_, sentence in spans] == re.split(r'(?<=[.?!])\s+', text)
+            assert all(text[start:end] == sentence for start, end, _, sentence in spans)
+
+    def test_records_offsets_and_sentence_count(self):
+        text = "One two. Three four. Five six."
+
+        spans = list(iter_chunk_spans([(None, text)], 20))
+
+        assert [text[span.start:span.end] for span in spans] == ["One two. Three four.", "Five six."]
+        assert [span.sentences for span in spans] == [2, 1]
+
+    def test_no_sentence_is_duplicated_without_overlap(self):
+        text = " ".join(f"Sentence {i}." for i in range(50))
+
+        chunks = chunk_text_by_sentence(text, 40)
+
+        assert " ".join(chunks) == text
+        assert all(len(chunk) <= 40 for chunk in chunks)
+
+    def test_overlap_repeats_trailing_sentences(self):
+        text = "Aa. Bb. Cc. Dd. Ee."
+
+        chunks = chunk_text_by_sentence(text, 11, overlap=3)
+
+        assert chunks == ["Aa. Bb. Cc.", "Cc. Dd. Ee."]
+
+    def test_overlap_never_repeats_whole_chunk(self):
+        chunks = chunk_text_by_sentence("Aa. Bb. Cc.", 3, overlap=100)
+
+        assert chunks == ["Aa.", "Bb.", "Cc."]
+
+    def test_max_length_splits_run_on_sentence(self):
+        text = "word " * 30 + "end. Short."
+        pages = [(1, text[:60]), (2, text[60:])]
+
+        result = list(iter_chunks(pages, 40, max_length=40))
+
+        assert all(len(chunk) <= 40 for chunk, _ in result)
+        assert " ".join(chunk for chunk, _ in result) == text.strip().replace("  ", " ")
+        assert result[0][1].first_page == 1 and result[-1][1].last_page == 2
+        assert all(text[span.start:span.end] == chunk for chunk, span in result if span.sentences == 1)
+
+    def test_word_longer_than_max_length_is_cut(self):
+        assert chunk_text_by_sentence("x" * 25, 10, max_length=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+    def test_long_stream_is_linear(self):
+        pages = ((page, "Короткое предложение номер %d. " % page) for page in range(50_000))
+
+        total = sum(span.sentences for span in iter_chunk_spans(pages, 400))
+
+        assert total == 50_000
+
+    def test_run_on_text_is_cut_without_buffering(self):
+        random.seed(7)
+        text = " ".join(random.choice(["log", "line", "x" * 30, "end.", "\n"]) for _ in range(2000))
+        windows = [(None, text[i:i + 13]) for i in range(0, len(text), 13)]
+
+        whole = [chunk for chunk, _ in iter_chunks([(None, text)], 50, max_length=60)]
+        log = " ".join(["log line without punctuation"] * 1000)
+        streamed = iter_sentence_spans(((None, log[i:i + 13]) for i in range(0, len(log), 13)), max_length=60)
+
+        assert [chunk for chunk, _ in iter_chunks(windows, 50, max_length=60)] == whole
+        # незаконченное предложение отдаётся частями, как только известно больше max_length символов
+        assert all(end - start <= 60 for start, end, _, _ in streamed)
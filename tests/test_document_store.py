@@ -0,0 +1,186 @@
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src.document_store import DocumentStore, ReadWriteLock, close_stores, get_store
+from src.embedding_pipeline import EmbeddingBatcher
+from src.maintenance import compact
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят на диване.", encoding='utf-8')
+    (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают на почтальона.", encoding='utf-8')
+    (folder / "fish.txt").write_text("Рыбы плавают в реке. Рыбы мечут икру.", encoding='utf-8')
+    return folder
+
+
+class TestReadWriteLock:
+
+    def test_readers_share_the_lock(self):
+        lock = ReadWriteLock()
+        barrier = threading.Barrier(3, timeout=5)
+
+        def read():
+            with lock.read_locked():
+                barrier.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert lock.max_readers == 3
+
+    def test_writer_excludes_readers(self):
+        lock = ReadWriteLock()
+        events = []
+
+        def read():
+            with lock.read_locked():
+                events.append('read')
+
+        def write():
+            with lock.write_locked():
+                events.append('write start')
+                time.sleep(0.1)
+                events.append('write end')
+
+        with lock.read_locked():
+            writer = threading.Thread(target=write)
+            writer.start()
+            time.sleep(0.05)
+            # ожидающий писатель не пропускает новых читателей вперёд
+            reader = threading.Thread(target=read)
+            reader.start()
+            time.sleep(0.05)
+            events.append('first read end')
+        writer.join()
+        reader.join()
+
+        assert events == ['first read end', 'write start', 'write end', 'read']
+
+
+class TestDocumentStore:
+
+    def test_search_takes_query_as_argument(self, folder, app_data_dir, fake_embedding_function,
+                                            plain_lemmatization):
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            store = DocumentStore(folder, chunk_length=30, retrieval='hybrid')
+            with pytest.raises(RuntimeError):
+                store.search('кошки')
+            first, second = store.refresh(), store.refresh()
+            assert (first['documents'], first['indexed'], second['indexed']) == (3, 3, 0)
+
+            assert store.search('собаки лают')[0][0] == Path('dogs.txt')
+            assert store.search('кошки спят', limit=1)[0][0] == Path('cats.txt')
+            assert [path for path, _ in store.search('кошки', allowed_paths=['fish.txt'])] == [Path('fish.txt')]
+            store.close()
+
+    def test_get_store_is_shared(self, folder, app_data_dir, fake_embedding_function, plain_lemmatization):
+        try:
+            assert get_store(folder, chunk_length=30) is get_store(folder, chunk_length=30)
+            assert get_store(folder, chunk_length=30) is not get_store(folder, chunk_length=50)
+        finally:
+            close_stores()
+
+    def test_searches_run_while_refresh_embeds(self, folder, app_data_dir, fake_embedding_function,
+                                               plain_lemmatization):
+        embedding, release = threading.Event(), threading.Event()
+        flush = EmbeddingBatcher.flush
+
+        def slow_flush(batcher):
+            embedding.set()
+            assert release.wait(5)
+            flush(batcher)
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            store = DocumentStore(folder, chunk_length=30)
+            store.refresh()
+            (folder / "dogs.txt").write_text("Собаки спят весь день.", encoding='utf-8')
+            with patch.object(EmbeddingBatcher, 'flush', slow_flush):
+                refresher = threading.Thread(target=store.refresh)
+                refresher.start()
+                try:
+                    assert embedding.wait(5)
+                    # эмбеддинг идёт вне блокировки записи: поиск не ждёт переиндексацию и видит старую версию
+                    before = store.search('собаки охраняют дом')
+                finally:
+                    release.set()
+                    refresher.join()
+            after = store.search('собаки спят')
+            store.close()
+
+        assert before[0][0] == after[0][0] == Path('dogs.txt')
+        assert store.searches == 2
+
+    def test_stores_of_two_folders_keep_each_others_manifest_entries(self, folder, tmp_path, app_data_dir,
+                                                                    fake_embedding_function, plain_lemmatization):
+        other = tmp_path / "other"
+        other.mkdir()
+        (other / "birds.txt").write_text("Птицы поют по утрам.", encoding='utf-8')
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            # оба индекса открыты до первой переиндексации, их манифесты загружены пустыми
+            stores = [DocumentStore(folder, chunk_length=30), DocumentStore(other, chunk_length=30)]
+            for store in stores:
+                store.refresh()
+            report = compact()
+
+            assert (report['collections_dropped'], report['documents_dropped']) == (0, 0)
+            assert [store.refresh()['indexed'] for store in stores] == [0, 0]
+            assert stores[0].search('собаки лают')[0][0] == Path('dogs.txt')
+            assert stores[1].search('птицы')[0][0] == Path('birds.txt')
+            for store in stores:
+                store.close()
+
+    @pytest.mark.parametrize('vector_backend, pipeline', [('chroma', False), ('flat', True)])
+    def test_parallel_searches_while_reindexing(self, folder, app_data_dir, fake_embedding_function,
+                                                plain_lemmatization, vector_backend, pipeline):
+        queries = {'кошки ловят мышей': 'cats.txt', 'собаки охраняют дом': 'dogs.txt', 'рыбы плавают': 'fish.txt'}
+        errors, rankings = [], []
+        stop = threading.Event()
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            store = DocumentStore(folder, chunk_length=30, retrieval='hybrid', vector_backend=vector_backend,
+                                  pipeline=pipeline)
+            store.refresh()
+
+            def search(query):
+                try:
+                    while not stop.is_set():
+                        rankings.append((query, store.search(query)))
+                except Exception as error:
+                    errors.append(error)
+                    raise
+
+            threads = [threading.Thread(target=search, args=(query,)) for query in list(queries) * 3]
+            for thread in threads:
+                thread.start()
+            try:
+                for i in range(5):
+                    (folder / f"birds{i}.txt").write_text(f"Птицы поют. Птицы {i} вьют гнёзда.", encoding='utf-8')
+                    (folder / "dogs.txt").write_text(f"Собаки охраняют дом. Собаки {i} лают.", encoding='utf-8')
+                    if i:
+                        (folder / f"birds{i - 1}.txt").unlink()
+                    assert store.refresh()['indexed'] == 2
+            finally:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            final = store.search('птицы поют')
+            store.close()
+
+        assert errors == []
+        assert store.lock.max_readers > 1
+        assert store.searches == len(rankings) + 1 and len(rankings) > len(threads)
+        # каждый поиск видел целое состояние индекса: лучший документ всегда верный, удалённых файлов нет
+        for query, ranking in rankings:
+            assert ranking[0][0].name == queries[query]
+            assert len({path for path, _ in ranking}) == len(ranking)
+        assert final[0][0] == Path('birds4.txt')
+        assert not any(path.name.startswith('birds') and path.name != 'birds4.txt' for path, _ in final)
@@ -0,0 +1,112 @@
+import os
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from src.document_search import RelevantDocumentsSearch
+from src.embedding_cache import EmbeddingCache
+from src.embedding_pipeline import EmbeddingBatcher
+
+
+def fake_embed(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+class TestEmbeddingCache:
+
+    def test_model_called_once_per_unique_text(self, tmp_path):
+        cache = EmbeddingCache(tmp_path, 'model')
+        embedding_function = Mock(side_effect=fake_embed)
+        first = cache.embed(['aa', 'b', 'aa'], embedding_function)
+        second = cache.embed(['b', 'aa'], embedding_function)
+
+        embedding_function.assert_called_once_with(['aa', 'b'])
+        assert [list(v) for v in first] == [[2.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+        assert [list(v) for v in second] == [[1.0, 1.0], [2.0, 1.0]]
+        assert cache.hits == 2 and cache.misses == 2
+
+    def test_survives_reopen(self, tmp_path):
+        cache = EmbeddingCache(tmp_path, 'model')
+        cache.embed(['текст'], fake_embed)
+        cache.close()
+
+        reopened = EmbeddingCache(tmp_path, 'model')
+        embedding_function = Mock(side_effect=fake_embed)
+        assert list(reopened.embed(['текст'], embedding_function)[0]) == [5.0, 1.0]
+        embedding_function.assert_not_called()
+
+    def test_models_do_not_share_vectors(self, tmp_path):
+        EmbeddingCache(tmp_path, 'org/model-a').embed(['a'], fake_embed)
+
+        assert EmbeddingCache(tmp_path, 'org/model-b').lookup(['a']) == [None]
+
+    def test_truncated_vectors_file_is_recovered(self, tmp_path):
+        cache = EmbeddingCache(tmp_path, 'model')
+        cache.embed(['a', 'b'], fake_embed)
+        cache.close()
+        with open(cache.vectors_path, 'r+b') as file:
+            file.truncate(os.path.getsize(cache.vectors_path) - 4)
+
+        reopened = EmbeddingCache(tmp_path, 'model')
+        found = reopened.lookup(['a', 'b'])
+        assert list(found[0]) == [1.0, 1.0]
+        assert found[1] is None
+
+    def test_two_writers_share_the_file(self, tmp_path):
+        # две копии кэша над одной папкой - как приложение и сервис поиска в разных процессах
+        first, second = EmbeddingCache(tmp_path, 'model'), EmbeddingCache(tmp_path, 'model')
+        first.embed(['a'], fake_embed)
+        second.embed(['bb'], fake_embed)
+        first.embed(['ccc'], fake_embed)
+
+        for cache in (first, second, EmbeddingCache(tmp_path, 'model')):
+            assert [list(vector) for vector in cache.lookup(['a', 'bb', 'ccc'])] == [[1.0, 1.0], [2.0, 1.0],
+                                                                                      [3.0, 1.0]]
+
+    def test_cache_opened_empty_reads_vectors_of_another_writer(self, tmp_path):
+        first, second = EmbeddingCache(tmp_path, 'model'), EmbeddingCache(tmp_path, 'model')
+        second.embed(['x'], fake_embed)
+
+        assert first.dim is None
+        found = first.lookup(['x', 'y'])
+        assert list(found[0]) == [1.0, 1.0] and found[1] is None
+
+    def test_other_dimension_from_another_writer_is_not_stored(self, tmp_path):
+        first, second = EmbeddingCache(tmp_path, 'model'), EmbeddingCache(tmp_path, 'model')
+        first.embed(['a'], fake_embed)
+        second.store(['b'], [[1.0, 2.0, 3.0]])
+
+        assert second.dim == 2 and second.lookup(['b']) == [None]
+
+    def test_batcher_reuses_cached_vectors(self, tmp_path):
+        cache = EmbeddingCache(tmp_path, 'model')
+        embedding_function = Mock(side_effect=fake_embed)
+        collection = Mock()
+        for _ in range(2):
+            batcher = EmbeddingBatcher(embedding_function, embedding_cache=cache)
+            batcher.add(collection, ['0'], ['abc'], [{}])
+            batcher.flush()
+
+        embedding_function.assert_called_once_with(['abc'])
+        np.testing.assert_array_equal(collection.upsert.call_args.kwargs['embeddings'][0], [3.0, 1.0])
+        assert '1 hits / 1 misses' in batcher.report()
+
+
+class TestDuplicateDocuments:
+
+    def test_copies_cost_no_model_time(self, tmp_path, app_data_dir, fake_embedding_function,
+                                       plain_lemmatization):
+        text = "Кошки ловят мышей. Кошки спят днём."
+        for folder in ("documents", "extra_folder"):
+            (tmp_path / folder).mkdir()
+        (tmp_path / "documents" / "cats.txt").write_text(text, encoding='utf-8')
+        (tmp_path / "extra_folder" / "cats2.txt").write_text(text, encoding='utf-8')
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            RelevantDocumentsSearch(tmp_path / "documents", 'кошки', chunk_length=20).find_documents()
+            embedded_before = fake_embedding_function.embedded_texts
+            search = RelevantDocumentsSearch(tmp_path / "extra_folder", 'кошки', chunk_length=20)
+            result = search.find_documents()
+
+        assert result[0].name == 'cats2.txt'
+        assert fake_embedding_function.embedded_texts == embedded_before
+        assert search.embedding_stats.chunks_embedded == 2
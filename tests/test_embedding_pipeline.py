@@ -0,0 +1,74 @@
+from unittest.mock import Mock, patch
+
+from src.embedding_pipeline import EmbeddingBatcher
+from src.document_search import RelevantDocumentsSearch
+
+
+def fake_embed(texts):
+    return [[float(len(text))] for text in texts]
+
+
+class TestEmbeddingBatcher:
+
+    def test_flush_groups_by_collection(self):
+        first, second = Mock(), Mock()
+        batcher = EmbeddingBatcher(Mock(side_effect=fake_embed), max_chunks=100)
+        batcher.add(first, ['0', '1'], ['aa', 'b'], [{'path': 'a'}, {'path': 'a'}])
+        batcher.add(second, ['0'], ['ccc'], [{'path': 'c'}])
+        batcher.flush()
+
+        batcher.embedding_function.assert_called_once_with(['aa', 'b', 'ccc'])
+        first.upsert.assert_called_once_with(ids=['0', '1'], documents=['aa', 'b'],
+                                             metadatas=[{'path': 'a'}, {'path': 'a'}], embeddings=[[2.0], [1.0]])
+        second.upsert.assert_called_once_with(ids=['0'], documents=['ccc'], metadatas=[{'path': 'c'}],
+                                              embeddings=[[3.0]])
+        assert batcher.chunks_embedded == 3
+
+    def test_flushes_by_chunk_count(self):
+        batcher = EmbeddingBatcher(Mock(side_effect=fake_embed), max_chunks=2)
+        batcher.add(Mock(), ['0', '1', '2'], ['a', 'b', 'c'], [{}, {}, {}])
+
+        assert batcher.batches == 1
+        assert len(batcher.pending) == 1
+
+    def test_flushes_by_total_chars(self):
+        batcher = EmbeddingBatcher(Mock(side_effect=fake_embed), max_chunks=100, max_chars=5)
+        batcher.add(Mock(), ['0', '1'], ['abc', 'def'], [{}, {}])
+
+        assert batcher.batches == 1
+        assert batcher.pending == []
+
+    def test_callback_after_last_chunk_is_written(self):
+        callback = Mock()
+        batcher = EmbeddingBatcher(Mock(side_effect=fake_embed), max_chunks=2)
+        batcher.add(Mock(), ['0', '1', '2'], ['a', 'b', 'c'], [{}, {}, {}], callback)
+        callback.assert_not_called()
+
+        batcher.flush()
+        callback.assert_called_once()
+
+    def test_report_contains_throughput(self):
+        batcher = EmbeddingBatcher(Mock(side_effect=fake_embed))
+        batcher.add(Mock(), ['0'], ['a'], [{}])
+        batcher.flush()
+
+        assert 'chunks/s' in batcher.report()
+
+
+class TestBatchedIndexing:
+
+    def test_many_documents_are_embedded_in_one_call(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                     plain_lemmatization):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        for i in range(5):
+            (folder / f"doc{i}.txt").write_text(f"Документ номер {i}. Ещё одно предложение.", encoding='utf-8')
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'документ', chunk_length=20)
+            result = search.find_documents()
+
+        assert len(result) == 5
+        assert search.embedding_stats.batches == 1
+        assert search.embedding_stats.chunks_embedded >= 5
+        assert fake_embedding_function.calls <= 2  # одна пачка чанков и, возможно, эмбеддинг запроса
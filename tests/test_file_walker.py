@@ -0,0 +1,126 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from src.file_walker import FileWalker, IgnoreRules
+from src.text_extration import SUPPORTED_EXTENSIONS, TextExtraction
+
+
+def relative(paths, root):
+    return sorted(path.relative_to(root).as_posix() for path in paths)
+
+
+class TestIgnoreRules:
+
+    def test_basename_pattern_matches_at_any_depth(self):
+        rules = IgnoreRules(['*.log', 'build/'])
+
+        assert rules.ignored('a.log')
+        assert rules.ignored('deep/dir/a.log')
+        assert rules.ignored('src/build', is_dir=True)
+        assert not rules.ignored('build')  # 'build/' only matches directories
+        assert not rules.ignored('a.txt')
+
+    def test_anchored_and_double_star_patterns(self):
+        rules = IgnoreRules(['/drafts', 'docs/**/old.txt'])
+
+        assert rules.ignored('drafts', is_dir=True)
+        assert not rules.ignored('sub/drafts', is_dir=True)
+        assert rules.ignored('docs/old.txt')
+        assert rules.ignored('docs/a/b/old.txt')
+
+    def test_negation_and_comments(self):
+        rules = IgnoreRules(['# comment', '', '*.md', '!keep.md'])
+
+        assert rules.ignored('notes.md')
+        assert not rules.ignored('keep.md')
+
+    def test_rules_from_subdirectory_are_scoped(self):
+        rules = IgnoreRules()
+        rules.add(['*.txt'], base='sub')
+
+        assert rules.ignored('sub/a.txt')
+        assert not rules.ignored('a.txt')
+
+
+class TestFileWalker:
+
+    def test_filters_unsupported_extensions(self, tmp_path):
+        (tmp_path / "a.txt").write_text("A", encoding='utf-8')
+        (tmp_path / "b.PDF").write_bytes(b"")
+        (tmp_path / "image.png").write_bytes(b"\x89PNG")
+        (tmp_path / "archive.zip").write_bytes(b"PK")
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS)
+
+        assert relative(walker.walk(tmp_path), tmp_path) == ["a.txt", "b.PDF"]
+        assert walker.skipped == {'unsupported': 2}
+
+    def test_skips_hidden_and_system_directories(self, tmp_path):
+        for name in (".git", "__pycache__", "visible"):
+            (tmp_path / name).mkdir()
+            (tmp_path / name / "a.txt").write_text("A", encoding='utf-8')
+        (tmp_path / ".hidden.txt").write_text("H", encoding='utf-8')
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS)
+        assert relative(walker.walk(tmp_path), tmp_path) == ["visible/a.txt"]
+        assert walker.skipped == {'hidden': 3}
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS, include_hidden=True)
+        assert relative(walker.walk(tmp_path), tmp_path) == [".git/a.txt", ".hidden.txt", "visible/a.txt"]
+
+    def test_honors_exclude_patterns_and_ignore_files(self, tmp_path):
+        (tmp_path / "drafts").mkdir()
+        (tmp_path / "drafts" / "a.txt").write_text("A", encoding='utf-8')
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / ".docsearchignore").write_text("secret*.txt\n", encoding='utf-8')
+        (tmp_path / "sub" / "secret1.txt").write_text("S", encoding='utf-8')
+        (tmp_path / "sub" / "public.txt").write_text("P", encoding='utf-8')
+        (tmp_path / "secret2.txt").write_text("S", encoding='utf-8')
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS, exclude_patterns=['drafts/'])
+
+        assert relative(walker.walk(tmp_path), tmp_path) == ["secret2.txt", "sub/public.txt"]
+        assert walker.skipped == {'ignored': 2}
+
+    def test_skips_files_above_size_cap(self, tmp_path):
+        (tmp_path / "small.txt").write_text("x" * 10, encoding='utf-8')
+        (tmp_path / "large.txt").write_text("x" * 1000, encoding='utf-8')
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS, max_file_bytes=100)
+
+        assert relative(walker.walk(tmp_path), tmp_path) == ["small.txt"]
+        assert walker.skipped == {'too_large': 1}
+
+    def test_uncapped_extensions_ignore_size_cap(self, tmp_path):
+        (tmp_path / "huge.log").write_text("x" * 1000, encoding='utf-8')
+        (tmp_path / "large.pdf").write_bytes(b"x" * 1000)
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS, max_file_bytes=100, uncapped_extensions=('.log',))
+
+        assert relative(walker.walk(tmp_path), tmp_path) == ["huge.log"]
+        assert walker.skipped == {'too_large': 1}
+
+    def test_survives_symlink_loops(self, tmp_path):
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "a.txt").write_text("A", encoding='utf-8')
+        try:
+            os.symlink(tmp_path, tmp_path / "sub" / "loop", target_is_directory=True)
+        except (OSError, NotImplementedError):
+            pytest.skip("symlinks are not available")
+
+        walker = FileWalker(SUPPORTED_EXTENSIONS)
+
+        assert relative(walker.walk(tmp_path), tmp_path) == ["sub/a.txt"]
+        assert walker.skipped == {'symlink_loop': 1}
+
+    def test_extraction_ignores_unsupported_files(self, tmp_path):
+        (tmp_path / "a.txt").write_text("A", encoding='utf-8')
+        (tmp_path / "data.bin").write_bytes(b"\x00\x01")
+        (tmp_path / "skip.md").write_text("S", encoding='utf-8')
+
+        extractor = TextExtraction(str(tmp_path), exclude_patterns=['skip.md'])
+
+        assert extractor.extract() == {Path("a.txt"): "A"}
+        assert extractor.skipped == {'unsupported': 1, 'ignored': 1}
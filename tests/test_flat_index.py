@@ -0,0 +1,151 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.document_search import RelevantDocumentsSearch
+from src.flat_index import FlatVectorIndex
+
+
+def random_vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+class TestFlatVectorIndex:
+
+    def test_save_and_reload(self, tmp_path):
+        index = FlatVectorIndex(tmp_path / "flat", 'docs')
+        vectors = random_vectors(3)
+        index.upsert(['a#0', 'a#1', 'b#0'], vectors, [{'path': 'a'}, {'path': 'a'}, {'path': 'b'}])
+        index.save()
+
+        reopened = FlatVectorIndex(tmp_path / "flat", 'docs')
+        stored = reopened.get(['b#0', 'missing'], include=['embeddings', 'metadatas'])
+
+        assert isinstance(reopened.matrix, np.memmap)
+        assert reopened.count() == 3
+        assert stored['ids'] == ['b#0'] and stored['metadatas'] == [{'path': 'b'}]
+        np.testing.assert_allclose(stored['embeddings'][0], vectors[2] / np.linalg.norm(vectors[2]), rtol=1e-6)
+
+    def test_delete_and_replace(self, tmp_path):
+        index = FlatVectorIndex(tmp_path / "flat", 'docs')
+        index.upsert(['a#0', 'b#0'], random_vectors(2), [{'path': 'a'}, {'path': 'b'}])
+        index.save()
+        index.delete(where={'path': 'a'})
+        index.upsert(['b#0'], random_vectors(1, seed=1), [{'path': 'b'}])
+
+        assert index.count() == 1
+        index.save()
+        assert FlatVectorIndex(tmp_path / "flat", 'docs').ids == ['b#0']
+
+    def test_best_documents_matches_brute_force(self, tmp_path):
+        vectors = random_vectors(200, seed=2)
+        paths = [f'doc{i % 17}' for i in range(200)]
+        index = FlatVectorIndex(tmp_path / "flat", 'docs')
+        index.upsert([f'c{i}' for i in range(150)], vectors[:150], [{'path': p} for p in paths[:150]])
+        index.save()
+        # часть строк ещё не сохранена - они тоже участвуют в поиске
+        index.upsert([f'c{i}' for i in range(150, 200)], vectors[150:], [{'path': p} for p in paths[150:]])
+        query = random_vectors(1, seed=3)[0]
+
+        best = index.best_documents(query, results_count=5)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarities = normalized @ (query / np.linalg.norm(query))
+        expected = {}
+        for path, similarity in zip(paths, similarities):
+            expected[path] = min(expected.get(path, 2.0), 1.0 - similarity)
+        top = sorted(expected.items(), key=lambda item: item[1])[:5]
+        assert sorted(best.items(), key=lambda item: item[1]) == pytest.approx(top)
+        assert index.search(query, 1)[0][1] == pytest.approx(top[0][1])
+
+    def test_allowed_paths_and_float16(self, tmp_path):
+        index = FlatVectorIndex(tmp_path / "flat", 'docs', dtype='float16')
+        vectors = random_vectors(4, seed=4)
+        index.upsert(['a', 'b', 'c', 'd'], vectors, [{'path': p} for p in 'abcd'])
+        index.save()
+
+        reopened = FlatVectorIndex(tmp_path / "flat", 'docs', dtype='float16')
+        best = reopened.best_documents(vectors[0], results_count=3, allowed_paths={'b', 'c'})
+
+        assert reopened.matrix.dtype == np.float16
+        assert set(best) == {'b', 'c'}
+        assert FlatVectorIndex(tmp_path / "flat", 'docs').count() == 0  # другой dtype - индекс перестраивается
+
+    def test_dimension_mismatch(self, tmp_path):
+        index = FlatVectorIndex(tmp_path / "flat", 'docs')
+        index.upsert(['a'], random_vectors(1, dim=8))
+
+        with pytest.raises(ValueError):
+            index.upsert(['b'], random_vectors(1, dim=4))
+
+    def test_save_with_stored_and_pending_rows(self, tmp_path):
+        index = FlatVectorIndex(tmp_path / "flat", 'docs')
+        index.upsert(['a#0', 'a#1'], random_vectors(2), [{'path': 'a'}, {'path': 'a'}])
+        index.save()
+        index.upsert(['b#0'], random_vectors(1, seed=1), [{'path': 'b'}])
+        index.save()
+
+        assert FlatVectorIndex(tmp_path / "flat", 'docs').ids == ['a#0', 'a#1', 'b#0']
+        assert index.get(include=[])['ids'] == ['a#0', 'a#1', 'b#0']
+
+
+    def test_path_table_tracks_stored_and_pending_rows(self, tmp_path):
+        index = FlatVectorIndex(tmp_path / "flat", 'docs')
+        index.upsert(['a#0', 'a#1', 'b#0'], random_vectors(3), [{'path': 'a'}, {'path': 'a'}, {'path': 'b'}])
+        index.save()
+        # a#1 переезжает в новый документ c, d#0 - новый несохранённый документ
+        index.upsert(['a#1', 'd#0'], random_vectors(2, seed=1), [{'path': 'c'}, {'path': 'd'}])
+        index.delete(where={'path': 'a'})
+
+        assert index.path_codes.dtype == np.int32 and index.rows_of_path == {'a': [0, 1], 'b': [2]}
+        assert sorted(index.get(include=[])['ids']) == ['a#1', 'b#0', 'd#0']
+        best = index.best_documents(random_vectors(1, seed=2)[0], 10, allowed_paths={'b', 'c', 'd', 'missing'})
+        assert set(best) == {'b', 'c', 'd'}
+
+        index.delete(where={'path': 'c'})
+        index.save()
+        assert FlatVectorIndex(tmp_path / "flat", 'docs').path_table == ['b', 'd']
+
+
+class TestFlatBackendSearch:
+
+    def make_folder(self, tmp_path):
+        folder = tmp_path / "docs"
+        (folder / "extra").mkdir(parents=True)
+        (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+        (folder / "extra" / "birds.txt").write_text("Птицы летают. Птицы поют.", encoding='utf-8')
+        return folder
+
+    @pytest.mark.parametrize('query', ['птицы поют', 'собаки', 'кошки спят дома'])
+    def test_ranking_matches_chroma(self, tmp_path, app_data_dir, fake_embedding_function, plain_lemmatization,
+                                    query):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            chroma = RelevantDocumentsSearch(folder, query, chunk_length=20).find_documents()
+            flat = RelevantDocumentsSearch(folder, query, chunk_length=20, vector_backend='flat').find_documents()
+
+        # документы без общих с запросом токенов равноудалены, их порядок не определён
+        assert flat[0] == chroma[0]
+        assert sorted(flat) == sorted(chroma)
+
+    def test_incremental_updates(self, tmp_path, app_data_dir, fake_embedding_function, plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'птицы', chunk_length=20, vector_backend='flat',
+                                             retrieval='hybrid')
+            assert search.find_documents()[0].name == 'birds.txt'
+            (folder / "extra" / "birds.txt").unlink()
+            embedded_before = fake_embedding_function.embedded_texts
+            result = search.find_documents()
+            collection = search.open_shared_collection()
+
+        assert all(p.name != 'birds.txt' for p in result)
+        assert fake_embedding_function.embedded_texts == embedded_before  # ничего не переиндексировано
+        assert collection.count() == 4  # чанки удалённого файла вычищены
+
+    def test_unknown_backend(self, tmp_path, app_data_dir):
+        with pytest.raises(ValueError):
+            RelevantDocumentsSearch(tmp_path, 'запрос', vector_backend='faiss')
+
@@ -0,0 +1,165 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from src.chunk_processing import chunk_pages_by_sentence
+from src.index_manifest import IndexManifest
+from src.document_search import RelevantDocumentsSearch, MODEL_NAME
+
+
+class TestIndexManifest:
+
+    def test_unknown_file_is_not_fresh(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+
+        assert not manifest.is_fresh('doc.txt', file, 400, MODEL_NAME)
+
+    def test_updated_file_is_fresh_after_reload(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+        manifest.update('doc.txt', file, 400, MODEL_NAME)
+        manifest.save()
+
+        reloaded = IndexManifest(str(tmp_path))
+        assert reloaded.is_fresh('doc.txt', file, 400, MODEL_NAME)
+
+    def test_modified_file_is_not_fresh(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+        manifest.update('doc.txt', file, 400, MODEL_NAME)
+
+        file.write_text("other text", encoding='utf-8')
+        assert not manifest.is_fresh('doc.txt', file, 400, MODEL_NAME)
+
+    def test_touched_file_with_same_content_is_fresh(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+        manifest.update('doc.txt', file, 400, MODEL_NAME)
+
+        stat = os.stat(file)
+        os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert manifest.is_fresh('doc.txt', file, 400, MODEL_NAME)
+
+    def test_chunk_length_and_model_change_invalidate(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+        manifest.update('doc.txt', file, 400, MODEL_NAME)
+
+        assert not manifest.is_fresh('doc.txt', file, 200, MODEL_NAME)
+        assert not manifest.is_fresh('doc.txt', file, 400, 'other-model')
+
+    def test_chunking_options_change_invalidate(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+        manifest.update('doc.txt', file, 400, MODEL_NAME)
+
+        assert manifest.is_fresh('doc.txt', file, 400, MODEL_NAME)
+        assert not manifest.is_fresh('doc.txt', file, 400, MODEL_NAME, {'chunk_overlap': 150})
+
+    def test_save_keeps_entries_saved_by_others(self, tmp_path):
+        for name in ("a.txt", "b.txt"):
+            (tmp_path / name).write_text(name, encoding='utf-8')
+        # оба объекта загружены до сохранений друг друга
+        first, second = IndexManifest(str(tmp_path)), IndexManifest(str(tmp_path))
+        first.update('a.txt', tmp_path / "a.txt", 400, MODEL_NAME)
+        first.save()
+        second.update('b.txt', tmp_path / "b.txt", 400, MODEL_NAME)
+        second.save()
+
+        assert set(IndexManifest(str(tmp_path)).entries) == {'a.txt', 'b.txt'}
+        assert set(second.entries) == {'a.txt', 'b.txt'}
+
+        first.remove('a.txt')
+        first.save()
+        assert set(IndexManifest(str(tmp_path)).entries) == {'b.txt'}
+
+    def test_update_skips_file_changed_since_read(self, tmp_path):
+        file = tmp_path / "doc.txt"
+        file.write_text("text", encoding='utf-8')
+        manifest = IndexManifest(str(tmp_path))
+        before = IndexManifest.file_stat(file)
+        file.write_text("longer text", encoding='utf-8')
+
+        assert not manifest.update('doc.txt', file, 400, MODEL_NAME, expected_stat=before)
+        assert 'doc.txt' not in manifest.entries
+        assert manifest.update('doc.txt', file, 400, MODEL_NAME, expected_stat=IndexManifest.file_stat(file))
+
+    def test_corrupted_manifest_is_empty(self, tmp_path):
+        (tmp_path / IndexManifest.FILE_NAME).write_text("{not json", encoding='utf-8')
+        assert IndexManifest(str(tmp_path)).entries == {}
+
+
+class TestIncrementalIndexing:
+
+    def test_unchanged_files_are_not_reindexed(self, tmp_path, app_data_dir, fake_embedding_function,
+                                               plain_lemmatization):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки любят спать. Кошки ловят мышей.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом.", encoding='utf-8')
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            first = RelevantDocumentsSearch(folder, 'кошки ловят', chunk_length=50).find_documents()
+            with patch('src.text_extration.read_text') as mock_read:
+                second = RelevantDocumentsSearch(folder, 'кошки ловят', chunk_length=50).find_documents()
+                mock_read.assert_not_called()
+
+            (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+            search = RelevantDocumentsSearch(folder, 'кошки ловят', chunk_length=50)
+            with patch.object(search, 'index_document', wraps=search.index_document) as mock_index:
+                third = search.find_documents()
+                assert mock_index.call_count == 1
+
+        assert first == second == third
+        assert first[0].name == 'cats.txt'
+
+    @pytest.mark.parametrize('shared_collection', [False, True])
+    def test_file_edited_during_indexing_is_reindexed(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                      plain_lemmatization, shared_collection):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки любят спать.", encoding='utf-8')
+
+        def edit_while_chunking(segments, *args):
+            # файл меняется после того, как его текст уже прочитан для индексации
+            segments = list(segments)
+            (folder / "cats.txt").write_text("Кошки любят спать. Кошки ловят мышей.", encoding='utf-8')
+            return chunk_pages_by_sentence(segments, *args)
+
+        counts = []
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            for chunker in (edit_while_chunking, chunk_pages_by_sentence, chunk_pages_by_sentence):
+                search = RelevantDocumentsSearch(folder, 'кошки', chunk_length=30, shared_collection=shared_collection)
+                with patch('src.document_search.chunk_pages_by_sentence', chunker):
+                    search.find_documents()
+                counts.append((search.metrics.counts['files_indexed'],
+                               search.metrics.counts.get('changed_during_indexing', 0)))
+
+        assert counts == [(1, 1), (1, 0), (0, 0)]
+
+    def test_chunking_options_are_part_of_index_identity(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                         plain_lemmatization):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки любят спать. Кошки ловят мышей.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом.", encoding='utf-8')
+
+        counts = []
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            for shared_collection in (False, True):
+                for options in ({}, {'chunk_overlap': 15}, {'max_sentence_length': 20}, {}):
+                    search = RelevantDocumentsSearch(folder, 'кошки', chunk_length=30,
+                                                     shared_collection=shared_collection, **options)
+                    search.find_documents()
+                    counts.append(search.metrics.counts['files_indexed'])
+
+        # у каждой общей коллекции свои параметры, коллекции документов переиндексируются при смене параметров
+        assert counts == [2, 2, 2, 2, 2, 2, 2, 0]
@@ -0,0 +1,163 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.document_search import RelevantDocumentsSearch, SearchCancelled
+from src.indexing_pipeline import IndexingPipeline, MemoryBudget, text_size
+
+
+def fake_embed(texts):
+    return [[float(len(text))] for text in texts]
+
+
+class RecordingCollection:
+    """ Коллекция в памяти; upsert можно замедлить, чтобы запись отставала от чтения """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        time.sleep(self.delay)
+        with self.lock:
+            for chunk_id, document in zip(ids, documents):
+                self.rows[chunk_id] = document
+
+
+def make_documents(count, length):
+    return [(f'doc{i}.txt', [(None, chr(ord('a') + i) * length)]) for i in range(count)]
+
+
+def split_job(collection, written, piece=1000):
+    def make_job(relative_path, segments):
+        text = ''.join(text for _, text in segments)
+        pieces = [text[start:start + piece] for start in range(0, len(text), piece)]
+        for x, chunk in enumerate(pieces):
+            yield collection, f'{relative_path}#{x}', chunk, {'path': relative_path}
+
+        def on_written():
+            # callback документа вызывается только после записи всех его чанков
+            assert all(f'{relative_path}#{x}' in collection.rows for x in range(len(pieces)))
+            written.append(relative_path)
+        return on_written
+    return make_job
+
+
+class TestMemoryBudget:
+
+    def test_acquire_waits_for_release(self):
+        budget = MemoryBudget(100)
+        budget.acquire(80)
+        threading.Timer(0.2, budget.release, args=(80,)).start()
+        start = time.perf_counter()
+        budget.acquire(50)
+
+        assert time.perf_counter() - start >= 0.15
+        assert budget.used == 50 and budget.peak == 80 and budget.waits == 1
+
+    def test_oversized_item_passes_when_empty(self):
+        budget = MemoryBudget(10)
+        budget.acquire(1000)
+
+        assert budget.used == 1000
+
+
+class TestIndexingPipeline:
+
+    def test_writes_every_chunk_with_parallel_stages(self):
+        collection, written = RecordingCollection(), []
+        pipeline = IndexingPipeline(fake_embed, batch_chunks=4, normalizer_workers=3, embedder_workers=2)
+        seen = []
+
+        done = pipeline.run(make_documents(20, 3500), split_job(collection, written),
+                            on_document=lambda path, seconds: seen.append(path))
+
+        assert done == 20
+        assert len(collection.rows) == 20 * 4
+        assert sorted(written) == sorted(seen) == sorted(f'doc{i}.txt' for i in range(20))
+        assert pipeline.chunks_embedded == 80
+        assert pipeline.budget.used == 0
+        assert 'memory peak' in pipeline.report()
+
+    def test_memory_budget_applies_backpressure(self):
+        documents = make_documents(12, 20_000)
+        largest = max(text_size(text) for _, segments in documents for _, text in segments)
+        budget = 3 * largest
+        pipeline = IndexingPipeline(fake_embed, batch_chunks=5, memory_budget=budget, queue_size=100)
+
+        pipeline.run(documents, split_job(RecordingCollection(delay=0.02), []))
+
+        # без бюджета извлечение прочитало бы все 12 документов, пока запись обрабатывает первые пачки
+        assert pipeline.budget.waits > 0
+        assert pipeline.budget.peak <= budget + 2 * largest
+        assert pipeline.budget.used == 0
+
+    def test_stage_error_is_raised(self):
+        def make_job(relative_path, segments):
+            if relative_path == 'doc3.txt':
+                raise ValueError('broken document')
+            yield from split_job(RecordingCollection(), [])(relative_path, segments)
+
+        with pytest.raises(ValueError, match='broken document'):
+            IndexingPipeline(fake_embed).run(make_documents(10, 100), make_job)
+
+    def test_cancel_stops_pipeline(self):
+        cancel_event = threading.Event()
+        pipeline = IndexingPipeline(fake_embed, batch_chunks=1, queue_size=1)
+
+        done = pipeline.run(make_documents(50, 2000), split_job(RecordingCollection(delay=0.01), []), cancel_event,
+                            lambda path, seconds: cancel_event.set())
+
+        assert done == 1
+
+
+class TestPipelineIndexing:
+
+    @pytest.mark.parametrize('shared_collection', [False, True])
+    def test_matches_sequential_indexing(self, tmp_path, app_data_dir, monkeypatch, fake_embedding_function,
+                                         plain_lemmatization, shared_collection):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        topics = ["кошки ловят мышей", "собаки охраняют дом", "птицы поют по утрам", "рыбы плавают в реке"]
+        for i, topic in enumerate(topics * 3):
+            # номер документа в тексте, чтобы у разных документов не было одинаковых расстояний
+            (folder / f"{i}.txt").write_text(f"{topic.capitalize()} {i}. " * (i + 1), encoding='utf-8')
+
+        def search(**options):
+            return RelevantDocumentsSearch(folder, 'птицы поют', chunk_length=60, results_count=3,
+                                           shared_collection=shared_collection, use_embedding_cache=False,
+                                           **options)
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            pipelined = search(pipeline=True, normalizer_workers=2, embedder_workers=2, memory_budget=1024)
+            progress = []
+            result = pipelined.find_documents(lambda done, total, ranking: progress.append(done))
+            (folder / "6.txt").write_text("Кошки спят на диване.", encoding='utf-8')
+            updated = search(pipeline=True)
+            updated_result = updated.find_documents()
+            # то же самое последовательной индексацией в пустом хранилище
+            monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / "sequential"))
+            sequential = search().find_documents()
+
+        assert pipelined.metrics.counts['files_indexed'] == 12
+        assert progress[:12] == list(range(1, 13))
+        assert pipelined.metrics.counts['memory_peak_bytes'] > 0
+        assert updated.metrics.counts['files_indexed'] == 1
+        assert updated_result == sequential
+        assert '6.txt' in [p.name for p in result] and '6.txt' not in [p.name for p in updated_result]
+
+    def test_cancel_raises(self, tmp_path, app_data_dir, fake_embedding_function, plain_lemmatization):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        for i in range(5):
+            (folder / f"{i}.txt").write_text("Кошки ловят мышей.", encoding='utf-8')
+        cancel_event = threading.Event()
+        cancel_event.set()
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            with pytest.raises(SearchCancelled):
+                RelevantDocumentsSearch(folder, 'кошки', shared_collection=True,
+                                        pipeline=True).find_documents(cancel_event=cancel_event)
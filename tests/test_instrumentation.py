@@ -0,0 +1,112 @@
+import json
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+
+from src.document_search import RelevantDocumentsSearch, SearchCancelled
+from src.instrumentation import SearchMetrics, add_hook, remove_hook, publish, prometheus_file_hook, json_log_hook
+
+
+class TestSearchMetrics:
+
+    def test_stage_and_timed_iter_accumulate(self):
+        metrics = SearchMetrics()
+        with metrics.stage('walk'):
+            pass
+        with metrics.stage('walk'):
+            pass
+        items = list(metrics.timed_iter('extraction', iter([1, 2, 3])))
+        metrics.count('chunks', 2)
+        metrics.count('chunks')
+
+        assert items == [1, 2, 3]
+        assert set(metrics.stages) == {'walk', 'extraction'}
+        assert metrics.counts == {'chunks': 3}
+
+    def test_outliers_sorted_by_time(self):
+        metrics = SearchMetrics()
+        for path, seconds in [('a.txt', 0.1), ('b.pdf', 2.0), ('c.docx', 0.5), ('a.txt', 0.3)]:
+            metrics.add_file_time(path, seconds)
+
+        assert metrics.outliers(2) == [('b.pdf', 2.0), ('c.docx', 0.5)]
+        assert metrics.file_seconds['a.txt'] == pytest.approx(0.4)
+
+    def test_prometheus_and_json_export(self, tmp_path):
+        metrics = SearchMetrics('/docs', 'кошки')
+        metrics.add_time('query', 0.25)
+        metrics.count('files', 3)
+        metrics.add_file_time('dir/"quoted".txt', 1.5)
+        metrics.finish()
+        path = tmp_path / "search.prom"
+
+        prometheus_file_hook(str(path))(metrics)
+        text = path.read_text(encoding='utf-8')
+        record = json.loads(metrics.to_json_line())
+
+        assert 'docsearch_stage_seconds{stage="query"} 0.250000' in text
+        assert 'docsearch_items{kind="files"} 3' in text
+        assert 'docsearch_slowest_file_seconds{path="dir/\\"quoted\\".txt"} 1.500000' in text
+        assert record['request'] == 'кошки' and record['status'] == 'ok'
+        assert record['outliers'][0]['path'] == 'dir/"quoted".txt'
+
+    def test_failing_hook_does_not_break_others(self):
+        received = Mock()
+        publish(SearchMetrics(), [Mock(side_effect=RuntimeError('boom')), received])
+
+        received.assert_called_once()
+
+    def test_json_log_hook(self):
+        target = Mock()
+        json_log_hook(target)(SearchMetrics(request='q'))
+
+        assert json.loads(target.log.call_args.args[1])['request'] == 'q'
+
+
+class TestInstrumentedSearch:
+
+    def make_folder(self, tmp_path):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+        return folder
+
+    @pytest.mark.parametrize('shared', [False, True])
+    def test_find_documents_reports_stages(self, tmp_path, app_data_dir, fake_embedding_function,
+                                           plain_lemmatization, shared):
+        folder = self.make_folder(tmp_path)
+        received = []
+        global_hook = Mock()
+        add_hook(global_hook)
+        try:
+            with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+                search = RelevantDocumentsSearch(folder, 'собаки', chunk_length=20, shared_collection=shared,
+                                                 metrics_hooks=[received.append])
+                search.find_documents()
+        finally:
+            remove_hook(global_hook)
+
+        metrics = received[0]
+        global_hook.assert_called_once_with(metrics)
+        assert metrics.status == 'ok'
+        assert {'walk', 'extraction', 'chunking', 'normalization', 'embedding', 'upsert',
+                'query_embedding', 'query'} <= set(metrics.stages)
+        assert metrics.counts['files'] == metrics.counts['files_indexed'] == 2
+        assert metrics.counts['chunks'] == 4
+        assert metrics.counts['tokens'] == 10
+        assert metrics.counts['bytes'] == sum(p.stat().st_size for p in folder.iterdir())
+        assert {path for path, _ in metrics.outliers()} == {'cats.txt', 'dogs.txt'}
+
+    def test_cancelled_search_is_reported(self, tmp_path, app_data_dir, fake_embedding_function,
+                                          plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        cancel_event = threading.Event()
+        cancel_event.set()
+        received = []
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'собаки', metrics_hooks=[received.append])
+            with pytest.raises(SearchCancelled):
+                search.find_documents(cancel_event=cancel_event)
+
+        assert received[0].status == 'cancelled'
@@ -0,0 +1,95 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.chunk_processing import rerank_candidates
+from src.document_search import RelevantDocumentsSearch
+from src.flat_index import FlatVectorIndex
+from src.inverted_index import InvertedIndex
+
+
+class TestInvertedIndex:
+
+    def make_index(self, tmp_path):
+        index = InvertedIndex(tmp_path / "bm25.sqlite3")
+        index.add_chunk('a#0', 'a.txt', 'кошка ловить мышь'.split())
+        index.add_chunk('a#1', 'a.txt', 'кошка спать'.split())
+        index.add_chunk('b#0', 'b.txt', 'собака охранять дом собака лаять'.split())
+        return index
+
+    def test_rare_terms_rank_higher(self, tmp_path):
+        index = self.make_index(tmp_path)
+        candidates = index.search(['собака', 'мышь'], limit=10)
+
+        assert [chunk_id for chunk_id, _, _ in candidates] == ['b#0', 'a#0']
+        assert candidates[0][1] == 'b.txt'
+        assert index.search(['жираф'], limit=10) == []
+
+    def test_limit_and_allowed_paths(self, tmp_path):
+        index = self.make_index(tmp_path)
+
+        assert len(index.search(['кошка'], limit=1)) == 1
+        assert index.search(['кошка', 'собака'], limit=10, allowed_paths={'b.txt'})[0][0] == 'b#0'
+        assert all(path == 'b.txt' for _, path, _ in index.search(['кошка', 'собака'], 10, {'b.txt'}))
+
+    def test_delete_path_and_persistence(self, tmp_path):
+        index = self.make_index(tmp_path)
+        index.delete_path('a.txt')
+        index.close()
+
+        reopened = InvertedIndex(tmp_path / "bm25.sqlite3")
+        assert reopened.chunk_count() == 1
+        assert reopened.search(['кошка'], limit=10) == []
+        reopened.close()
+
+
+class TestLexicalRetrieval:
+
+    def make_folder(self, tmp_path):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки ловят мышей и спят днём", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом и громко лают", encoding='utf-8')
+        (folder / "birds.txt").write_text("Птицы летают и поют утром", encoding='utf-8')
+        return folder
+
+    @pytest.mark.parametrize('retrieval', ['bm25', 'hybrid'])
+    def test_candidates_are_reranked(self, tmp_path, app_data_dir, fake_embedding_function,
+                                     plain_lemmatization, retrieval):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'собаки лают', chunk_length=100, retrieval=retrieval)
+            result = search.find_documents()
+            index = InvertedIndex(search.inverted_index_path())
+
+        assert search.shared_collection
+        assert result[0].name == 'dogs.txt'
+        assert len(result) == 1  # остальные документы не содержат термов запроса
+        assert index.chunk_count() == 3
+        index.close()
+
+    @pytest.mark.parametrize('hybrid_alpha, expected', [(1.0, [1.0, 0.5, 0.0]), (0.0, [0.0, 0.5, 1.0]),
+                                                        (0.5, [0.5, 0.5, 0.5])])
+    def test_hybrid_scores_are_min_max_normalized(self, tmp_path, hybrid_alpha, expected):
+        collection = FlatVectorIndex(tmp_path / "flat", 'docs')
+        # близость к запросу убывает от a к c, BM25 растёт от a к c
+        collection.upsert(['a#0', 'b#0', 'c#0'], [[1.0, 0.0], [0.5, 0.866], [0.0, 1.0]],
+                          [{'path': 'a'}, {'path': 'b'}, {'path': 'c'}])
+        candidates = [('a#0', 'a', 2.0), ('b#0', 'b', 4.0), ('c#0', 'c', 6.0)]
+
+        distances = rerank_candidates(collection, candidates, np.array([1.0, 0.0]), hybrid_alpha)
+
+        assert [distances[path] for path in 'abc'] == pytest.approx(expected, abs=0.05)
+
+    def test_falls_back_to_dense_without_term_matches(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                      plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            result = RelevantDocumentsSearch(folder, 'жирафы', chunk_length=100, retrieval='bm25').find_documents()
+
+        assert len(result) == 3
+
+    def test_unknown_retrieval_mode(self, tmp_path, app_data_dir):
+        with pytest.raises(ValueError):
+            RelevantDocumentsSearch(tmp_path, 'запрос', retrieval='sparse')
@@ -0,0 +1,109 @@
+from unittest.mock import patch
+
+from src.document_search import RelevantDocumentsSearch
+from src.maintenance import compact
+
+
+class TestGarbageCollection:
+
+    def make_folder(self, tmp_path):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят. Кошки едят. Кошки играют.",
+                                         encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+        return folder
+
+    def test_shrunk_document_loses_tail_chunks(self, tmp_path, app_data_dir, fake_embedding_function,
+                                               plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'кошки', chunk_length=20)
+            search.find_documents()
+            (folder / "cats.txt").write_text("Кошки спят.", encoding='utf-8')
+            search.find_documents()
+            collection = search.client.get_collection(search.collection_name('cats.txt'))
+
+        assert collection.get(include=[])['ids'] == ['0']
+        assert search.metrics.counts['stale_chunks_deleted'] == 3
+
+    def test_deleted_and_renamed_files_drop_collections(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                        plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'собаки', chunk_length=20)
+            search.find_documents()
+            (folder / "dogs.txt").rename(folder / "hounds.txt")
+            result = search.find_documents()
+            names = {c.name for c in search.client.list_collections()}
+
+        assert [p.name for p in result][0] == 'hounds.txt'
+        assert names == {'cats.txt', 'hounds.txt'}
+        assert 'dogs.txt' not in search.manifest.entries
+        assert search.metrics.counts['collections_dropped'] == 1
+
+    def test_other_folders_are_left_alone(self, tmp_path, app_data_dir, fake_embedding_function,
+                                          plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        other = tmp_path / "other"
+        other.mkdir()
+        (other / "birds.txt").write_text("Птицы поют.", encoding='utf-8')
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            RelevantDocumentsSearch(other, 'птицы', chunk_length=20).find_documents()
+            search = RelevantDocumentsSearch(folder, 'кошки', chunk_length=20)
+            search.find_documents()
+
+        assert 'birds.txt' in {c.name for c in search.client.list_collections()}
+
+    def test_nested_folders_keep_each_others_collections(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                         plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        (folder / "extra").mkdir()
+        (folder / "extra" / "birds.txt").write_text("Птицы поют.", encoding='utf-8')
+        searches = []
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            for path in (folder / "extra", folder, folder / "extra", folder):
+                search = RelevantDocumentsSearch(path, 'птицы', chunk_length=20)
+                search.find_documents()
+                searches.append(search)
+
+        assert [s.metrics.counts['files_indexed'] for s in searches] == [1, 3, 0, 0]
+        assert all(s.metrics.counts['collections_dropped'] == 0 for s in searches)
+
+    def test_excluded_file_drops_its_collection(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            RelevantDocumentsSearch(folder, 'кошки', chunk_length=20).find_documents()
+            search = RelevantDocumentsSearch(folder, 'кошки', chunk_length=20, exclude_patterns=['dogs.txt'])
+            search.find_documents()
+
+        assert search.metrics.counts['collections_dropped'] == 1
+        assert 'dogs.txt' not in search.manifest.entries
+
+    def test_compact_reports_reclaimed_space(self, tmp_path, app_data_dir, fake_embedding_function,
+                                             plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            per_document = RelevantDocumentsSearch(folder, 'кошки', chunk_length=20)
+            per_document.find_documents()
+            shared = RelevantDocumentsSearch(folder, 'кошки', chunk_length=20, retrieval='hybrid')
+            shared.find_documents()
+            RelevantDocumentsSearch(folder, 'кошки', chunk_length=30, vector_backend='flat').find_documents()
+            per_document.client.get_or_create_collection('orphan_collection')
+            (app_data_dir / "folder_0000000000000000_400.bm25.sqlite3").write_bytes(b'')
+            (folder / "cats.txt").unlink()
+
+            preview = compact(str(app_data_dir), dry_run=True)
+            report = compact(str(app_data_dir))
+            again = compact(str(app_data_dir))
+            chunks = shared.client.get_collection(shared.folder_collection_name()).get(include=['metadatas'])
+
+        # cats.txt: коллекция документа, документ в общей коллекции и в плоском индексе; плюс сирота
+        assert (preview['collections_dropped'], preview['documents_dropped'], preview['files_removed']) == (2, 2, 1)
+        assert (report['collections_dropped'], report['documents_dropped'], report['files_removed']) == (2, 2, 1)
+        assert (again['collections_dropped'], again['documents_dropped'], again['files_removed']) == (0, 0, 0)
+        assert 'chroma.sqlite3' in report['vacuumed']
+        assert report['reclaimed_bytes'] == report['bytes_before'] - report['bytes_after']
+        assert {m['path'] for m in chunks['metadatas']} == {'dogs.txt'}
+        assert 'orphan_collection' not in {c.name for c in shared.client.list_collections()}
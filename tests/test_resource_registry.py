@@ -0,0 +1,56 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src import resource_registry
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    resource_registry.clear()
+    yield
+    resource_registry.clear()
+
+
+class TestResourceRegistry:
+
+    def test_client_is_shared_per_path(self, tmp_path):
+        first = resource_registry.get_client(tmp_path / "db")
+        second = resource_registry.get_client(str(tmp_path / "db"))
+
+        assert first is second
+
+    def test_model_is_loaded_once_across_threads(self):
+        loads = []
+
+        def slow_model(model_name):
+            time.sleep(0.05)
+            loads.append(model_name)
+            return object()
+
+        with patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction', side_effect=slow_model):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(resource_registry.get_embedding_function()))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert loads == [resource_registry.MODEL_NAME]
+        assert len({id(result) for result in results}) == 1
+
+    def test_registered_embedding_function_is_used(self, fake_embedding_function):
+        resource_registry.register_embedding_function(fake_embedding_function)
+        assert resource_registry.get_embedding_function() is fake_embedding_function
+
+    def test_app_startup_does_not_import_chromadb(self):
+        code = "import sys, src.main; print('chromadb' in sys.modules, 'sentence_transformers' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).parent.parent,
+                                capture_output=True, text=True, check=True).stdout
+        assert output.split() == ['False', 'False']
@@ -0,0 +1,141 @@
+import os
+import threading
+from unittest.mock import patch
+
+from src.document_search import RelevantDocumentsSearch
+from src.result_cache import ResultCache, folder_fingerprint
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache:
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_size=2)
+        cache.put('a', ['a.txt'])
+        cache.put('b', ['b.txt'])
+        cache.get('a')
+        cache.put('c', ['c.txt'])
+
+        assert cache.get('a') == ['a.txt']
+        assert cache.get('b') is None
+        assert cache.get('c') == ['c.txt']
+
+    def test_ttl_expiry(self):
+        clock = FakeClock()
+        cache = ResultCache(ttl=10, clock=clock)
+        cache.put('a', ['a.txt'])
+        clock.now += 9
+
+        assert cache.get('a') == ['a.txt']
+        clock.now += 1
+        assert cache.get('a') is None
+        assert cache.hits == 1 and cache.misses == 1
+
+    def test_persistence_skips_expired_entries(self, tmp_path):
+        clock = FakeClock()
+        path = str(tmp_path / "cache.json")
+        cache = ResultCache(ttl=10, persist_path=path, clock=clock)
+        cache.put('old', ['old.txt'])
+        clock.now += 5
+        cache.put('new', ['new.txt'])
+        clock.now += 6
+
+        restored = ResultCache(ttl=10, persist_path=path, clock=clock)
+        assert restored.get('old') is None
+        assert restored.get('new') == ['new.txt']
+
+    def test_corrupted_file_is_ignored(self, tmp_path):
+        path = tmp_path / "cache.json"
+        path.write_text("{not json", encoding='utf-8')
+
+        assert ResultCache(persist_path=str(path)).get('a') is None
+
+    def test_concurrent_puts_keep_file_valid(self, tmp_path):
+        path = str(tmp_path / "cache.json")
+        cache = ResultCache(persist_path=path)
+        errors = []
+
+        def put(thread):
+            try:
+                for i in range(50):
+                    cache.put(f'{thread}-{i}', [f'{i}.txt'])
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=put, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(ResultCache(persist_path=path).items) == 200
+        assert os.listdir(tmp_path) == ["cache.json"]
+
+    def test_folder_fingerprint_tracks_changes(self, tmp_path):
+        (tmp_path / "a.txt").write_text("один", encoding='utf-8')
+        paths = [tmp_path / "a.txt"]
+        original = folder_fingerprint(paths, tmp_path)
+
+        assert folder_fingerprint(paths, tmp_path) == original
+        (tmp_path / "a.txt").write_text("один два", encoding='utf-8')
+        modified = folder_fingerprint(paths, tmp_path)
+        assert modified != original
+        stat = os.stat(tmp_path / "a.txt")
+        os.utime(tmp_path / "a.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        assert folder_fingerprint(paths, tmp_path) != modified
+        (tmp_path / "b.txt").write_text("два", encoding='utf-8')
+        assert folder_fingerprint(paths + [tmp_path / "b.txt"], tmp_path) != modified
+
+
+class TestCachedSearch:
+
+    def test_repeated_search_hits_cache_until_folder_changes(self, tmp_path, app_data_dir,
+                                                             fake_embedding_function, plain_lemmatization):
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        (folder / "cats.txt").write_text("Кошки ловят мышей.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки лают.", encoding='utf-8')
+        cache = ResultCache()
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            first = RelevantDocumentsSearch(folder, 'Собаки', chunk_length=20, result_cache=cache).find_documents()
+            with patch('src.document_search.find_best_chunk') as find_best_chunk:
+                progress = []
+                second = RelevantDocumentsSearch(folder, 'собаки', chunk_length=20, result_cache=cache) \
+                    .find_documents(lambda *args: progress.append(args))
+            assert not find_best_chunk.called
+            (folder / "birds.txt").write_text("Птицы поют.", encoding='utf-8')
+            third = RelevantDocumentsSearch(folder, 'собаки', chunk_length=20, result_cache=cache).find_documents()
+
+        assert first == second
+        assert progress == [(1, 1, second)]
+        assert cache.hits == 1
+        assert len(third) == 3
+
+    def test_chunking_options_change_the_key(self, tmp_path, app_data_dir, plain_lemmatization):
+        paths = [tmp_path / "a.txt"]
+        paths[0].write_text("A", encoding='utf-8')
+
+        keys = {RelevantDocumentsSearch(tmp_path, 'запрос', chunk_length=20, **options).result_cache_key(paths)
+                for options in ({}, {'chunk_overlap': 5}, {'max_sentence_length': 10})}
+
+        assert len(keys) == 3
+
+    def test_ranking_options_change_the_key(self, tmp_path, app_data_dir, plain_lemmatization):
+        paths = [tmp_path / "a.txt"]
+        paths[0].write_text("A", encoding='utf-8')
+        variants = ({}, {'hybrid_alpha': 0.8}, {'candidate_budget': 50}, {'top_chunks': 7},
+                    {'max_pdf_pages': 3}, {'max_pdf_bytes': 1000}, {'flat_dtype': 'float16'})
+
+        keys = {RelevantDocumentsSearch(tmp_path, 'запрос', retrieval='hybrid', **options).result_cache_key(paths)
+                for options in variants}
+
+        assert len(keys) == len(variants)
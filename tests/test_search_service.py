@@ -0,0 +1,118 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+
+from src.search_service import PooledHTTPServer, SearchService
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят.", encoding='utf-8')
+    (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+    return folder
+
+
+@pytest.fixture
+def start_server(app_data_dir, fake_embedding_function, plain_lemmatization):
+    servers = []
+    with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+        def start(folder, workers=4, queue_size=8, **options):
+            service = SearchService(folder, chunk_length=20, **options)
+            service.warm_up()
+            server = PooledHTTPServer(('127.0.0.1', 0), service, workers, queue_size)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            return server, f'http://127.0.0.1:{server.server_address[1]}'
+        yield start
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+def request(url, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+class TestSearchService:
+
+    def test_search_get_and_post(self, folder, start_server):
+        _, base = start_server(folder)
+
+        status, body = request(f'{base}/search?q=%D1%81%D0%BE%D0%B1%D0%B0%D0%BA%D0%B8')
+        assert status == 200
+        assert body['results'][0]['path'] == 'dogs.txt'
+
+        status, body = request(f'{base}/search', {'query': 'кошки спят', 'limit': 1})
+        assert status == 200
+        assert [r['path'] for r in body['results']] == ['cats.txt']
+
+    def test_reindex_picks_up_new_files(self, folder, start_server):
+        _, base = start_server(folder)
+        (folder / "birds.txt").write_text("Птицы летают. Птицы поют.", encoding='utf-8')
+
+        assert request(f'{base}/search', {'query': 'птицы'})[1]['results'][0]['path'] != 'birds.txt'
+        status, summary = request(f'{base}/reindex', {})
+        assert status == 200 and summary == {**summary, 'documents': 3, 'indexed': 1}
+        assert request(f'{base}/search', {'query': 'птицы'})[1]['results'][0]['path'] == 'birds.txt'
+        assert request(f'{base}/health')[1]['documents'] == 3
+
+    def test_bad_requests(self, folder, start_server):
+        _, base = start_server(folder)
+
+        assert request(f'{base}/search?q=')[0] == 400
+        assert request(f'{base}/search', {'limit': 2})[0] == 400
+        assert request(f'{base}/search', ['not', 'an', 'object'])[0] == 400
+        assert request(f'{base}/unknown')[0] == 404
+
+    def test_concurrent_searches(self, folder, start_server):
+        _, base = start_server(folder, workers=4, queue_size=16, retrieval='hybrid')
+        results = []
+
+        def search(query):
+            results.append(request(f'{base}/search', {'query': query}))
+
+        threads = [threading.Thread(target=search, args=(q,)) for q in ['кошки', 'собаки'] * 8]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 16
+        assert all(status == 200 for status, _ in results)
+        assert request(f'{base}/health')[1]['searches'] == 16
+
+    def test_full_queue_is_rejected(self, folder, start_server):
+        server, base = start_server(folder, workers=1, queue_size=0)
+        release = threading.Event()
+        started = threading.Event()
+        original_search = server.service.search
+
+        def slow_search(query, limit=None):
+            started.set()
+            release.wait(10)
+            return original_search(query, limit)
+
+        server.service.search = slow_search
+        blocked = []
+        thread = threading.Thread(target=lambda: blocked.append(request(f'{base}/search', {'query': 'кошки'})))
+        thread.start()
+        assert started.wait(10)
+        try:
+            with pytest.raises(urllib.error.HTTPError) as rejected:
+                urllib.request.urlopen(f'{base}/health', timeout=10)
+            assert rejected.value.code == 503
+        finally:
+            release.set()
+            thread.join()
+        assert blocked[0][0] == 200
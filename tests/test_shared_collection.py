@@ -0,0 +1,70 @@
+from unittest.mock import patch
+
+from src.document_search import RelevantDocumentsSearch
+
+
+class TestSharedCollection:
+
+    def make_folder(self, tmp_path):
+        folder = tmp_path / "docs"
+        (folder / "extra").mkdir(parents=True)
+        (folder / "cats.txt").write_text("Кошки ловят мышей. Кошки спят.", encoding='utf-8')
+        (folder / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают.", encoding='utf-8')
+        (folder / "extra" / "birds.txt").write_text("Птицы летают. Птицы поют.", encoding='utf-8')
+        return folder
+
+    def test_ranking_matches_per_document_mode(self, tmp_path, app_data_dir, fake_embedding_function,
+                                               plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            per_document = RelevantDocumentsSearch(folder, 'птицы поют', chunk_length=20).find_documents()
+            shared_search = RelevantDocumentsSearch(folder, 'птицы поют', chunk_length=20, shared_collection=True)
+            shared = shared_search.find_documents()
+            collections = [c.name for c in shared_search.client.list_collections()]
+
+        assert shared == per_document
+        assert shared[0].as_posix() == 'extra/birds.txt'
+        assert shared_search.folder_collection_name() in collections
+
+    def test_one_collection_and_one_query(self, tmp_path, app_data_dir, fake_embedding_function,
+                                          plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'собаки', chunk_length=20, shared_collection=True)
+            search.find_documents()
+            calls_before = fake_embedding_function.calls
+            result = search.find_documents()
+
+        assert len(search.client.list_collections()) == 1
+        assert fake_embedding_function.calls == calls_before  # эмбеддинг запроса взят из LRU-кэша
+        assert result[0].name == 'dogs.txt'
+
+    def test_deleted_and_shrunk_documents_disappear(self, tmp_path, app_data_dir, fake_embedding_function,
+                                                    plain_lemmatization):
+        folder = self.make_folder(tmp_path)
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'птицы', chunk_length=20, shared_collection=True)
+            search.find_documents()
+            (folder / "extra" / "birds.txt").unlink()
+            (folder / "cats.txt").write_text("Кошки.", encoding='utf-8')
+            result = search.find_documents()
+            collection = search.client.get_collection(search.folder_collection_name())
+            cat_chunks = collection.get(where={'path': 'cats.txt'})['ids']
+
+        assert all(p.name != 'birds.txt' for p in result)
+        assert cat_chunks == ['cats.txt#0']
+
+    def test_pdf_chunks_have_page_metadata(self, tmp_path, app_data_dir, fake_embedding_function,
+                                           plain_lemmatization):
+        from benchmarks.corpus import write_pdf
+        folder = tmp_path / "docs"
+        folder.mkdir()
+        write_pdf(folder / "book.pdf", [f"Sentence number {i}." for i in range(6)], lines_per_page=2)
+
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            search = RelevantDocumentsSearch(folder, 'sentence', chunk_length=30, shared_collection=True)
+            search.find_documents()
+            metadatas = search.client.get_collection(search.folder_collection_name()).get()['metadatas']
+
+        assert {metadata['page'] for metadata in metadatas} == {1, 2, 3}
+        assert all(metadata['page_end'] >= metadata['page'] for metadata in metadatas)
@@ -0,0 +1,109 @@
+import json
+import shutil
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from src.document_search import RelevantDocumentsSearch
+from src.snapshot import export_snapshot, import_snapshot, remap_path
+
+
+def make_folder(root):
+    root.mkdir()
+    (root / "sub").mkdir()
+    (root / "cats.txt").write_text("Кошки ловят мышей. Кошки спят на диване.", encoding='utf-8')
+    (root / "dogs.txt").write_text("Собаки охраняют дом. Собаки лают на почтальона.", encoding='utf-8')
+    (root / "sub" / "birds.txt").write_text("Птицы поют по утрам. Птицы вьют гнёзда.", encoding='utf-8')
+    return root
+
+
+class TestSnapshot:
+
+    def test_remap_path(self):
+        assert remap_path('sub/a.txt', [('sub', 'nested/deep')]) == 'nested/deep/a.txt'
+        assert remap_path('suburb/a.txt', [('sub', 'nested')]) == 'suburb/a.txt'
+        assert remap_path('a.txt', [('', 'docs')]) == 'docs/a.txt'
+        assert remap_path('sub/a.txt', [('sub', '')]) == 'a.txt'
+
+    @pytest.mark.parametrize('backend, retrieval', [('chroma', 'dense'), ('flat', 'hybrid')])
+    def test_round_trip_reindexes_only_changed_files(self, tmp_path, app_data_dir, monkeypatch, backend, retrieval,
+                                                     fake_embedding_function, plain_lemmatization):
+        source = make_folder(tmp_path / "source")
+        bundle = tmp_path / "index.docsearch"
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            original = RelevantDocumentsSearch(source, 'птицы поют', chunk_length=30, shared_collection=True,
+                                               retrieval=retrieval, vector_backend=backend,
+                                               use_embedding_cache=False).find_documents()
+            exported = export_snapshot(source, bundle, chunk_length=30, vector_backend=backend)
+
+            # другая машина: пустое хранилище, папка в другом месте, подпапка переименована, один файл изменён
+            monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / "other_appdata"))
+            target = tmp_path / "target"
+            shutil.copytree(source, target)
+            (target / "sub").rename(target / "nested")
+            (target / "dogs.txt").write_text("Собаки охраняют дом. Собаки спят.", encoding='utf-8')
+            report = import_snapshot(bundle, target, path_map=[('sub', 'nested')])
+
+            search = RelevantDocumentsSearch(target, 'птицы поют', chunk_length=30, shared_collection=True,
+                                             retrieval=retrieval, vector_backend=backend)
+            calls_before = fake_embedding_function.embedded_texts
+            result = search.find_documents()
+
+        assert exported['files'] == 3 and exported['chunks'] > 3
+        assert report == dict(report, files=3, imported=2, changed=1, missing=0)
+        assert search.metrics.counts['files_indexed'] == 1
+        # первый чанк dogs.txt не изменился, его эмбеддинг взят из кэша, заполненного при импорте
+        if backend == 'chroma':
+            assert report['cached_embeddings'] == exported['chunks']
+            # эмбеддинг запроса уже в кэше запросов, считается только новый второй чанк dogs.txt
+            assert fake_embedding_function.embedded_texts - calls_before == 1
+        assert [p.as_posix() for p in result][0] == 'nested/birds.txt'
+        assert [p.name for p in result][0] == original[0].name
+
+    def test_round_trip_of_per_document_collections(self, tmp_path, app_data_dir, monkeypatch,
+                                                    fake_embedding_function, plain_lemmatization):
+        source = make_folder(tmp_path / "source")
+        bundle = tmp_path / "index.docsearch"
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            # режим приложения по умолчанию: по коллекции на документ
+            RelevantDocumentsSearch(source, 'птицы поют', chunk_length=30).find_documents()
+            exported = export_snapshot(source, bundle, chunk_length=30, shared_collection=False)
+            with zipfile.ZipFile(bundle) as archive:
+                header = json.loads(archive.read('snapshot.json'))
+
+            monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / "other_appdata"))
+            target = tmp_path / "target"
+            shutil.copytree(source, target)
+            (target / "sub").rename(target / "nested")
+            (target / "dogs.txt").write_text("Собаки охраняют дом. Собаки спят.", encoding='utf-8')
+            report = import_snapshot(bundle, target, path_map=[('sub', 'nested')])
+
+            search = RelevantDocumentsSearch(target, 'птицы поют', chunk_length=30)
+            result = search.find_documents()
+
+        assert header['layout'] == 'documents' and set(header['files']) == {'cats.txt', 'dogs.txt', 'sub/birds.txt'}
+        assert exported['chunks'] > 3
+        assert report == dict(report, files=3, imported=2, changed=1, missing=0, chunks=exported['chunks'] - 2)
+        assert search.metrics.counts['files_indexed'] == 1
+        assert [p.as_posix() for p in result][0] == 'nested/birds.txt'
+
+    def test_rejects_bundle_of_another_model(self, tmp_path, app_data_dir, fake_embedding_function,
+                                             plain_lemmatization):
+        source = make_folder(tmp_path / "source")
+        bundle = tmp_path / "index.docsearch"
+        with patch('src.document_search.get_embedding_function', return_value=fake_embedding_function):
+            RelevantDocumentsSearch(source, 'кошки', chunk_length=30, shared_collection=True).find_documents()
+            export_snapshot(source, bundle, chunk_length=30, dtype='float16')
+            with zipfile.ZipFile(bundle) as archive:
+                header = json.loads(archive.read('snapshot.json'))
+            assert (header['chunk_overlap'], header['max_sentence_length']) == (0, 60)
+            assert header['dtype'] == 'float16' and set(header['files']) == {'cats.txt', 'dogs.txt', 'sub/birds.txt'}
+
+            header['model'] = 'other-model'
+            other = tmp_path / "other.docsearch"
+            with zipfile.ZipFile(bundle) as archive, zipfile.ZipFile(other, 'w') as copy:
+                for name in archive.namelist():
+                    copy.writestr(name, json.dumps(header) if name == 'snapshot.json' else archive.read(name))
+            with pytest.raises(ValueError, match='other-model'):
+                import_snapshot(other, source)
@@ -1,7 +1,7 @@
 import pytest
 from pathlib import Path
 # from unittest.mock import patch, mock_open, MagicMock
-from src.text_extration import TextExtraction
+from src.text_extration import TextExtraction, iter_pdf_pages, iter_text_windows, read_segments
 
 class TestTextExtraction:
     
@@ -121,4 +121,129 @@ class TestTextExtraction:
         result = extractor.extract()
         
         assert len(result) == 0
-        assert result == {}
\ No newline at end of file
+        assert result == {}
+
+    def test_iter_texts_parallel_matches_sequential(self, tmp_path):
+        """Test that the process pool yields the same texts as sequential reading"""
+        (tmp_path / "sub").mkdir()
+        for i in range(10):
+            (tmp_path / "sub" / f"file{i}.txt").write_text(f"Content {i}", encoding='utf-8')
+
+        extractor = TextExtraction(str(tmp_path))
+        extractor.get_paths(tmp_path)
+        sequential = dict(extractor.iter_texts())
+        parallel = dict(extractor.iter_texts(workers=2, batch_size=3))
+
+        assert parallel == sequential
+        assert len(parallel) == 10
+
+    def test_parallel_mode_streams_text_files(self, tmp_path):
+        """Test that text files are read lazily in this process even with a process pool"""
+        for i in range(3):
+            (tmp_path / f"file{i}.txt").write_text(f"Content {i}", encoding='utf-8')
+
+        extractor = TextExtraction(str(tmp_path))
+        extractor.get_paths(tmp_path)
+        documents = list(extractor.iter_segments(workers=2, batch_size=1))
+
+        assert len(documents) == 3
+        assert not any(isinstance(segments, list) for _, segments in documents)
+        assert sorted(''.join(text for _, text in segments) for _, segments in documents) == \
+            [f"Content {i}" for i in range(3)]
+
+    def test_iter_texts_isolates_errors(self, tmp_path):
+        """Test that an unreadable file is reported and does not stop extraction"""
+        (tmp_path / "good.txt").write_text("Good", encoding='utf-8')
+        (tmp_path / "bad.txt").write_bytes(b"\x00\x01\x02 binary")
+
+        extractor = TextExtraction(str(tmp_path))
+        extractor.get_paths(tmp_path)
+        result = dict(extractor.iter_texts(workers=2, batch_size=1))
+
+        assert result == {Path("good.txt"): "Good"}
+        assert Path("bad.txt") in extractor.errors
+
+    def test_size_cap_skips_only_documents_read_whole(self, tmp_path):
+        """Test that streamed text files are indexed above max_file_bytes"""
+        (tmp_path / "server.log").write_text("line\n" * 100, encoding='utf-8')
+        (tmp_path / "report.docx").write_bytes(b"x" * 1000)
+
+        extractor = TextExtraction(str(tmp_path), max_file_bytes=100)
+        extractor.get_paths(tmp_path)
+
+        assert extractor.full_paths == [tmp_path / "server.log"]
+        assert extractor.skipped == {'too_large': 1}
+
+    def test_iter_documents_is_lazy(self, tmp_path):
+        """Test that iter_documents reads files one at a time"""
+        for i in range(3):
+            (tmp_path / f"file{i}.txt").write_text(f"Content {i}", encoding='utf-8')
+
+        extractor = TextExtraction(str(tmp_path))
+        documents = extractor.iter_documents()
+        first_path, first_text = next(documents)
+
+        assert first_text == f"Content {first_path.stem[-1]}"
+        assert extractor.texts == {}
+        assert len(list(documents)) == 2
+
+    def test_extract_matches_iter_documents(self, tmp_path):
+        """Test that extract is a wrapper over iter_documents and can be called twice"""
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "a.txt").write_text("A", encoding='utf-8')
+        (tmp_path / "sub" / "b.md").write_text("B", encoding='utf-8')
+
+        extractor = TextExtraction(str(tmp_path))
+        first = extractor.extract()
+        second = extractor.extract()
+
+        assert first == second == dict(TextExtraction(str(tmp_path)).iter_documents())
+        assert len(extractor.full_paths) == 2
+
+    def test_pdf_pages_are_streamed_with_numbers(self, tmp_path):
+        """Test that PDF pages are read one by one with page numbers"""
+        from benchmarks.corpus import write_pdf
+        write_pdf(tmp_path / "book.pdf", [f"Sentence {i}." for i in range(9)], lines_per_page=3)
+
+        pages = list(iter_pdf_pages(tmp_path / "book.pdf", max_pages=None, max_bytes=None))
+
+        assert [number for number, _ in pages] == [1, 2, 3]
+        assert "Sentence 4." in pages[1][1]
+
+    def test_pdf_page_and_byte_limits(self, tmp_path):
+        """Test that max_pages and max_bytes stop reading a large PDF"""
+        from benchmarks.corpus import write_pdf
+        write_pdf(tmp_path / "book.pdf", [f"Sentence {i}." for i in range(30)], lines_per_page=3)
+
+        assert len(list(iter_pdf_pages(tmp_path / "book.pdf", max_pages=4, max_bytes=None))) == 4
+        assert len(list(iter_pdf_pages(tmp_path / "book.pdf", max_pages=None, max_bytes=60))) < 10
+
+        extractor = TextExtraction(str(tmp_path), max_pdf_pages=2)
+        text = extractor.extract()[Path("book.pdf")]
+        assert "Sentence 5." in text and "Sentence 6." not in text
+
+    def test_text_windows_match_whole_file(self, tmp_path):
+        """Test that windowed decoding splits neither multibyte characters nor CRLF"""
+        text = "Привет, мир.\r\nLine two.\r\n" * 50
+        (tmp_path / "big.log").write_bytes(text.encode('utf-8'))
+
+        windows = list(iter_text_windows(tmp_path / "big.log", window_bytes=7))
+
+        assert len(windows) > 1
+        assert ''.join(windows) == text.replace('\r\n', '\n')
+
+    def test_non_utf8_text_falls_back_to_cp1251(self, tmp_path):
+        """Test that a legacy Windows-1251 file is decoded instead of failing"""
+        (tmp_path / "old.txt").write_bytes("Старый документ".encode('cp1251'))
+        (tmp_path / "bom.txt").write_bytes("Текст с BOM".encode('utf-16'))
+
+        result = TextExtraction(str(tmp_path)).extract()
+
+        assert result == {Path("old.txt"): "Старый документ", Path("bom.txt"): "Текст с BOM"}
+
+    def test_binary_text_file_is_rejected_on_open(self, tmp_path):
+        """Test that binary content is detected before any text is yielded"""
+        (tmp_path / "data.txt").write_bytes(b"\x00" * 16)
+
+        with pytest.raises(ValueError):
+            read_segments(tmp_path / "data.txt")
@@ -0,0 +1,52 @@
+from unittest.mock import Mock, patch
+
+from nltk import SnowballStemmer
+
+from src.text_normalizer import TextNormalizer
+
+
+class TestTextNormalizer:
+
+    def test_russian_token_is_stemmed(self):
+        normalizer = TextNormalizer()
+        assert normalizer.normalize_token('кошками') == SnowballStemmer('russian').stem('кошками')
+
+    def test_wordnet_is_loaded_in_constructor(self):
+        # new= задан явно: patch по умолчанию разглядывает исходный объект, а это загрузило бы корпус
+        with patch('src.text_normalizer.wordnet', new=Mock()) as wordnet:
+            TextNormalizer()
+            wordnet.ensure_loaded.assert_called_once_with()
+            # без данных nltk нормализатор всё равно создаётся
+            wordnet.ensure_loaded.side_effect = LookupError('wordnet')
+            TextNormalizer()
+
+    def test_token_results_are_cached(self):
+        normalizer = TextNormalizer(cache_size=10)
+        for _ in range(3):
+            normalizer.normalize_token('собаками')
+
+        info = normalizer.cache_info()
+        assert info.hits == 2
+        assert info.misses == 1
+
+    def test_cache_is_bounded(self):
+        normalizer = TextNormalizer(cache_size=2)
+        for word in ('кошка', 'собака', 'птица'):
+            normalizer.normalize_token(word)
+
+        assert normalizer.cache_info().currsize == 2
+
+    def test_normalize_removes_punctuation(self):
+        normalizer = TextNormalizer()
+        normalizer.en_lemmatizer = Mock(lemmatize=lambda token: token)
+        with patch('src.text_normalizer.word_tokenize', side_effect=lambda text: text.replace('!', ' !').split()):
+            result = normalizer.normalize('Кошки ловят мышей!')
+
+        stemmer = SnowballStemmer('russian')
+        assert result == ' '.join(stemmer.stem(word) for word in ('Кошки', 'ловят', 'мышей')) + ' '
+
+    def test_normalize_many_matches_normalize(self):
+        normalizer = TextNormalizer()
+        texts = ['Кошки спят', 'Собаки лают', 'Кошки спят']
+        with patch('src.text_normalizer.word_tokenize', side_effect=str.split):
+            assert normalizer.normalize_many(texts) == [normalizer.normalize(text) for text in texts]
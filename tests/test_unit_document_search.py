@@ -1,21 +1,24 @@
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from pathlib import Path
-from src.document_search import RelevantDocumentsSearch
+import threading
+from src.document_search import RelevantDocumentsSearch, QueryEmbeddingCache, SearchCancelled, query_embedding_cache
 
 @pytest.fixture
 def mock_chroma_client():
-    with patch('src.document_search.chromadb.PersistentClient') as mock:
+    with patch('src.document_search.get_client') as mock, \
+            patch('src.document_search.get_embedding_function'):
         yield mock
 
 
 @pytest.fixture
-def search_instance(mock_chroma_client):
+def search_instance(mock_chroma_client, app_data_dir):
     return RelevantDocumentsSearch(
         current_folder_path='/test/folder',
         request='test query',
         chunk_length=400,
-        results_count=5
+        results_count=5,
+        use_embedding_cache=False
     )
 
 
@@ -54,16 +57,111 @@ class TestRelevantDocumentsSearch:
         assert len(result) == 5
     
     @patch('src.document_search.TextExtraction')
-    @patch('src.document_search.chunk_text_by_sentence')
+    @patch('src.document_search.chunk_pages_by_sentence')
     @patch('src.document_search.find_best_chunk')
     def test_find_documents(self, mock_find_chunk, mock_chunk_text, mock_text_ext, search_instance):
-        mock_text_ext.return_value.extract.return_value = {'/doc1.txt': 'text1', '/doc2.txt': 'text2'}
-        mock_chunk_text.return_value = ['chunk1', 'chunk2']
+        mock_text_ext.return_value.full_paths = [Path('/test/folder/doc1.txt'), Path('/test/folder/doc2.txt')]
+        mock_text_ext.return_value.iter_segments.return_value = [
+            (Path('doc1.txt'), [(None, 'text1')]), (Path('doc2.txt'), [(None, 'text2')])]
+        mock_chunk_text.return_value = [('chunk1', None, None), ('chunk2', None, None)]
         mock_find_chunk.return_value = ('best_chunk', 0.5)
         
         search_instance.client.get_or_create_collection.return_value = MagicMock()
         
-        with patch.object(search_instance, 'extract_rel_doc_paths', return_value=['/doc1.txt']):
+        with patch.object(search_instance.manifest, 'is_fresh', return_value=False), \
+                patch.object(search_instance.manifest, 'update'), \
+                patch.object(search_instance, 'extract_rel_doc_paths', return_value=['/doc1.txt']):
             result = search_instance.find_documents()
         
-        assert result == ['/doc1.txt']
\ No newline at end of file
+        assert result == ['/doc1.txt']
+        mock_text_ext.return_value.iter_segments.assert_called_once_with(mock_text_ext.return_value.full_paths, None)
+        assert mock_chunk_text.call_count == 2
+        assert mock_find_chunk.call_count == 2
+
+    @patch('src.document_search.TextExtraction')
+    @patch('src.document_search.find_best_chunk')
+    def test_find_documents_skips_fresh_files(self, mock_find_chunk, mock_text_ext, search_instance):
+        mock_text_ext.return_value.full_paths = [Path('/test/folder/doc1.txt')]
+        mock_find_chunk.return_value = ('best_chunk', 0.5)
+        search_instance.client.get_or_create_collection.return_value.count.return_value = 3
+        
+        with patch.object(search_instance.manifest, 'is_fresh', return_value=True):
+            result = search_instance.find_documents()
+        
+        assert result == [Path('doc1.txt')]
+        mock_text_ext.return_value.iter_segments.assert_called_once_with([], None)
+
+    def test_embed_query_is_cached(self, search_instance):
+        query_embedding_cache.clear()
+        search_instance.embedding_function.return_value = [[0.1, 0.2]]
+
+        with patch('src.document_search.TextExtraction.lemmatization_and_punct_clean', return_value='cleaned') as mock_lem:
+            first = search_instance.embed_query()
+            second = search_instance.embed_query()
+
+        assert first == second == [0.1, 0.2]
+        assert mock_lem.call_count == 2
+        search_instance.embedding_function.assert_called_once_with(['cleaned'])
+
+    @patch('src.document_search.TextExtraction')
+    @patch('src.document_search.find_best_chunk')
+    def test_find_documents_embeds_query_once(self, mock_find_chunk, mock_text_ext, search_instance):
+        mock_text_ext.return_value.full_paths = [Path(f'/test/folder/doc{i}.txt') for i in range(3)]
+        mock_find_chunk.return_value = ('best_chunk', 0.5)
+        search_instance.client.get_or_create_collection.return_value.count.return_value = 1
+
+        with patch.object(search_instance.manifest, 'is_fresh', return_value=True), \
+                patch.object(search_instance, 'embed_query', return_value=[0.3]) as mock_embed:
+            search_instance.find_documents()
+
+        mock_embed.assert_called_once()
+        assert all(c.args[2] == [0.3] for c in mock_find_chunk.call_args_list)
+
+    @patch('src.document_search.TextExtraction')
+    @patch('src.document_search.find_best_chunk')
+    def test_find_documents_reports_progress(self, mock_find_chunk, mock_text_ext, search_instance):
+        mock_text_ext.return_value.full_paths = [Path('/test/folder/doc1.txt'), Path('/test/folder/doc2.txt')]
+        mock_text_ext.return_value.iter_segments.return_value = [(Path('doc2.txt'), [(None, 'text2')])]
+        mock_find_chunk.side_effect = [('chunk', 0.7), ('chunk', 0.2)]
+        search_instance.client.get_or_create_collection.return_value.count.return_value = 1
+        progress = []
+
+        with patch.object(search_instance.manifest, 'is_fresh', side_effect=[True, False]), \
+                patch.object(search_instance.manifest, 'update'), \
+                patch.object(search_instance, 'embed_query', return_value=[0.3]):
+            result = search_instance.find_documents(lambda *args: progress.append(args))
+
+        assert progress == [
+            (1, 3, None),
+            (2, 3, [Path('doc1.txt')]),
+            (3, 3, [Path('doc2.txt'), Path('doc1.txt')]),
+        ]
+        assert result == [Path('doc2.txt'), Path('doc1.txt')]
+
+    @patch('src.document_search.TextExtraction')
+    @patch('src.document_search.find_best_chunk')
+    def test_find_documents_can_be_cancelled(self, mock_find_chunk, mock_text_ext, search_instance):
+        mock_text_ext.return_value.full_paths = [Path(f'/test/folder/doc{i}.txt') for i in range(3)]
+        mock_find_chunk.return_value = ('chunk', 0.5)
+        search_instance.client.get_or_create_collection.return_value.count.return_value = 1
+        cancel_event = threading.Event()
+
+        with patch.object(search_instance.manifest, 'is_fresh', return_value=True), \
+                patch.object(search_instance, 'embed_query', return_value=[0.3]), \
+                pytest.raises(SearchCancelled):
+            search_instance.find_documents(lambda done, total, ranking: cancel_event.set(), cancel_event)
+
+        assert mock_find_chunk.call_count == 1
+
+
+class TestQueryEmbeddingCache:
+
+    def test_evicts_least_recently_used(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        cache.get_or_compute('a', lambda: 1)
+        cache.get_or_compute('b', lambda: 2)
+        cache.get_or_compute('a', lambda: 0)
+        cache.get_or_compute('c', lambda: 3)
+
+        assert list(cache.items) == ['a', 'c']
+        assert cache.get_or_compute('a', lambda: 0) == 1